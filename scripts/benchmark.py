@@ -0,0 +1,259 @@
+"""
+Benchmarks the annotation pipeline offline, with the `fake` LLM backend, on synthetic ontologies and tables of
+growing size.
+
+Timed stages: importing the main modules in a fresh interpreter, building the ontology DAG (from the RDF file and
+from its snapshot), `dataframe_to_markdown`, the streaming column profiler on a table of 100 rows per ontology class,
+`llm_decision_making`, `ensemble_decision_making`, `bfs_search` and the path and node level metrics of `eval.py`.
+The timings are written to JSON together with the commit, so that runs of different commits can be compared:
+
+    python scripts/benchmark.py --sizes 100 1000 5000 --output outputs/benchmarks/new.json
+    python scripts/benchmark.py --compare outputs/benchmarks/old.json outputs/benchmarks/new.json
+"""
+import os
+import os.path as osp
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+import pandas as pd
+from omegaconf import OmegaConf
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.join(here, "..")
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.onto import OntologyDAG
+from saed.ensemble import DecisionMaker
+from saed.data import profile_file
+from saed.utils import dataframe_to_markdown, bfs_search, path_level_f1_precision_recall, node_level_f1_precision_recall
+
+RDF_HEADER = """<?xml version="1.0"?>
+<rdf:RDF xmlns="{base}#"
+     xml:base="{base}"
+     xmlns:owl="http://www.w3.org/2002/07/owl#"
+     xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+     xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">
+    <owl:Ontology rdf:about="{base}"/>
+    <owl:Class rdf:about="http://www.w3.org/2002/07/owl#Thing"/>
+"""
+WORDS = ["Energy", "Power", "Meter", "Sensor", "Building", "Room", "Temperature", "Consumption", "Device",
+         "Measurement", "Unit", "Zone", "Heating", "Cooling", "Lighting", "Storage", "Grid", "Tariff"]
+
+
+def write_synthetic_rdf(path: str, num_classes: int, branching: int = None, seed: int = 0):
+    """
+    Writes an ontology of `num_classes` classes as a tree with `branching` children per class, in which every
+    tenth class has a second parent, so that the DAG has shared descendants. By default the tree is about
+    three levels deep, so the number of candidates per level grows with the ontology.
+    """
+    if branching is None:
+        branching = max(8, round(num_classes ** (1 / 3)))
+    rng = random.Random(seed)
+    base = f"http://example.org/saed-benchmark-{num_classes}"
+    lines = [RDF_HEADER.format(base=base)]
+    for i in range(num_classes):
+        name = f"{rng.choice(WORDS)}{rng.choice(WORDS)}{i}"
+        parents = ["http://www.w3.org/2002/07/owl#Thing"]
+        if i >= branching:
+            parents = []
+            parent = (i - branching) // branching
+            parents.append(f"{base}#C{parent}")
+            if i % 10 == 0 and parent > 0:
+                parents.append(f"{base}#C{rng.randrange(parent)}")
+        lines.append(f'    <owl:Class rdf:about="{base}#C{i}">')
+        for parent in parents:
+            lines.append(f'        <rdfs:subClassOf rdf:resource="{parent}"/>')
+        lines.append(f'        <rdfs:label>{name}</rdfs:label>')
+        lines.append(f'        <rdfs:comment>The {name.lower()} of a building.</rdfs:comment>')
+        lines.append('    </owl:Class>')
+    lines.append('</rdf:RDF>\n')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+
+
+def synthetic_table(num_rows: int, num_columns: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    columns = {}
+    for j in range(num_columns):
+        kind = j % 4
+        if kind == 0:
+            columns[f"timestamp_{j}"] = pd.date_range("2024-01-01", periods=num_rows, freq="15min").astype(str)
+        elif kind == 1:
+            columns[f"kWh_{j}"] = [round(rng.uniform(0, 100), 3) for _ in range(num_rows)]
+        elif kind == 2:
+            columns[f"meter_id_{j}"] = [rng.randrange(1000) for _ in range(num_rows)]
+        else:
+            columns[f"room_{j}"] = [rng.choice(WORDS) for _ in range(num_rows)]
+    return pd.DataFrame(columns)
+
+
+def benchmark_config(rdf_path: str, mode: str, snapshot_dir=None):
+    return OmegaConf.create({
+        "data": {"ontology": {"path": rdf_path, "snapshot_dir": snapshot_dir}},
+        "llms": {"name": "fake", "model": "fake", "temperature": 0.0, "seed": 0, "latency_s": 0.0,
+                 "cache": {"enabled": False}},
+        "experiments": {"mode": mode, "k": 5, "max_depth": 3, "avg_classes_per_agent": 30,
+                        "avg_agents_per_class": 3, "consensus_threshold_ratio": 0.8, "max_concurrency": 1},
+    })
+
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        # The pipeline prints its progress, which is not part of the measurement
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    return {"repeat": repeat, "min_s": min(timings), "median_s": statistics.median(timings), "mean_s": statistics.mean(timings)}
+
+
+IMPORTED_MODULES = ["saed.utils.metrics", "saed.utils", "saed.onto", "saed.ensemble", "saed.eval", "saed.run"]
+
+
+def import_times(modules, repeat: int) -> dict:
+    """
+    The time to import each module in a fresh interpreter, as short-lived jobs pay it on every start.
+    The start-up time of the interpreter itself is measured alone and subtracted.
+    """
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=root_path, check=True, capture_output=True,
+                       env=dict(os.environ, PYTHONPATH=osp.join(root_path, "src")))
+        return time.perf_counter() - start
+
+    baseline = min(run("pass") for _ in range(repeat))
+    times = {}
+    for module in modules:
+        timings = [max(0.0, run(f"import {module}") - baseline) for _ in range(repeat)]
+        times[module] = {"repeat": repeat, "min_s": min(timings), "median_s": statistics.median(timings),
+                         "mean_s": statistics.mean(timings)}
+    return times
+
+
+def synthetic_eval_rows(ontology_dag, num_rows: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    names = [node.name for node in ontology_dag.nodes.values()]
+    rows = []
+    for _ in range(num_rows):
+        rows.append({
+            "pred_paths": [[rng.choice(names) for _ in range(rng.randint(1, 2))] for _ in range(rng.randint(0, 3))],
+            "gt_paths": [[rng.choice(names) for _ in range(rng.randint(1, 2))] for _ in range(rng.randint(1, 2))],
+        })
+    return rows
+
+
+def run_benchmarks(sizes, repeat: int, work_dir: str) -> list:
+    results = []
+
+    def add(benchmark, size, timing):
+        results.append({"benchmark": benchmark, "size": size, **timing})
+        print(f"{benchmark:<28} size={size:<7} median={timing['median_s'] * 1000:10.3f} ms")
+
+    for module, timing in import_times(IMPORTED_MODULES, repeat).items():
+        add(f"import {module}", 0, timing)
+
+    for size in sizes:
+        rdf_path = osp.join(work_dir, f"ontology_{size}.rdf")
+        write_synthetic_rdf(rdf_path, size)
+        snapshot_dir = osp.join(work_dir, "snapshots")
+
+        add("build_dag_rdf", size, measure(lambda: OntologyDAG(benchmark_config(rdf_path, "llm", None)).build_dag(), repeat))
+        OntologyDAG(benchmark_config(rdf_path, "llm", snapshot_dir)).build_dag()
+        add("build_dag_snapshot", size, measure(lambda: OntologyDAG(benchmark_config(rdf_path, "llm", snapshot_dir)).build_dag(), repeat))
+        ontology_dag = OntologyDAG(benchmark_config(rdf_path, "llm", snapshot_dir))
+        ontology_dag.build_dag()
+
+        table = synthetic_table(num_rows=1000, num_columns=min(200, size // 10 + 4))
+        table_in_markdown = dataframe_to_markdown(table, 5)
+        add("dataframe_to_markdown", size, measure(lambda: dataframe_to_markdown(table, 5), repeat))
+        table_path = osp.join(work_dir, f"table_{size}.csv")
+        synthetic_table(num_rows=size * 100, num_columns=8).to_csv(table_path, index=False)
+        add("profile_file", size, measure(lambda: profile_file(table_path, chunksize=100000), repeat))
+
+        root_id = ontology_dag.index.ids[ontology_dag.root]
+        classes = ontology_dag.index.candidate_names[root_id]
+        column_name = table.columns[1]
+        llm_decision_maker = DecisionMaker(benchmark_config(rdf_path, "llm", snapshot_dir))
+        edm_decision_maker = DecisionMaker(benchmark_config(rdf_path, "edm", snapshot_dir))
+        add("llm_decision_making", size, measure(
+            lambda: llm_decision_maker.llm_decision_making("benchmark", table_in_markdown, column_name, classes), repeat))
+        add("ensemble_decision_making", size, measure(
+            lambda: edm_decision_maker.ensemble_decision_making("benchmark", table_in_markdown, column_name, classes), repeat))
+        add("bfs_search", size, measure(
+            lambda: bfs_search("benchmark", table_in_markdown, column_name, ontology_dag, llm_decision_maker, 3), repeat))
+
+        rows = synthetic_eval_rows(ontology_dag, size)
+        add("eval_metrics", size, measure(
+            lambda: (path_level_f1_precision_recall(rows), node_level_f1_precision_recall(rows)), repeat))
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root_path, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> bool:
+    """
+    Prints the median timings of two benchmark files side by side. Returns False if any stage got slower than
+    `threshold` times its old median.
+    """
+    with open(old_path, encoding='utf-8') as f:
+        old = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"]}
+    with open(new_path, encoding='utf-8') as f:
+        new = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"]}
+    ok = True
+    for key in new:
+        if key not in old:
+            continue
+        ratio = new[key]["median_s"] / old[key]["median_s"] if old[key]["median_s"] > 0 else float("inf")
+        regression = ratio > threshold
+        ok = ok and not regression
+        print(f"{key[0]:<28} size={key[1]:<7} old={old[key]['median_s'] * 1000:10.3f} ms "
+              f"new={new[key]['median_s'] * 1000:10.3f} ms x{ratio:.2f}{'  REGRESSION' if regression else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="Numbers of ontology classes")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of every timed stage")
+    parser.add_argument("--output", default=osp.join(root_path, "outputs", "benchmarks", "benchmark.json"))
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two benchmark files instead of running")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(*args.compare, args.threshold) else 1)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(args.sizes, args.repeat, work_dir)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": args.sizes,
+        "results": results,
+    }
+    os.makedirs(osp.dirname(osp.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Runs the annotation of one dataset as several shards in parallel processes and merges their predictions.
+
+Every shard is a separate `run.py` process annotating the tables with `shard_of(table_id, num_shards) == shard_index`,
+so the shards can also be spread over machines: run a subset of them on each machine with `--shard-indices`, copy
+the `shard-*` result directories together and merge them with `src/saed/merge.py`. The Ollama hosts given with
+`--base-urls` are assigned to the shards round-robin. The arguments after `--` are passed to every process:
+
+    python scripts/launch_shards.py --num-shards 4 --processes 4 --base-urls http://gpu1:11434 http://gpu2:11434 -- experiments=llm llms=ollama
+"""
+import os
+import os.path as osp
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.data import shard_name
+
+
+def child_env() -> dict:
+    # The processes import saed from this checkout, whether or not it is installed
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (osp.join(root_path, "src"), os.environ.get("PYTHONPATH")) if p))
+
+
+def run_shard(shard_index: int, args, overrides: list, run_dir: str) -> int:
+    name = shard_name(shard_index, args.num_shards)
+    command = [sys.executable, osp.join(root_path, "src", "saed", "run.py"), *overrides,
+               f"experiments.num_shards={args.num_shards}", f"experiments.shard_index={shard_index}",
+               f"hydra.run.dir={osp.join(run_dir, name)}"]
+    if args.base_urls:
+        command.append(f"llms.base_url={args.base_urls[shard_index % len(args.base_urls)]}")
+    log_path = osp.join(run_dir, f"{name}.log")
+    for attempt in range(args.retries + 1):
+        start = time.perf_counter()
+        # A retry continues from the columns the failed attempt already saved
+        with open(log_path, "a", encoding="utf-8") as log:
+            returncode = subprocess.run(command + (["experiments.resume=true"] if attempt > 0 else []),
+                                        stdout=log, stderr=subprocess.STDOUT, cwd=root_path, env=child_env()).returncode
+        print(f"{name}: exit code {returncode} after {time.perf_counter() - start:.1f}s (attempt {attempt + 1}), log in {log_path}")
+        if returncode == 0:
+            break
+    return returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-shards", type=int, required=True, help="The number of shards of the dataset.")
+    parser.add_argument("--shard-indices", type=int, nargs="+", default=None, help="The shards to run on this machine. Defaults to all.")
+    parser.add_argument("--processes", type=int, default=None, help="The number of shards running at the same time. Defaults to one per shard.")
+    parser.add_argument("--base-urls", nargs="+", default=None, help="Ollama hosts assigned to the shards round-robin.")
+    parser.add_argument("--retries", type=int, default=1, help="How often a failed shard is resumed.")
+    parser.add_argument("--no-merge", action="store_true", help="Do not merge the shards, e.g. when other machines run the remaining shards.")
+    parser.add_argument("overrides", nargs="*", help="Hydra overrides passed to run.py and merge.py, after `--`.")
+    args = parser.parse_args()
+
+    shard_indices = args.shard_indices if args.shard_indices is not None else list(range(args.num_shards))
+    invalid = [shard_index for shard_index in shard_indices if not 0 <= shard_index < args.num_shards]
+    if invalid:
+        parser.error(f"Invalid shard indices {invalid} for {args.num_shards} shards")
+    run_dir = osp.join(root_path, "outputs", "shards", time.strftime("%Y-%m-%d_%H-%M-%S"))
+    os.makedirs(run_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.processes or len(shard_indices)) as executor:
+        returncodes = dict(zip(shard_indices, executor.map(lambda shard_index: run_shard(shard_index, args, args.overrides, run_dir), shard_indices)))
+    print(f"{len(shard_indices)} shards finished in {time.perf_counter() - start:.1f}s")
+    failed = [shard_index for shard_index, returncode in returncodes.items() if returncode != 0]
+    if failed:
+        print(f"Failed shards: {failed}")
+        sys.exit(1)
+
+    if not args.no_merge:
+        merge = [sys.executable, osp.join(root_path, "src", "saed", "merge.py"), *args.overrides,
+                 f"experiments.num_shards={args.num_shards}", f"hydra.run.dir={osp.join(run_dir, 'merge')}"]
+        sys.exit(subprocess.run(merge, cwd=root_path, env=child_env()).returncode)
+
+
+if __name__ == "__main__":
+    main()
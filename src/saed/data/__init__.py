@@ -1,11 +1,38 @@
-from saed.data.data import load_table_list, load_table, load_tables, load_labels
+import importlib
 
-__all__ = ['load_table_list', 'load_table', 'load_tables', 'load_labels']
+# The submodules are imported on first access, so that e.g. reading the predictions does not load pandas
+_exports = {
+    'load_table_list': 'saed.data.data',
+    'load_table': 'saed.data.data',
+    'load_tables': 'saed.data.data',
+    'load_labels': 'saed.data.data',
+    'PredictionStore': 'saed.data.store',
+    'iter_predictions': 'saed.data.store',
+    'TableProvider': 'saed.data.provider',
+    'shard_of': 'saed.data.shards',
+    'shard_name': 'saed.data.shards',
+    'shard_dirs': 'saed.data.shards',
+    'find_shard_dirs': 'saed.data.shards',
+    'merge_predictions': 'saed.data.shards',
+    'TableProfiler': 'saed.data.profile',
+    'profile_file': 'saed.data.profile',
+    'profile_to_markdown': 'saed.data.profile',
+}
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(_exports[name]), name)
+    raise AttributeError(f"module 'saed.data' has no attribute '{name}'")
+
+
+__all__ = list(_exports)
 
 if __name__ == '__main__':
     from omegaconf import DictConfig
+    from saed.data.data import load_table_list, load_tables
     config = DictConfig({'data': {'tables': {'path': 'data/tables'}, 'labels': {'path': 'data/labels'}}})
     df_table_list = load_table_list(config=config)
     dict_tables = load_tables(config=config)
     # df_labels = load_labels(config=config)
-    print(df_table_list.head())
\ No newline at end of file
+    print(df_table_list.head())
@@ -10,8 +10,11 @@ def load_table_list(config: DictConfig) -> pd.DataFrame:
     data = pd.read_csv(osp.join(root_path, config["data"]["tables"]["path"], 'table_list.csv'))
     return data
 
-def load_tables(config: DictConfig) -> dict:
+def load_tables(config: DictConfig, table_ids=None) -> dict:
     table_list = load_table_list(config=config)
+    if table_ids is not None:
+        # e.g. only the tables of one shard
+        table_list = table_list[table_list['table_id'].isin(set(table_ids))]
     tables = {}
     for table_id in table_list['table_id']:
         tables[table_id] = pd.read_csv(osp.join(root_path, config["data"]["tables"]["path"], table_id))
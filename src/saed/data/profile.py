@@ -0,0 +1,367 @@
+import os
+import os.path as osp
+import re
+import json
+import math
+import random
+import hashlib
+import tempfile
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+from omegaconf import DictConfig
+
+from saed.data.provider import PARQUET_EXTENSIONS, ARROW_EXTENSIONS
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.join(here, '..', '..', '..')
+
+PROFILE_VERSION = 2
+
+# Units recognized in column names (e.g. "power [kW]", "energy_kwh") and after numbers in the values (e.g. "21.5 °C")
+KNOWN_UNITS = {
+    'wh', 'kwh', 'mwh', 'gwh', 'w', 'kw', 'mw', 'gw', 'va', 'kva', 'var', 'kvar', 'v', 'kv', 'a', 'ma', 'hz',
+    'j', 'kj', 'mj', 'c', '°c', 'degc', 'f', '°f', 'k', '%', 'pa', 'hpa', 'kpa', 'bar', 'mbar', 'ppm', 'lux', 'lx',
+    'm', 'cm', 'mm', 'km', 'm2', 'm²', 'm3', 'm³', 'l', 'kg', 't', 's', 'ms', 'min', 'h', 'm/s', 'km/h', 'l/s', 'm3/h',
+    'w/m2', 'w/m²', 'kwh/m2', 'kwh/m²', 'eur', '€', 'usd', '$', 'co2', 'kgco2', 'db',
+}
+NAME_UNIT_PATTERN = re.compile(r"[\[(]\s*([^\])]+?)\s*[\])]\s*$|[_ ]([A-Za-z°%²³/0-9]+)$")
+NUMBER_PATTERN = r"^\s*([-+]?\d+(?:[.,]\d+)?(?:[eE][-+]?\d+)?)"
+VALUE_UNIT_PATTERN = re.compile(r"^\s*[-+]?\d+(?:[.,]\d+)?(?:[eE][-+]?\d+)?\s*([A-Za-z°%€$²³/][A-Za-z0-9°%€$²³/]*)\s*$")
+
+
+def detect_unit(column_name, values) -> str:
+    """
+    The unit of a column, from a suffix of its name or, if most sampled values are a number followed by the same
+    unit, from its values. None if no known unit is found.
+    """
+    if len(str(column_name)) > 1 and str(column_name).lower() in KNOWN_UNITS:
+        # e.g. a column "Wh"; single letters are too ambiguous
+        return str(column_name)
+    match = NAME_UNIT_PATTERN.search(str(column_name))
+    if match:
+        unit = match.group(1) or match.group(2)
+        if unit.lower() in KNOWN_UNITS and (match.group(1) or len(unit) > 1):
+            return unit
+    suffixes = Counter()
+    for value in values:
+        match = VALUE_UNIT_PATTERN.match(str(value))
+        if match and match.group(1).lower() in KNOWN_UNITS:
+            suffixes[match.group(1)] += 1
+    if suffixes:
+        unit, count = suffixes.most_common(1)[0]
+        if count * 2 > len(values):
+            return unit
+    return None
+
+
+def format_duration(seconds: float) -> str:
+    for unit, length in (("d", 86400), ("h", 3600), ("min", 60), ("s", 1)):
+        if seconds >= length and seconds % length == 0:
+            return f"{int(seconds // length)}{unit}"
+    return f"{seconds:g}s"
+
+
+class ColumnProfiler:
+    """
+    Profiles one column over the chunks of a table with bounded memory.
+
+    The type (numeric, datetime, bool or text) is taken from the dtype of typed columns (e.g. Parquet and Arrow
+    timestamps and booleans) or inferred from the first non-null values. Besides counts and the range of
+    the values, it keeps the `kmv_size` smallest hashes of the values to estimate the number of distinct values
+    (k minimum values sketch), a seeded reservoir sample of `sample_size` values (Algorithm L), and for datetime
+    columns the most frequent intervals between consecutive timestamps.
+    """
+
+    def __init__(self, name, sample_size: int = 10, kmv_size: int = 1024, seed: int = 0):
+        self.name = name
+        self.sample_size = sample_size
+        self.kmv_size = kmv_size
+        self.rng = random.Random(f"{seed}:{name}")
+        self.kind = None
+        self.datetime_format = None
+        self.with_unit = False
+        self.count = 0
+        self.nulls = 0
+        self.invalid = 0
+        self.min = None
+        self.max = None
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.sample = []
+        self.seen = 0  # Non-null values offered to the reservoir
+        self.next_replacement = None
+        self.weight = None
+        self.last_timestamp = None
+        self.intervals = Counter()
+
+    def infer_kind(self, values: pd.Series):
+        head = values.head(200)
+        # Typed columns first: timestamps and booleans would otherwise be converted to numbers
+        inferred = pd.api.types.infer_dtype(head, skipna=True)
+        if (pd.api.types.is_bool_dtype(values.dtype) or inferred == "boolean"
+                or head.astype(str).str.lower().isin(("true", "false")).all()):
+            self.kind = "bool"
+            return
+        if pd.api.types.is_datetime64_any_dtype(values.dtype) or inferred == "datetime64":
+            self.kind = "datetime"
+            return
+        if pd.to_numeric(head, errors='coerce').notna().mean() >= 0.9:
+            self.kind = "numeric"
+            return
+        if head.astype(str).str.match(VALUE_UNIT_PATTERN).mean() >= 0.9:
+            # Numbers followed by a unit, e.g. "21.5 °C"
+            self.kind = "numeric"
+            self.with_unit = True
+            return
+        self.datetime_format = guess_datetime_format(str(head.iloc[0]))
+        parsed = pd.to_datetime(head, errors='coerce', format=self.datetime_format or "mixed")
+        self.kind = "datetime" if parsed.notna().mean() >= 0.9 else "text"
+
+    def update(self, series: pd.Series):
+        self.count += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+        if self.kind is None:
+            self.infer_kind(values)
+        self.update_distinct(values)
+        self.update_sample(values)
+        if self.kind == "numeric":
+            if self.with_unit:
+                values = values.astype(str).str.extract(NUMBER_PATTERN, expand=False).str.replace(",", ".")
+            numbers = pd.to_numeric(values, errors='coerce').dropna()
+            self.invalid += len(values) - len(numbers)
+            self.update_range(numbers.min(), numbers.max(), len(numbers))
+        elif self.kind == "datetime":
+            if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                timestamps = values
+            else:
+                timestamps = pd.to_datetime(values, errors='coerce', format=self.datetime_format or "mixed").dropna()
+            self.invalid += len(values) - len(timestamps)
+            self.update_range(timestamps.min(), timestamps.max(), len(timestamps))
+            self.update_cadence(timestamps)
+        elif self.kind == "text":
+            lengths = values.astype(str).str.len()
+            self.update_range(lengths.min(), lengths.max(), len(lengths))
+
+    def update_range(self, low, high, n):
+        if n == 0:
+            return
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def update_distinct(self, values: pd.Series):
+        hashes = pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy(dtype=np.uint64)
+        if len(self.hashes) == self.kmv_size:
+            # Only hashes below the current k-th smallest can enter the sketch
+            hashes = hashes[hashes < self.hashes[-1]]
+        self.hashes = np.unique(np.concatenate([self.hashes, hashes]))[:self.kmv_size]
+
+    def update_sample(self, values: pd.Series):
+        if self.sample_size <= 0:
+            return
+        n = len(values)
+        start = 0
+        if self.seen < self.sample_size:
+            start = min(n, self.sample_size - self.seen)
+            self.sample.extend(str(v) for v in values.iloc[:start])
+            self.seen += start
+            if self.seen == self.sample_size:
+                self.weight = math.exp(math.log(self.rng.random()) / self.sample_size)
+                self.next_replacement = self.seen + self.skip()
+        if self.next_replacement is None:
+            return
+        end = self.seen + (n - start)
+        # Algorithm L: jump straight to the next value that replaces a random slot of the reservoir
+        while self.next_replacement < end:
+            self.sample[self.rng.randrange(self.sample_size)] = str(values.iloc[start + self.next_replacement - self.seen])
+            self.weight *= math.exp(math.log(self.rng.random()) / self.sample_size)
+            self.next_replacement += 1 + self.skip()
+        self.seen = end
+
+    def skip(self) -> int:
+        return int(math.log(self.rng.random()) / math.log(1 - self.weight))
+
+    def update_cadence(self, timestamps: pd.Series):
+        ns = timestamps.to_numpy(dtype="datetime64[ns]").astype("int64")
+        if self.last_timestamp is not None:
+            ns = np.concatenate([[self.last_timestamp], ns])
+        if len(ns):
+            self.last_timestamp = ns[-1]
+        diffs = np.diff(ns)
+        diffs = diffs[diffs > 0]
+        if len(diffs):
+            values, counts = np.unique(diffs, return_counts=True)
+            self.intervals.update(dict(zip(values.tolist(), counts.tolist())))
+            if len(self.intervals) > 1000:
+                # Irregular series: keep only the most frequent intervals
+                self.intervals = Counter(dict(self.intervals.most_common(100)))
+
+    def distinct(self) -> int:
+        if len(self.hashes) < self.kmv_size:
+            return len(self.hashes)
+        return int((self.kmv_size - 1) * 2.0 ** 64 / (float(self.hashes[-1]) + 1))
+
+    def result(self) -> dict:
+        cadence = None
+        if self.intervals:
+            interval, count = self.intervals.most_common(1)[0]
+            cadence = {"interval_s": interval / 1e9, "regularity": count / sum(self.intervals.values())}
+        low, high = self.min, self.max
+        if self.kind == "datetime" and low is not None:
+            low, high = str(low), str(high)
+        elif low is not None:
+            low, high = low.item() if hasattr(low, "item") else low, high.item() if hasattr(high, "item") else high
+        return {
+            "name": str(self.name),
+            "dtype": self.kind or "empty",
+            "count": self.count,
+            "null_ratio": self.nulls / self.count if self.count else 0.0,
+            "invalid": self.invalid,
+            # The range of the lengths for text columns
+            "min": low,
+            "max": high,
+            "distinct": self.distinct(),
+            "unit": detect_unit(self.name, self.sample),
+            "cadence": cadence,
+            "sample": self.sample,
+        }
+
+
+def iter_chunks(path: str, chunksize: int):
+    """
+    Reads a CSV, Parquet or Arrow file as a sequence of DataFrames of at most `chunksize` rows.
+    CSV values are read as strings, so that the type inferred for a column does not change from chunk to chunk.
+    """
+    extension = osp.splitext(path)[1].lower()
+    if extension in PARQUET_EXTENSIONS:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif extension in ARROW_EXTENSIONS:
+        import pyarrow as pa
+
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str)
+
+
+def profile_chunks(chunks, sample_size: int = 10, kmv_size: int = 1024, seed: int = 0) -> dict:
+    """
+    Profiles the columns of a table given as a sequence of DataFrames in one pass.
+
+    Returns:
+        dict: The number of rows and the profile of every column, in the order of the columns.
+    """
+    profilers = None
+    rows = 0
+    for chunk in chunks:
+        if profilers is None:
+            profilers = [ColumnProfiler(name, sample_size, kmv_size, seed) for name in chunk.columns]
+        for i, profiler in enumerate(profilers):
+            profiler.update(chunk.iloc[:, i])
+        rows += len(chunk)
+    return {"rows": rows, "columns": [profiler.result() for profiler in profilers or []]}
+
+
+def profile_file(path: str, chunksize: int = 100000, sample_size: int = 10, kmv_size: int = 1024, seed: int = 0) -> dict:
+    return profile_chunks(iter_chunks(path, chunksize), sample_size, kmv_size, seed)
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def profile_to_markdown(profile: dict, columns=None) -> str:
+    """
+    Renders the profiles of `columns` (by default all columns) as a compact markdown table, one row per column.
+    """
+    lines = ["| column | type | nulls | range | distinct | unit | cadence | examples |",
+             "| --- | --- | --- | --- | --- | --- | --- | --- |"]
+    for column in profile["columns"]:
+        if columns is not None and column["name"] not in columns:
+            continue
+        if column["min"] is None:
+            value_range = ""
+        elif column["dtype"] == "text":
+            value_range = f"length {column['min']}-{column['max']}"
+        else:
+            value_range = f"{format_value(column['min'])} to {format_value(column['max'])}"
+        cadence = ""
+        if column["cadence"] is not None:
+            if column["cadence"]["regularity"] >= 0.5:
+                cadence = f"{format_duration(column['cadence']['interval_s'])} ({column['cadence']['regularity']:.0%})"
+            else:
+                cadence = "irregular"
+        examples = ", ".join(sorted(set(column["sample"]))[:5]).replace("|", "\\|")
+        lines.append(f"| {column['name']} | {column['dtype']} | {column['null_ratio']:.0%} | {value_range} | "
+                     f"~{column['distinct']} | {column['unit'] or ''} | {cadence} | {examples} |")
+    return "\n".join(lines)
+
+
+class TableProfiler:
+    """
+    Profiles the files of a tables directory, caching every profile on disk next to the other caches.
+
+    A cached profile is keyed by the path, size and modification time of the file and by the profiling parameters,
+    so it is recomputed when the file changes. Profiles are also kept in memory for the run.
+    """
+
+    def __init__(self, config: DictConfig, cache_dir: str = "outputs/cache/profiles", chunksize: int = 100000,
+                 sample_size: int = 10, kmv_size: int = 1024, seed: int = 0):
+        """
+        Args:
+            config (DictConfig): The configuration with the `data.tables.path` directory.
+            cache_dir (str, optional): The directory of the cached profiles; None disables the cache.
+            chunksize (int): The number of rows read at a time.
+            sample_size (int): The number of sampled values per column.
+            kmv_size (int): The number of hashes kept to estimate the distinct values.
+            seed (int): The seed of the sampling.
+        """
+        self.tables_dir = osp.join(root_path, config["data"]["tables"]["path"])
+        self.cache_dir = osp.join(root_path, cache_dir) if cache_dir else None
+        self.chunksize = chunksize
+        self.params = {"sample_size": sample_size, "kmv_size": kmv_size, "seed": seed}
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def cache_path(self, path: str) -> str:
+        stat = os.stat(path)
+        key = json.dumps([PROFILE_VERSION, osp.abspath(path), stat.st_size, stat.st_mtime_ns, self.params])
+        name = osp.splitext(osp.basename(path))[0]
+        return osp.join(self.cache_dir, f"{name}.{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.json")
+
+    def get(self, table_id) -> dict:
+        with self._lock:
+            if table_id in self._profiles:
+                return self._profiles[table_id]
+        path = osp.join(self.tables_dir, table_id)
+        profile = None
+        cache_path = self.cache_path(path) if self.cache_dir else None
+        if cache_path is not None and osp.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    profile = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable profile {cache_path}: {e}")
+        if profile is None:
+            profile = profile_file(path, self.chunksize, **self.params)
+            if cache_path is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Write atomically, concurrent shards may profile the same table
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(profile, f)
+                os.replace(tmp_path, cache_path)
+        with self._lock:
+            return self._profiles.setdefault(table_id, profile)
@@ -0,0 +1,123 @@
+import os.path as osp
+import random
+import threading
+from collections import OrderedDict
+import pandas as pd
+from omegaconf import DictConfig
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.join(here, '..', '..', '..')
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+
+class TableProvider:
+    """
+    Loads tables lazily, on first access, instead of reading every table of `table_list.csv` up front.
+
+    Only the tables in `table_ids` (e.g. those referenced by the labels) can be loaded, only the first `nrows` rows
+    (or a random sample of the rows) are read, and at most `cache_size` tables are kept in memory in LRU order.
+    CSV, Parquet and Arrow/Feather files are supported; Parquet and Arrow files are read with column projection.
+    The provider can be used like the dict returned by `load_tables`; as only the first rows are read, the dtypes
+    inferred for CSV columns, and so the rendered prompts, may differ from those of `load_tables`.
+    """
+
+    def __init__(self, config: DictConfig, table_ids=None, nrows: int = None, sample_fraction: float = None,
+                 cache_size: int = 16, seed: int = 0):
+        """
+        Args:
+            config (DictConfig): The configuration with the `data.tables.path` directory.
+            table_ids (Iterable, optional): The tables that may be loaded. Defaults to every file in the directory.
+            nrows (int, optional): Read only the first `nrows` rows (of the sample, if sampling). None reads all rows.
+            sample_fraction (float, optional): Read a seeded random sample with this fraction of the rows.
+            cache_size (int): The number of tables kept in memory.
+            seed (int): The seed of the row sampling.
+        """
+        self.tables_dir = osp.join(root_path, config["data"]["tables"]["path"])
+        self.table_ids = None if table_ids is None else set(table_ids)
+        self.nrows = nrows
+        self.sample_fraction = sample_fraction
+        self.cache_size = cache_size
+        self.seed = seed
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, table_id) -> bool:
+        if self.table_ids is not None:
+            return table_id in self.table_ids
+        return osp.exists(osp.join(self.tables_dir, table_id))
+
+    def __getitem__(self, table_id) -> pd.DataFrame:
+        return self.get(table_id)
+
+    def get(self, table_id, columns=None) -> pd.DataFrame:
+        """
+        Returns the table `table_id`, restricted to `columns` if given.
+        """
+        if self.table_ids is not None and table_id not in self.table_ids:
+            raise KeyError(f"Table {table_id} is not referenced by the labels")
+        key = (table_id, None if columns is None else tuple(columns))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            table = self._read(table_id, columns)
+            self._cache[key] = table
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return table
+
+    def _read(self, table_id, columns) -> pd.DataFrame:
+        path = osp.join(self.tables_dir, table_id)
+        extension = osp.splitext(path)[1].lower()
+        if extension in PARQUET_EXTENSIONS:
+            return self._read_parquet(table_id, path, columns)
+        if extension in ARROW_EXTENSIONS:
+            return self._read_arrow(table_id, path, columns)
+        skiprows = None
+        if self.sample_fraction is not None:
+            rng = random.Random(f"{self.seed}:{table_id}")
+            # Keep the header line and a seeded random subset of the data lines
+            skiprows = lambda i: i > 0 and rng.random() >= self.sample_fraction
+        return pd.read_csv(path, usecols=columns, nrows=self.nrows, skiprows=skiprows)
+
+    def _read_parquet(self, table_id, path, columns) -> pd.DataFrame:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        if self.nrows is None and self.sample_fraction is None:
+            return parquet_file.read(columns=columns).to_pandas()
+        return self._from_batches(parquet_file.iter_batches(batch_size=self.nrows or 65536, columns=columns),
+                                  parquet_file.schema_arrow, columns, table_id)
+
+    def _read_arrow(self, table_id, path, columns) -> pd.DataFrame:
+        import pyarrow as pa
+
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            if columns is not None:
+                batches = (batch.select(columns) for batch in batches)
+            return self._from_batches(batches, reader.schema, columns, table_id)
+
+    def _from_batches(self, batches, schema, columns, table_id) -> pd.DataFrame:
+        import pyarrow as pa
+
+        if columns is not None:
+            schema = pa.schema([schema.field(c) for c in columns])
+        # Seeded per table, like the CSV sampling, so that the tables do not all get the same row mask
+        rng = random.Random(f"{self.seed}:{table_id}")
+        selected = []
+        num_rows = 0
+        for batch in batches:
+            if self.sample_fraction is not None:
+                mask = pa.array([rng.random() < self.sample_fraction for _ in range(batch.num_rows)])
+                batch = batch.filter(mask)
+            if self.nrows is not None:
+                batch = batch.slice(0, self.nrows - num_rows)
+            selected.append(batch)
+            num_rows += batch.num_rows
+            if self.nrows is not None and num_rows >= self.nrows:
+                break
+        return pa.Table.from_batches(selected, schema=schema).to_pandas()
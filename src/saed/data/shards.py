@@ -0,0 +1,82 @@
+import os
+import os.path as osp
+import json
+import glob
+import zlib
+
+from saed.data.store import iter_predictions, export_json
+
+
+def shard_of(table_id, num_shards: int) -> int:
+    """
+    The shard of a table. Whole tables are assigned to a shard, so the context of a table stays in one process, and
+    the assignment only depends on the table ID, so every machine computes the same partition.
+    """
+    return zlib.crc32(str(table_id).encode("utf-8")) % num_shards
+
+
+def shard_name(shard_index: int, num_shards: int) -> str:
+    return f"shard-{shard_index:03d}-of-{num_shards:03d}"
+
+
+def shard_dirs(results_dir: str, num_shards: int) -> list:
+    """
+    The result directories of the `num_shards` shards of a run, in shard order, whether they exist or not.
+    """
+    return [osp.join(results_dir, shard_name(shard_index, num_shards)) for shard_index in range(num_shards)]
+
+
+def find_shard_dirs(results_dir: str) -> list:
+    return sorted(d for d in glob.glob(osp.join(results_dir, "shard-*-of-*")) if osp.isdir(d))
+
+
+def merge_predictions(dirs: list, output_dir: str, order: list = None) -> dict:
+    """
+    Merges the predictions of the shards into the canonical `predictions.jsonl` and `predictions.json` of `output_dir`.
+
+    Args:
+        dirs (list): The result directories of the shards.
+        output_dir (str): The results directory of the whole run.
+        order (list, optional): The expected (table_id, column_id) pairs, in the order of `predictions.json`.
+    Returns:
+        dict: A report with the number of predictions per shard, the shards without predictions, and the missing,
+            duplicate (conflicting if their paths differ) and unexpected (table_id, column_id) pairs.
+    """
+    seen = {}  # (table_id, column_id) -> (shard directory, paths)
+    duplicates = []
+    shards = {}
+    empty_shards = []
+    jsonl_path = osp.join(output_dir, "predictions.jsonl")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(jsonl_path, "w", encoding="utf-8") as out:
+        for shard_dir in dirs:
+            name = osp.basename(shard_dir)
+            if not (osp.exists(osp.join(shard_dir, "predictions.jsonl")) or osp.exists(osp.join(shard_dir, "predictions.json"))):
+                empty_shards.append(name)
+                continue
+            shards[name] = 0
+            for prediction in iter_predictions(shard_dir):
+                shards[name] += 1
+                key = (prediction["table_id"], prediction["column_id"])
+                if key in seen:
+                    first_shard, first_paths = seen[key]
+                    duplicates.append({"table_id": key[0], "column_id": key[1], "shards": [first_shard, name],
+                                       "conflicting": first_paths != prediction["paths"]})
+                    continue
+                seen[key] = (name, prediction["paths"])
+                out.write(json.dumps(prediction) + "\n")
+    export_json(jsonl_path, osp.join(output_dir, "predictions.json"), order=order)
+
+    missing, unexpected = [], []
+    if order is not None:
+        expected = set(order)
+        missing = [list(key) for key in order if key not in seen]
+        unexpected = [list(key) for key in seen if key not in expected]
+    return {
+        "predictions": len(seen),
+        "shards": shards,
+        "empty_shards": empty_shards,
+        "missing": missing,
+        "duplicates": duplicates,
+        "unexpected": unexpected,
+    }
@@ -0,0 +1,112 @@
+import os
+import os.path as osp
+import json
+
+
+class PredictionStore:
+    """
+    An append-only JSON Lines file of predictions, one JSON object per annotated column.
+
+    Every prediction is flushed to disk as soon as it is added, so an interrupted run keeps all finished columns
+    and can be resumed by skipping the (table_id, column_id) pairs that are already stored.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        """
+        Args:
+            path (str): The JSON Lines file of the predictions.
+            resume (bool): Keep the predictions already in the file instead of starting from scratch.
+        """
+        self.path = path
+        self.completed = set()
+        if resume and osp.exists(path):
+            self._repair()
+            for prediction in iter_jsonl(path):
+                self.completed.add((prediction["table_id"], prediction["column_id"]))
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _repair(self):
+        """
+        Drops a partially written last line left behind by a crash.
+        """
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+    def __contains__(self, key) -> bool:
+        return key in self.completed
+
+    def add(self, prediction: dict):
+        self._file.write(json.dumps(prediction) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.completed.add((prediction["table_id"], prediction["column_id"]))
+
+    def close(self):
+        self._file.close()
+
+    def export_json(self, json_path: str, order=None):
+        """
+        Writes the stored predictions as the JSON array of `predictions.json`, see `export_json`.
+        """
+        export_json(self.path, json_path, order=order)
+
+
+def export_json(jsonl_path: str, json_path: str, order=None):
+    """
+    Writes the predictions of a JSON Lines file as the JSON array of `predictions.json` without loading them all into memory.
+
+    Args:
+        jsonl_path (str): The JSON Lines file of the predictions.
+        json_path (str): The JSON file to write.
+        order (list, optional): The (table_id, column_id) pairs in the order of the output. Defaults to file order.
+    """
+    offsets = {}
+    with open(jsonl_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                prediction = json.loads(line)
+                offsets[(prediction["table_id"], prediction["column_id"])] = offset
+            offset += len(line)
+    if order is None:
+        order = list(offsets)
+    with open(jsonl_path, 'rb') as f, open(json_path, 'w', encoding='utf-8') as out:
+        out.write('[')
+        first = True
+        for key in order:
+            if key not in offsets:
+                continue
+            f.seek(offsets[key])
+            prediction = json.loads(f.readline())
+            out.write(('\n' if first else ',\n') + json.dumps(prediction, indent=4))
+            first = False
+        out.write('\n]')
+
+
+def iter_jsonl(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line of an interrupted run
+                continue
+
+
+def iter_predictions(results_dir: str):
+    """
+    Yields the predictions of a results directory one at a time, preferring the streamed `predictions.jsonl`
+    and falling back to `predictions.json`.
+    """
+    jsonl_path = osp.join(results_dir, 'predictions.jsonl')
+    if osp.exists(jsonl_path):
+        yield from iter_jsonl(jsonl_path)
+    else:
+        with open(osp.join(results_dir, 'predictions.json')) as f:
+            yield from json.load(f)
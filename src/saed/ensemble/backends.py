@@ -0,0 +1,76 @@
+from omegaconf import DictConfig
+
+from saed.ensemble.client import shared_http_client
+
+# Maps `config['llms']['name']` to the function building its LangChain model. The provider packages are
+# imported inside the builders, so only the selected backend is loaded.
+BACKENDS = {}
+
+
+def register_backend(name: str):
+    """
+    Registers a function `builder(config, timeout_s, max_connections)` returning the LangChain model of a backend.
+    """
+    def decorator(builder):
+        BACKENDS[name] = builder
+        return builder
+    return decorator
+
+
+def create_backend(config: DictConfig, timeout_s: float = None, max_connections: int = 16):
+    """
+    Builds the LangChain model of the backend selected by `config['llms']['name']`.
+    """
+    builder = BACKENDS.get(config['llms']['name'])
+    if builder is None:
+        raise ValueError("Invalid LLM name")
+    return builder(config, timeout_s, max_connections)
+
+
+@register_backend("ollama")
+def ollama_backend(config: DictConfig, timeout_s: float = None, max_connections: int = 16):
+    import httpx
+    from langchain_ollama.llms import OllamaLLM
+
+    return OllamaLLM(
+        base_url=config['llms']['base_url'],
+        model=config['llms']['model'],
+        # The cache assumes the configured temperature, so it is set explicitly instead of the model default
+        temperature=config['llms'].get('temperature', 0.0),
+        client_kwargs={
+            "timeout": timeout_s,
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        },
+    )
+
+
+@register_backend("azure_openai")
+def azure_openai_backend(config: DictConfig, timeout_s: float = None, max_connections: int = 16):
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_endpoint=config['llms']['endpoint'],
+        azure_deployment=config['llms']['deployment_name'],  # or your deployment
+        api_version=config['llms']['api_version'],  # or your api version
+        api_key=config['llms']['api_key'],
+        temperature=config['llms']['temperature'],
+        max_tokens=None,
+        timeout=timeout_s,
+        # Retries are handled by the client, with backoff shared with the rate limiter
+        max_retries=0,
+        http_client=shared_http_client(("azure_openai", config['llms']['endpoint']), timeout_s, max_connections),
+        stream_usage=config['llms'].get('streaming', False),
+    )
+
+
+@register_backend("fake")
+def fake_backend(config: DictConfig, timeout_s: float = None, max_connections: int = 16):
+    # Deterministic offline answers, for tests and benchmarks
+    from saed.ensemble.fake import FakeLLM
+
+    return FakeLLM(
+        seed=config['llms'].get('seed', 0),
+        latency_s=config['llms'].get('latency_s', 0.0),
+        latency_jitter_s=config['llms'].get('latency_jitter_s', 0.0),
+        max_classes=config['llms'].get('max_classes', 2),
+    )
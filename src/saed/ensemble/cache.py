@@ -0,0 +1,165 @@
+import os
+import os.path as osp
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str, max_size_mb: float = 512):
+    """
+    Returns the LLMCache stored at `path`, shared by every LLM of the process so that identical
+    in-flight requests of different LLM instances are coalesced as well.
+    """
+    path = osp.abspath(path)
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = LLMCache(path, max_size_mb=max_size_mb)
+        return _caches[path]
+
+
+class LLMCache:
+    """
+    A persistent, content-addressed cache of LLM responses stored in a single SQLite file.
+
+    Entries are evicted in least-recently-used order once the stored responses exceed `max_size_mb`. The access times
+    of hits are buffered and written in one transaction every `flush_every` hits, before an insert and on close.
+    Concurrent requests for the same key are coalesced: only the first one calls the LLM, the others wait for its result.
+    """
+
+    def __init__(self, path: str, max_size_mb: float = 512, flush_every: int = 256):
+        """
+        Args:
+            path (str): The SQLite file of the cache. It is created if it does not exist.
+            max_size_mb (float): The maximum total size of the cached responses in megabytes.
+            flush_every (int): The number of hits whose access times are buffered before they are written.
+        """
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._accesses = {}  # key -> last access time not yet written
+        os.makedirs(osp.dirname(path) or ".", exist_ok=True)
+        # Shards running in several processes may share the cache file; wait for their writes instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        """
+        Hashes the JSON-serializable `parts` of a request into a cache key.
+        """
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._accesses[key] = time.time()
+        if len(self._accesses) >= self.flush_every:
+            self._flush_accesses()
+            self._conn.commit()
+        return row[0]
+
+    def _flush_accesses(self):
+        if self._accesses:
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                   [(last_access, key) for key, last_access in self._accesses.items()])
+            self._accesses.clear()
+
+    def _put(self, key, response):
+        size = len(response.encode("utf-8"))
+        # The eviction order needs the access times of the buffered hits
+        self._flush_accesses()
+        old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, response, size, time.time()),
+        )
+        self._size += size - (old[0] if old else 0)
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        while self._size > self.max_size_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                self.evictions += 1
+                if self._size <= self.max_size_bytes:
+                    break
+
+    def get_or_compute(self, key: str, compute) -> str:
+        """
+        Returns the cached response for `key`, or calls `compute()` and caches its result.
+        If the same key is already being computed by another thread, waits for that result instead.
+        """
+        with self._lock:
+            response = self._get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            response = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            with self._lock:
+                self._put(key, response)
+            future.set_result(response)
+            return response
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": self._size,
+            }
+
+    def close(self):
+        with self._lock:
+            self._flush_accesses()
+            self._conn.commit()
+            self._conn.close()
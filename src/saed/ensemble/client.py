@@ -0,0 +1,218 @@
+import time
+import random
+import threading
+from collections import defaultdict
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+_http_clients = {}
+_http_clients_lock = threading.Lock()
+
+
+def shared_http_client(key, timeout_s: float = None, max_connections: int = 16):
+    """
+    Returns the process-wide httpx client for `key` (e.g. the endpoint), so that all LLM objects talking to the
+    same endpoint share one connection pool.
+    """
+    import httpx
+
+    with _http_clients_lock:
+        client = _http_clients.get(key)
+        if client is None:
+            client = httpx.Client(
+                timeout=timeout_s,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            )
+            _http_clients[key] = client
+        return client
+
+
+def status_code(error: Exception):
+    """
+    The HTTP status of a failed call, for the exceptions of openai, ollama and httpx alike; None without a response.
+    """
+    code = getattr(error, 'status_code', None)
+    if code is None:
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(error: Exception):
+    """
+    The delay in seconds requested by the server in the Retry-After headers of a failed call, if any.
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Whether a call may succeed when repeated: rate limits (429), server errors (5xx), timeouts and dropped connections.
+    """
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES or code >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+        if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+            return True
+    except ImportError:
+        pass
+    try:
+        import openai
+        if isinstance(error, openai.APIConnectionError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `rate_per_minute`, holding at most `burst_s` seconds worth of tokens.
+
+    Callers reserve their amount up front and are told how long to wait; the level may go below zero, so queued
+    reservations are served in order at the configured rate. A reservation larger than the bucket waits for a
+    full bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_s: float = 1.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` tokens and returns the seconds to wait before using them.
+        """
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+            self.level -= amount
+            return wait
+
+    def adjust(self, amount: float):
+        """
+        Takes `amount` more tokens (or gives them back if negative), e.g. once the actual usage of a call is known.
+        """
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class ResilientClient:
+    """
+    Wraps every call to the LLM backend with client-side rate limiting and retries.
+
+    Calls wait for the request and token buckets (requests/min and tokens/min quotas) before they are sent, and
+    transient failures (429, 5xx, timeouts, dropped connections) are retried with exponential backoff and jitter,
+    honouring the Retry-After header of the server. Throttling and retries are counted in `stats()`.
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None, max_retries: int = 6,
+                 backoff_base_s: float = 1.0, backoff_max_s: float = 60.0, burst_s: float = 1.0):
+        """
+        Args:
+            requests_per_minute (float, optional): The request quota; None does not limit the requests.
+            tokens_per_minute (float, optional): The token quota (prompt and completion); None does not limit the tokens.
+            max_retries (int): The number of retries of a transient failure before it is raised.
+            backoff_base_s (float): The delay before the first retry, doubled on every further retry.
+            backoff_max_s (float): The maximum delay between two retries.
+            burst_s (float): The seconds of quota that may be used at once after an idle period.
+        """
+        self.requests = TokenBucket(requests_per_minute, burst_s) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, burst_s) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "throttled_calls": 0, "throttled_s": 0.0,
+                       "backoff_s": 0.0, "retries_per_status": defaultdict(int)}
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt)
+            # Equal jitter: keep half of the delay, randomize the other half so clients do not retry in lockstep
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    def throttle(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            with self._lock:
+                self._stats["throttled_calls"] += 1
+                self._stats["throttled_s"] += wait
+            time.sleep(wait)
+        return wait
+
+    def call(self, fn, tokens: int = 0, usage: dict = None):
+        """
+        Calls `fn` within the quotas, retrying transient failures.
+
+        Args:
+            fn (callable): Sends the request and returns its result.
+            tokens (int): The estimated tokens of the request, reserved from the token quota.
+            usage (dict, optional): Receives the number of retries and the seconds spent throttled and backing off.
+        """
+        throttled_s, backoff_s = 0.0, 0.0
+        attempt = 0
+        while True:
+            throttled_s += self.throttle(tokens)
+            try:
+                result = fn()
+                break
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.max_retries:
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    raise
+                delay = self.backoff(attempt, e)
+                with self._lock:
+                    self._stats["retries"] += 1
+                    self._stats["backoff_s"] += delay
+                    self._stats["retries_per_status"][str(status_code(e) or type(e).__name__)] += 1
+                print(f"Retrying LLM call in {delay:.1f}s after {type(e).__name__}: {e}")
+                time.sleep(delay)
+                backoff_s += delay
+                attempt += 1
+        with self._lock:
+            self._stats["calls"] += 1
+        if usage is not None:
+            usage['retries'] = attempt
+            usage['throttled_s'] = throttled_s
+            usage['backoff_s'] = backoff_s
+        return result
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """
+        Corrects the token quota once the actual token usage of a call is known.
+        """
+        if self.tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, retries_per_status=dict(self._stats["retries_per_status"]))
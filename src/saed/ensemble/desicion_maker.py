@@ -1,27 +1,111 @@
 import random
 import re
-from collections import defaultdict
-from omegaconf import DictConfig
+import time
+import threading
+import contextvars
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from omegaconf import DictConfig, OmegaConf
 
 from saed.ensemble.llms import LLM
+from saed.ensemble.prompts import batch_llm_prompt, batch_cot_prompt
+from saed.utils.instrumentation import CallMetrics, call_context
 
 class DecisionMaker:
     """
     A class that represents a collaborative decision-making algorithm using LLM-based agents.
     """
     
-    def __init__(self, config: DictConfig):
+    def __init__(self, config: DictConfig, metrics: CallMetrics = None):
         self.config = config
-        self.llm = LLM(config)
+        self.metrics = metrics if metrics is not None else CallMetrics()
+        if self.config['llms']['name'] == "cascade":
+            # Cheaper tiers first, a decision is escalated to the next tier when it is not confident
+            self.tiers = [LLM(tier_config, metrics=self.metrics) for tier_config in cascade_tier_configs(config)]
+        else:
+            self.tiers = [LLM(config, metrics=self.metrics)]
+        self.llm = self.tiers[0]
+        # Queries the agents of every ensemble decision, created on first use and reused by all decisions
+        self._agent_pool = None
+        self._agent_pool_lock = threading.Lock()
+    
+    def agent_pool(self) -> ThreadPoolExecutor:
+        """
+        The pool querying the agents in parallel. Every concurrent search worker keeps up to `max_concurrency`
+        agents in flight, so the pool has `max_concurrency * num_workers` threads.
+        """
+        with self._agent_pool_lock:
+            if self._agent_pool is None:
+                max_workers = self.config['experiments'].get('max_concurrency', 1) * self.config['experiments'].get('num_workers', 1)
+                self._agent_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="saed-agent")
+            return self._agent_pool
+    
+    def close(self):
+        with self._agent_pool_lock:
+            if self._agent_pool is not None:
+                self._agent_pool.shutdown(wait=True)
+                self._agent_pool = None
     
     def decision_making(self, table_name, table_in_markdown, column_name, current_level_ontology_classes) -> str:
-        if self.config['experiments']['mode'] == 'llm' or self.config['experiments']['mode'] == 'cot':
-            print('Mode:', self.config['experiments']['mode'])
-            return self.llm_decision_making(table_name, table_in_markdown, column_name, current_level_ontology_classes)
-        elif self.config['experiments']['mode'] == 'edm':
-            return self.ensemble_decision_making(table_name, table_in_markdown, column_name, current_level_ontology_classes)
+        start = time.perf_counter()
+        result = None
+        for tier, llm in enumerate(self.tiers):
+            outcome = {}
+            with call_context(tier=tier):
+                if self.config['experiments']['mode'] == 'llm' or self.config['experiments']['mode'] == 'cot':
+                    print('Mode:', self.config['experiments']['mode'])
+                    result = self.llm_decision_making(table_name, table_in_markdown, column_name, current_level_ontology_classes,
+                                                      llm=llm, outcome=outcome)
+                elif self.config['experiments']['mode'] == 'edm':
+                    result = self.ensemble_decision_making(table_name, table_in_markdown, column_name, current_level_ontology_classes,
+                                                           llm=llm, outcome=outcome)
+            reason = self.escalation_reason(outcome)
+            if reason is None or tier == len(self.tiers) - 1:
+                break
+            self.metrics.record("escalation", from_tier=tier, to_tier=tier + 1, reason=reason)
+        self.metrics.record("decision", mode=self.config['experiments']['mode'], num_classes=len(current_level_ontology_classes),
+                            latency_s=time.perf_counter() - start, tier=tier)
+        return result
+    
+    def escalation_reason(self, outcome) -> str:
+        """
+        Why a decision should be escalated to the next tier of a cascade, None if it is confident.
+        
+        Parameters:
+            outcome (dict): Filled by the decision: the number of unparseable answers and of answers with classes
+                            outside the candidates, and the agreement of the ensemble votes.
+        """
+        if outcome.get('unparseable', 0):
+            return "unparseable"
+        if outcome.get('unknown_classes', 0):
+            return "unknown_classes"
+        escalation = self.config['llms'].get('escalation', None) or {}
+        # The agreement is the share of the majority, so 0.6 keeps 2 of 3 and 3 of 5 agents and escalates ties
+        if outcome.get('agreement', 1.0) < escalation.get('min_agreement', 0.6):
+            return "low_agreement"
+        return None
     
-    def llm_decision_making(self, table_name, table_in_markdown, column_name, current_level_ontology_classes) -> str:
+    @staticmethod
+    def parse_answer(result, current_level_ontology_classes, outcome=None) -> list:
+        """
+        Returns the classes of the first <answer></answer> in `result` that are in `current_level_ontology_classes`,
+        None if there is no answer. Unparseable answers and answers with other classes are counted in `outcome`.
+        """
+        answer_matches = re.findall(r"<answer>(.*?)</answer>", result, flags=re.DOTALL)
+        if not answer_matches:
+            if outcome is not None:
+                outcome['unparseable'] = outcome.get('unparseable', 0) + 1
+            return None
+        answer_content = answer_matches[0]
+        if answer_content == "-":
+            return []
+        predicted_ontology_classes = answer_content.split(", ")
+        selected_ontology_classes = [c for c in predicted_ontology_classes if c in current_level_ontology_classes]
+        if outcome is not None and len(selected_ontology_classes) < len(predicted_ontology_classes):
+            outcome['unknown_classes'] = outcome.get('unknown_classes', 0) + 1
+        return selected_ontology_classes
+    
+    def llm_decision_making(self, table_name, table_in_markdown, column_name, current_level_ontology_classes, llm=None, outcome=None) -> str:
         """
         A mock implementation of a LLM-based decision-making algorithm.
         
@@ -29,35 +113,98 @@ class DecisionMaker:
             table_name (str): Name of the table.
             table_in_markdown (str): The table data in markdown format.
             column_name (str): The column name that we are mapping.
-            current_level_ontology_classes (list): A list of classes (e.g. ["a", "b", "c", "d", "e"]).
+            current_level_ontology_classes (Sequence): A list or tuple of classes (e.g. ["a", "b", "c", "d", "e"]).
+            llm (LLM, optional): The LLM to ask, by default the first tier.
+            outcome (dict, optional): Receives the problems of the answer, see `escalation_reason`.
         Returns:
             str: "-" if no suitable class is found, or a comma-separated string of class names that reached consensus.
         """
+        llm = self.llm if llm is None else llm
         data = {
             "table_name": table_name,
             "table_in_markdown": table_in_markdown,
             "column_name": column_name,
             "current_level_ontology_classes": ", ".join(current_level_ontology_classes)
         }
-        result = self.llm.generate(data)
-        answer_pattern = r"<answer>(.*?)</answer>"
-        answer_matches = re.findall(answer_pattern, result, flags=re.DOTALL)
-        if answer_matches:
-            answer_content = answer_matches[0]
-            if  answer_content == "-":
-                return "-"
-            else:
+        result = llm.generate(data, stop_at_answer=True)
+        selected_ontology_classes = self.parse_answer(result, current_level_ontology_classes, outcome)
+        if selected_ontology_classes:
+            return ", ".join(selected_ontology_classes)
+        return "-"
+        
+    def batch_decision_making(self, table_name, table_in_markdown, column_names, current_level_ontology_classes) -> dict:
+        """
+        Decides on the classes of several columns of the same table with a single LLM call.
+        
+        Parameters:
+            table_name (str): Name of the table.
+            table_in_markdown (str): The table data in markdown format.
+            column_names (list): The column names that we are mapping.
+            current_level_ontology_classes (Sequence): A list or tuple of classes (e.g. ["a", "b", "c", "d", "e"]).
+        Returns:
+            dict: For every column name, "-" if no suitable class is found, or a comma-separated string of class names.
+        """
+        if self.config['experiments']['mode'] == 'llm':
+            prompt = batch_llm_prompt
+        elif self.config['experiments']['mode'] == 'cot':
+            prompt = batch_cot_prompt
+        else:
+            raise ValueError("Batched prompting is only available in the 'llm' and 'cot' modes")
+        data = {
+            "table_name": table_name,
+            "table_in_markdown": table_in_markdown,
+            "column_names": "\n".join(f"- '{column_name}'" for column_name in column_names),
+            "current_level_ontology_classes": ", ".join(current_level_ontology_classes)
+        }
+        start = time.perf_counter()
+        decisions = {}
+        pending_column_names = list(column_names)
+        for tier, llm in enumerate(self.tiers):
+            outcomes = {}
+            with call_context(tier=tier):
+                result = llm.generate(dict(data, column_names="\n".join(f"- '{column_name}'" for column_name in pending_column_names)),
+                                      prompt=prompt)
+            decisions.update(self.parse_batch_answers(result, pending_column_names, current_level_ontology_classes, outcomes))
+            # Only the columns without a confident answer are escalated to the next tier
+            escalated = [column_name for column_name in pending_column_names if self.escalation_reason(outcomes[column_name]) is not None]
+            if not escalated or tier == len(self.tiers) - 1:
+                break
+            for column_name in escalated:
+                self.metrics.record("escalation", from_tier=tier, to_tier=tier + 1, reason=self.escalation_reason(outcomes[column_name]))
+            pending_column_names = escalated
+        self.metrics.record("decision", mode=self.config['experiments']['mode'], num_classes=len(current_level_ontology_classes),
+                            num_columns=len(column_names), latency_s=time.perf_counter() - start, tier=tier)
+        return decisions
+    
+    @staticmethod
+    def parse_batch_answers(result, column_names, current_level_ontology_classes, outcomes=None) -> dict:
+        """
+        Returns the decision of every column from the <answer column="..."></answer> tags of a batched answer.
+        The problems of the answer of every column are stored in `outcomes[column_name]`, see `escalation_reason`.
+        """
+        outcomes = {} if outcomes is None else outcomes
+        answer_pattern = r"<answer\s+column=[\"']?(.*?)[\"']?\s*>(.*?)</answer>"
+        answers = {}
+        for answer_column, answer_content in re.findall(answer_pattern, result, flags=re.DOTALL):
+            answers.setdefault(answer_column.strip(), answer_content)
+        decisions = {}
+        for column_name in column_names:
+            outcome = outcomes.setdefault(column_name, {})
+            if column_name not in answers:
+                outcome['unparseable'] = 1
+            answer_content = answers.get(column_name, "-")
+            selected_ontology_classes = []
+            if answer_content != "-":
                 predicted_ontology_classes = answer_content.split(", ")
-                selected_ontology_classes = []
                 for predicted_ontology_class in predicted_ontology_classes:
                     if predicted_ontology_class in current_level_ontology_classes:
                         selected_ontology_classes.append(predicted_ontology_class)
-                if selected_ontology_classes:
-                    return ", ".join(selected_ontology_classes)
-        else:
-            return "-"
+                if len(selected_ontology_classes) < len(predicted_ontology_classes):
+                    outcome['unknown_classes'] = 1
+            decisions[column_name] = ", ".join(selected_ontology_classes) if selected_ontology_classes else "-"
+        return decisions
         
-    def ensemble_decision_making(self, table_name, table_in_markdown, column_name, current_level_ontology_classes) -> str:
+    def ensemble_decision_making(self, table_name, table_in_markdown, column_name, current_level_ontology_classes, llm=None, outcome=None) -> str:
         """
         A mock implementation of a LLM-based collaborative decision-making algorithm.
         This function:
@@ -69,11 +216,20 @@ class DecisionMaker:
             table_name (str): Name of the table.
             table_in_markdown (str): The table data in markdown format.
             column_name (str): The column name that we are mapping.
-            current_level_ontology_classes (list): A list of classes (e.g. ["a", "b", "c", "d", "e"]).
+            current_level_ontology_classes (Sequence): A list or tuple of classes (e.g. ["a", "b", "c", "d", "e"]).
             avg_classes_per_agent (int): Average number of classes per agent.
             avg_agents_per_class (int): Average number of agents that see each class.
             consensus_threshold_ratio (float): The ratio of supporting votes needed from the agents 
                                             that saw a class to consider it selected.
+            max_concurrency (int): Number of agents queried in parallel; 1 queries the agents one after another.
+            assignment (str): "random" samples the agents of every class, "balanced" uses `balanced_assignment`.
+            seed (int): The seed of the balanced assignment.
+            early_stopping (bool): Skip the agents whose votes can no longer change the result, i.e. when each of
+                                   their classes has either reached the threshold already or cannot reach it
+                                   even if all remaining agents that see it vote for it.
+            llm (LLM, optional): The LLM the agents ask, by default the first tier.
+            outcome (dict, optional): Receives the problems of the agent answers and the agreement of the votes,
+                                      see `escalation_reason`.
         Returns:
             str: "-" if no suitable class is found, or a comma-separated string of class names that reached consensus.
         """
@@ -84,53 +240,114 @@ class DecisionMaker:
         if not classes:
             return "-"
         num_classes = len(classes)
-        # Compute the approximate number of agents needed:
-        # num_agents * avg_classes_per_agent ≈ num_classes * avg_agents_per_class
-        # => num_agents ≈ (num_classes * avg_agents_per_class) / avg_classes_per_agent
-        num_agents = max(avg_agents_per_class, (num_classes * avg_agents_per_class) // avg_classes_per_agent + 1)
-        
-        # Assign classes to agents
-        agents_assignments = [[] for _ in range(num_agents)]
-        for class_ in classes:
-            if num_agents < avg_agents_per_class:
-                # Assign all agents to this class if not enough agents
-                assigned_agents = range(num_agents)
-            else:
-                assigned_agents = random.sample(range(num_agents), avg_agents_per_class)
-            for agent in assigned_agents:
-                agents_assignments[agent].append(class_)
+        assignment = self.config['experiments'].get('assignment', 'random')
+        if assignment == 'balanced':
+            agents_assignments = self.balanced_assignment(classes, avg_classes_per_agent, avg_agents_per_class,
+                                                          self.config['experiments'].get('seed', 0))
+            agents_that_saw_class = defaultdict(int)
+            for agent_classes in agents_assignments:
+                for class_ in agent_classes:
+                    agents_that_saw_class[class_] += 1
+        elif assignment == 'random':
+            # Compute the approximate number of agents needed:
+            # num_agents * avg_classes_per_agent ≈ num_classes * avg_agents_per_class
+            # => num_agents ≈ (num_classes * avg_agents_per_class) / avg_classes_per_agent
+            num_agents = max(avg_agents_per_class, (num_classes * avg_agents_per_class) // avg_classes_per_agent + 1)
+            
+            # Assign classes to agents and count how many agents see each class (for consensus calculation)
+            agents_assignments = [[] for _ in range(num_agents)]
+            agents_that_saw_class = defaultdict(int)
+            for class_ in classes:
+                if num_agents < avg_agents_per_class:
+                    # Assign all agents to this class if not enough agents
+                    assigned_agents = range(num_agents)
+                else:
+                    assigned_agents = random.sample(range(num_agents), avg_agents_per_class)
+                for agent in assigned_agents:
+                    agents_assignments[agent].append(class_)
+                    agents_that_saw_class[class_] += 1
+        else:
+            raise ValueError(f"Unknown agent assignment: {assignment}")
 
         if not agents_assignments:
             # If something goes wrong, fallback to one agent seeing all classes
-            agents_assignments = [classes]
-        # Count how many agents see each class (for consensus calculation)
-        agents_that_saw_class = defaultdict(int)
-        for class_ in classes:
-            agents_that_saw_class[class_] = sum(1 for agent_c in agents_assignments if class_ in agent_c)
+            agents_assignments = [list(classes)]
+            for class_ in classes:
+                agents_that_saw_class[class_] = 1
         
         # Collect votes
         votes_per_class = defaultdict(int)
-        # Query each agent
-        for agent_classes in agents_assignments:
-            assigned_classes_str = ", ".join(agent_classes)
-            data = {
-                "table_name": table_name,
-                "table_in_markdown": table_in_markdown,
-                "column_name": column_name,
-                "current_level_ontology_classes": assigned_classes_str
-            }
-            result = self.llm.generate(data)
-            
-            answer_pattern = r"<answer>(.*?)</answer>"
-            answer_matches = re.findall(answer_pattern, result, flags=re.DOTALL)
-            if answer_matches:
-                answer_content = answer_matches[0]
-                if answer_content != "-":
-                    chosen_classes = [r.strip() for r in answer_content.split(",")]
-                    # Increment votes only for classes the agent actually sees
-                    for cc in chosen_classes:
-                        if cc in agent_classes:
-                            votes_per_class[cc] += 1
+        data = {
+            "table_name": table_name,
+            "table_in_markdown": table_in_markdown,
+            "column_name": column_name,
+        }
+        early_stopping = self.config['experiments'].get('early_stopping', False)
+        # Number of agents that see a class and have not answered yet
+        remaining_agents = dict(agents_that_saw_class)
+        
+        def is_decided(class_):
+            votes, seen = votes_per_class[class_], agents_that_saw_class[class_]
+            if votes > 0 and votes / seen >= consensus_threshold_ratio:
+                # Votes are never taken back, the class stays selected
+                return True
+            max_votes = votes + remaining_agents[class_]
+            return max_votes == 0 or max_votes / seen < consensus_threshold_ratio
+        
+        def is_needed(agent_classes):
+            return not early_stopping or not all(is_decided(class_) for class_ in agent_classes)
+        
+        def count_votes(agent_classes, votes):
+            for class_ in agent_classes:
+                remaining_agents[class_] -= 1
+            for cc in votes:
+                votes_per_class[cc] += 1
+        
+        queried_agents = 0
+        max_concurrency = self.config['experiments'].get('max_concurrency', 1)
+        if max_concurrency > 1 and len(agents_assignments) > 1:
+            # Keep up to max_concurrency agent prompts of this level in flight and count votes as they arrive
+            executor = self.agent_pool()
+            pending_agents = deque(enumerate(agents_assignments))
+            running = {}
+            while pending_agents or running:
+                while pending_agents and len(running) < max_concurrency:
+                    agent, agent_classes = pending_agents.popleft()
+                    if not is_needed(agent_classes):
+                        continue
+                    # Each agent runs in a copy of the caller's context so its calls are recorded with the column and level.
+                    # Its problems are counted in its own outcome, merged on this thread when it is done
+                    agent_outcome = None if outcome is None else {}
+                    future = executor.submit(contextvars.copy_context().run, self.agent_vote, data, agent_classes, agent,
+                                             llm, agent_outcome)
+                    running[future] = (agent_classes, agent_outcome)
+                    queried_agents += 1
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    agent_classes, agent_outcome = running.pop(future)
+                    count_votes(agent_classes, future.result())
+                    if outcome is not None:
+                        for problem, count in agent_outcome.items():
+                            outcome[problem] = outcome.get(problem, 0) + count
+        else:
+            # Query each agent
+            for agent, agent_classes in enumerate(agents_assignments):
+                if not is_needed(agent_classes):
+                    continue
+                count_votes(agent_classes, self.agent_vote(data, agent_classes, agent, llm, outcome))
+                queried_agents += 1
+        self.metrics.record("ensemble", num_agents=len(agents_assignments), queried_agents=queried_agents)
+        if outcome is not None:
+            # Agreement on a class: the share of the majority among the agents that answered about it
+            agreements = []
+            for class_ in classes:
+                answered = agents_that_saw_class[class_] - remaining_agents.get(class_, 0)
+                if votes_per_class[class_] > 0 and answered > 0:
+                    ratio = min(1.0, votes_per_class[class_] / answered)
+                    agreements.append(max(ratio, 1 - ratio))
+            outcome['agreement'] = min(agreements, default=1.0)
         # Determine consensus
         selected_classes = []
         for class_ in classes:
@@ -141,4 +358,83 @@ class DecisionMaker:
         if not selected_classes:
             return "-"
         else:
-            return ", ".join(selected_classes)
\ No newline at end of file
+            return ", ".join(selected_classes)
+
+    @staticmethod
+    def balanced_assignment(classes, avg_classes_per_agent, avg_agents_per_class, seed=0) -> list:
+        """
+        Assigns every class to exactly `avg_agents_per_class` agents, with at most `avg_classes_per_agent` classes
+        per agent, using the minimum number of agents.
+        
+        The classes are shuffled with `seed` and dealt round-robin: the r-th copy of the i-th class goes to agent
+        (i * avg_agents_per_class + r) % num_agents. Consecutive copies land on distinct agents and the loads differ
+        by at most one. The same classes and seed always give the same agents, and so the same (cacheable) prompts.
+        
+        Parameters:
+            classes (Sequence): The classes of the current level.
+            avg_classes_per_agent (int): The maximum number of classes per agent.
+            avg_agents_per_class (int): The number of agents that see each class.
+            seed (int): The seed of the shuffle.
+        Returns:
+            list: The classes of every agent, in their original order.
+        """
+        num_classes = len(classes)
+        num_agents = max(avg_agents_per_class, -(-num_classes * avg_agents_per_class // avg_classes_per_agent))
+        order = list(range(num_classes))
+        random.Random(seed).shuffle(order)
+        agents_class_indices = [[] for _ in range(num_agents)]
+        for position, class_index in enumerate(order):
+            for r in range(avg_agents_per_class):
+                agents_class_indices[(position * avg_agents_per_class + r) % num_agents].append(class_index)
+        return [[classes[i] for i in sorted(indices)] for indices in agents_class_indices if indices]
+
+    def agent_vote(self, data, agent_classes, agent=None, llm=None, outcome=None) -> list:
+        """
+        Queries a single agent with its assigned subset of classes.
+        
+        Parameters:
+            data (dict): The table name, table in markdown and column name of the prompt.
+            agent_classes (list): The classes assigned to this agent.
+            agent (int, optional): The index of the agent, recorded with the call metrics.
+            llm (LLM, optional): The LLM to ask, by default the first tier.
+            outcome (dict, optional): Counts the unparseable answers and the answers with classes the agent does not see.
+        Returns:
+            list: The classes the agent voted for, restricted to the classes it actually sees, each at most once.
+        """
+        llm = self.llm if llm is None else llm
+        with call_context(agent=agent):
+            result = llm.generate(dict(data, current_level_ontology_classes=", ".join(agent_classes)), stop_at_answer=True,
+                                  agent=agent)
+        
+        answer_pattern = r"<answer>(.*?)</answer>"
+        answer_matches = re.findall(answer_pattern, result, flags=re.DOTALL)
+        votes = []
+        if answer_matches:
+            answer_content = answer_matches[0]
+            if answer_content != "-":
+                chosen_classes = [r.strip() for r in answer_content.split(",")]
+                # Vote only for classes the agent actually sees
+                for cc in chosen_classes:
+                    if cc in agent_classes and cc not in votes:
+                        votes.append(cc)
+                if outcome is not None and any(cc not in agent_classes for cc in chosen_classes):
+                    outcome['unknown_classes'] = outcome.get('unknown_classes', 0) + 1
+        elif outcome is not None:
+            outcome['unparseable'] = outcome.get('unparseable', 0) + 1
+        return votes
+
+
+def cascade_tier_configs(config: DictConfig) -> list:
+    """
+    The configuration of every tier of a cascade (`llms.name: cascade`), cheapest first.
+    
+    Each tier is a complete LLM configuration such as `config/llms/ollama.yaml`; the `streaming`, `client` and
+    `cache` settings of the cascade apply to the tiers that do not set their own.
+    """
+    shared = {key: config['llms'][key] for key in ('streaming', 'client', 'cache') if key in config['llms']}
+    tier_configs = []
+    for tier in config['llms']['tiers']:
+        tier_config = OmegaConf.merge(config, {'llms': None})
+        tier_config['llms'] = OmegaConf.merge(shared, tier)
+        tier_configs.append(tier_config)
+    return tier_configs
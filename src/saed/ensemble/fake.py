@@ -0,0 +1,61 @@
+import re
+import time
+import random
+import hashlib
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.llms import LLM as BaseLLM
+from langchain_core.outputs import GenerationChunk
+
+
+class FakeLLM(BaseLLM):
+    """
+    An offline backend for tests and benchmarks that answers like the prompts ask, without any endpoint.
+
+    The answer is derived from the seed and the prompt, so the same prompt always gets the same answer. It picks
+    up to `max_classes` of the classes listed in the prompt, one `<answer column="...">` per column for batched
+    prompts, and waits `latency_s` plus a seeded jitter of up to `latency_jitter_s` to simulate the network.
+    """
+
+    seed: int = 0
+    latency_s: float = 0.0
+    latency_jitter_s: float = 0.0
+    max_classes: int = 2
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"seed": self.seed, "max_classes": self.max_classes}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        result, latency = self._answer(prompt)
+        if latency > 0:
+            time.sleep(latency)
+        return result
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        result, latency = self._answer(prompt)
+        chunks = re.findall(r".{1,8}", result, flags=re.DOTALL)
+        for chunk in chunks:
+            if latency > 0:
+                time.sleep(latency / len(chunks))
+            yield GenerationChunk(text=chunk)
+
+    def _answer(self, prompt: str):
+        rng = random.Random(f"{self.seed}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}")
+        match = re.search(r"available at this level:\n(.*?)\n", prompt)
+        classes = [c for c in match.group(1).split(", ") if c] if match else []
+
+        def pick() -> str:
+            selected = rng.sample(classes, min(len(classes), rng.randint(0, self.max_classes)))
+            return ", ".join(selected) if selected else "-"
+
+        columns = re.findall(r"^- '(.*)'$", prompt, flags=re.MULTILINE)
+        if columns:
+            result = "".join(f'<answer column="{column}">{pick()}</answer>' for column in columns)
+        else:
+            result = f"<answer>{pick()}</answer>"
+        return result, self.latency_s + rng.uniform(0, self.latency_jitter_s)
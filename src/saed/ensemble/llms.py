@@ -1,39 +1,51 @@
 
+import os.path as osp
+import time
 from omegaconf import DictConfig
-from langchain_ollama.llms import OllamaLLM
-from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
 from saed.ensemble.prompts import *
+from saed.ensemble.cache import LLMCache, get_cache
+from saed.ensemble.client import ResilientClient
+from saed.ensemble.backends import create_backend
+from saed.utils.instrumentation import CallMetrics, estimate_tokens
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.join(here, "..", "..", "..")
 
 class LLM:
     """
     A class to represent the LLMs in the ensemble.
     """
     
-    def __init__(self, config: DictConfig):
+    def __init__(self, config: DictConfig, metrics: CallMetrics=None):
         """
         Constructor for the LLM class.
         
         Parameters:
             model (str): The model to use for the LLM.
             prompt (str): The prompt to use for the LLM.
+            metrics (CallMetrics, optional): Records latency and token counts of every call.
         """
         self.config = config
-        if self.config['llms']['name'] == "ollama":
-            self.llm = OllamaLLM(base_url=self.config['llms']['base_url'], model=self.config['llms']['model'])
-        elif self.config['llms']['name'] == "azure_openai":
-            self.llm = AzureChatOpenAI(
-                azure_endpoint=self.config['llms']['endpoint'],
-                azure_deployment=self.config['llms']['deployment_name'],  # or your deployment
-                api_version=self.config['llms']['api_version'],  # or your api version
-                api_key=self.config['llms']['api_key'],
-                temperature=self.config['llms']['temperature'],
-                max_tokens=None,
-                timeout=None,
-            )
-        else:
-            raise ValueError("Invalid LLM name")
+        self.metrics = metrics if metrics is not None else CallMetrics()
+        # Timeouts, connection pooling, rate limits and retries of the calls to the backend
+        client_config = self.config['llms'].get('client', None) or {}
+        timeout_s = client_config.get('timeout_s', None)
+        max_connections = client_config.get('max_connections', 16)
+        self.client = ResilientClient(
+            requests_per_minute=client_config.get('requests_per_minute', None),
+            tokens_per_minute=client_config.get('tokens_per_minute', None),
+            max_retries=client_config.get('max_retries', 6),
+            backoff_base_s=client_config.get('backoff_base_s', 1.0),
+            backoff_max_s=client_config.get('backoff_max_s', 60.0),
+            burst_s=client_config.get('burst_s', 1.0),
+        )
+        self.expected_completion_tokens = client_config.get('expected_completion_tokens', 256)
+        # Stream the completions, so a single answer can be read as soon as its closing tag arrives
+        self.streaming = self.config['llms'].get('streaming', False)
+        # Only the provider package of the selected backend is imported
+        self.llm = create_backend(self.config, timeout_s, max_connections)
         
         # self.prompt = ChatPromptTemplate.from_messages(
         #     [
@@ -54,23 +66,153 @@ class LLM:
         else:
             raise ValueError("Invalid experiment mode")
         self.chain = self.prompt | self.llm
+        self.chains = {id(self.prompt): self.chain}
+        
+        # Only deterministic settings are cached unless explicitly requested
+        self.cache = None
+        cache_config = self.config['llms'].get('cache', None)
+        if cache_config is not None and cache_config.get('enabled', False):
+            if self.temperature == 0 or cache_config.get('cache_nondeterministic', False):
+                self.cache = get_cache(osp.join(root_path, cache_config.get('path', 'outputs/cache/llm_cache.sqlite')),
+                                       max_size_mb=cache_config.get('max_size_mb', 512))
+
+    @property
+    def model(self) -> str:
+        if self.config['llms']['name'] == "azure_openai":
+            return self.config['llms']['deployment_name']
+        return self.config['llms'].get('model', None)
+
+    @property
+    def temperature(self) -> float:
+        return self.config['llms'].get('temperature', 0.0)
 
-    def generate(self, data) -> str:
+    def cache_key(self, variables, prompt=None, agent=None, stop_at_answer=False) -> str:
+        """
+        The content address of a request: backend, model, temperature, prompt template and the filled variables.
+        The requests of different ensemble agents get different keys, so agents seeing the same classes still
+        cast independent votes instead of sharing one cached or coalesced answer. Streamed completions cut after
+        the first answer (`stop_at_answer`) are keyed apart from the full completions.
+        """
+        prompt = self.prompt if prompt is None else prompt
+        template = [(type(m).__name__, getattr(getattr(m, 'prompt', None), 'template', repr(m))) for m in prompt.messages]
+        parts = dict(
+            backend=self.config['llms']['name'],
+            model=self.model,
+            temperature=self.temperature,
+            template=template,
+            variables=variables,
+        )
+        if agent is not None:
+            parts['agent'] = agent
+        if stop_at_answer and self.streaming:
+            parts['stop_at_answer'] = True
+        return LLMCache.make_key(**parts)
+
+    def generate(self, data, prompt=None, stop_at_answer=False, agent=None) -> str:
+        """
+        Fills the prompt with `data` and returns the text generated by the LLM.
+        
+        Parameters:
+            data (dict): The values of the prompt variables.
+            prompt (ChatPromptTemplate, optional): The prompt to use instead of the prompt of the experiment mode.
+            stop_at_answer (bool): When streaming, end the generation after the first complete <answer></answer>,
+                                   for callers that only read the first answer.
+            agent (int, optional): The index of the ensemble agent asking, part of the cache key.
+        """
         # result = self.chain.invoke(
         #     {
         #         "programming_language": data["programming_language"]
         #     }
         # )
-        result = self.chain.invoke(
-            {
-                "table_name": data["table_name"],
-                "table_in_markdown": data["table_in_markdown"],
-                "column_name": data["column_name"],
-                "current_level_ontology_classes": data["current_level_ontology_classes"]
-            }
+        prompt = self.prompt if prompt is None else prompt
+        variables = {name: data[name] for name in prompt.input_variables}
+        usage = {}
+        start = time.perf_counter()
+        if self.cache is None:
+            result = self.invoke(variables, prompt, usage, stop_at_answer)
+        else:
+            result = self.cache.get_or_compute(self.cache_key(variables, prompt, agent, stop_at_answer),
+                                               lambda: self.invoke(variables, prompt, usage, stop_at_answer))
+        latency = time.perf_counter() - start
+        
+        tokens_estimated = usage.get('prompt_tokens') is None
+        self.metrics.record(
+            "llm",
+            backend=self.config['llms']['name'],
+            model=self.model,
+            mode=self.config['experiments']['mode'],
+            latency_s=latency,
+            prompt_tokens=estimate_tokens(prompt.format(**variables)) if tokens_estimated else usage['prompt_tokens'],
+            completion_tokens=estimate_tokens(result) if tokens_estimated else usage['completion_tokens'],
+            tokens_estimated=tokens_estimated,
+            cached='invoked' not in usage,
+            retries=usage.get('retries', 0),
+            throttled_s=usage.get('throttled_s', 0.0),
+            time_to_answer_s=usage.get('time_to_answer_s', latency),
+            stopped_at_answer=usage.get('stopped_at_answer', False),
         )
-        if self.config['llms']['name'] == "ollama":
+        return result
+
+    def invoke(self, variables, prompt=None, usage=None, stop_at_answer=False) -> str:
+        """
+        Calls the backend without the cache. The token usage reported by the backend is stored in `usage` if given.
+        """
+        prompt = self.prompt if prompt is None else prompt
+        chain = self.chains.get(id(prompt))
+        if chain is None:
+            chain = self.chains.setdefault(id(prompt), prompt | self.llm)
+        usage = {} if usage is None else usage
+        # Only the token quota needs an estimate of the tokens before the call
+        estimated_tokens = 0
+        if self.client.tokens is not None:
+            estimated_tokens = estimate_tokens(prompt.format(**variables)) + self.expected_completion_tokens
+        if self.streaming:
+            result = self.client.call(lambda: self.stream(chain, variables, usage, stop_at_answer), tokens=estimated_tokens, usage=usage)
+        else:
+            result = self.client.call(lambda: chain.invoke(variables), tokens=estimated_tokens, usage=usage)
+            self.record_usage(getattr(result, 'usage_metadata', None), usage)
+        usage['invoked'] = True
+        if 'prompt_tokens' in usage:
+            self.client.settle(estimated_tokens, usage['prompt_tokens'] + usage['completion_tokens'])
+        if self.streaming:
+            return result
+        if self.config['llms']['name'] in ("ollama", "fake"):
             return result
         elif self.config['llms']['name'] == "azure_openai":
             return result.content
-        
\ No newline at end of file
+
+    @staticmethod
+    def record_usage(usage_metadata, usage):
+        if usage_metadata:
+            usage['prompt_tokens'] = usage_metadata.get('input_tokens', 0)
+            usage['completion_tokens'] = usage_metadata.get('output_tokens', 0)
+
+    def stream(self, chain, variables, usage, stop_at_answer=False) -> str:
+        """
+        Consumes the completion chunk by chunk. With `stop_at_answer`, the stream is closed as soon as the first
+        <answer></answer> is complete and the text is cut after its closing tag, which leaves the first answer as is.
+        The time until the answer (or the end of the stream) is stored in `usage['time_to_answer_s']`.
+        """
+        start = time.perf_counter()
+        text = ""
+        answer_start = -1
+        stream = chain.stream(variables)
+        try:
+            for chunk in stream:
+                self.record_usage(getattr(chunk, 'usage_metadata', None), usage)
+                text += chunk if isinstance(chunk, str) else chunk.content
+                if not stop_at_answer:
+                    continue
+                if answer_start < 0:
+                    answer_start = text.find("<answer>")
+                if answer_start >= 0:
+                    answer_end = text.find("</answer>", answer_start)
+                    if answer_end >= 0:
+                        text = text[:answer_end + len("</answer>")]
+                        usage['stopped_at_answer'] = True
+                        break
+        finally:
+            # Closing the generator closes the HTTP response, the backend stops generating
+            stream.close()
+        usage['time_to_answer_s'] = time.perf_counter() - start
+        return text
@@ -87,4 +87,64 @@ Instructions:
  """
         ),
     ]
-)
\ No newline at end of file
+)
+
+batch_llm_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are a knowledgeable assistant who helps map tabular data columns to ontology classes. You have expert knowledge in semantic table annotation, i.e., table column-to-ontology class mappings. Your goal is to determine the most semantically appropriate ontology class (or set of classes) for each of the given columns, based on the provided table name, table header, example data, column names, and the ontology classes at current level."
+        ),
+        (
+            "human",
+            """
+We have a table named '{table_name}' which has several columns. Below is the table in Markdown format, including column headers and a few example rows:
+
+{table_in_markdown}
+
+We are currently focusing on ontology classes at the given level. Below are the set of the ontology classes available at this level:
+{current_level_ontology_classes}
+
+We want to determine the best fitting ontology class (or class path if multiple levels are considered) for each of the following columns:
+{column_names}
+
+Instructions:
+1. Review each column name and its example data.
+2. Based on the ontology classes provided, select the most suitable ontology class or classes (or ancestor class or classes) of the corresponding class that best describe the semantic meaning of each column.
+3. Output one answer per column enclosed in <answer column="column_name"></answer> tags, using the exact column name, 
+    3.1 If multiple ontology classes are required to describe a column, split the classes with a comma, for example, <answer column="column_name">ontology_class1, ontology_class2, ..., ontology_classN</answer>
+    3.2 If no suitable class is found for a column, respond with <answer column="column_name">-</answer>.
+ """
+        ),
+    ]
+)
+
+batch_cot_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are a knowledgeable assistant who helps map tabular data columns to ontology classes. You have expert knowledge in semantic table annotation, i.e., table column-to-ontology class mappings. Your goal is to determine the most semantically appropriate ontology class (or set of classes) for each of the given columns, based on the provided table name, table header, example data, column names, and the ontology classes at current level."
+        ),
+        (
+            "human",
+            """
+We have a table named '{table_name}' which has several columns. Below is the table in Markdown format, including column headers and a few example rows:
+
+{table_in_markdown}
+
+We are currently focusing on ontology classes at the given level. Below are the set of the ontology classes available at this level:
+{current_level_ontology_classes}
+
+We want to determine the best fitting ontology class (or class path if multiple levels are considered) for each of the following columns:
+{column_names}
+
+Instructions:
+1. Review each column name and its example data.
+2. Based on the ontology classes provided, select the most suitable ontology class or classes (or ancestor class or classes) of the corresponding class that best describe the semantic meaning of each column.
+3. First, output your reasoning enclosed in <reasoning></reasoning> tags. Then output one answer per column enclosed in <answer column="column_name"></answer> tags, using the exact column name, 
+    3.1 If multiple ontology classes are required to describe a column, split the classes with a comma, for example, <answer column="column_name">ontology_class1, ontology_class2, ..., ontology_classN</answer>
+    3.2 If no suitable class is found for a column, respond with <answer column="column_name">-</answer>.
+ """
+        ),
+    ]
+)
@@ -2,12 +2,13 @@ import os
 import os.path as osp
 import json
 
+import pandas as pd
 import hydra
 from omegaconf import DictConfig, OmegaConf
 
 from saed.onto import OntologyDAG
-from saed.data import load_labels
-from saed.utils import path_level_f1_precision_recall, node_level_f1_precision_recall
+from saed.data import load_labels, iter_predictions
+from saed.utils import path_level_f1_precision_recall, node_level_f1_precision_recall, candidate_recall
 
 here = osp.dirname(osp.abspath(__file__))
 root_path = osp.join(here, "..", "..")
@@ -26,42 +27,39 @@ def main(cfg: DictConfig):
     ontology_dag = OntologyDAG(cfg)
     ontology_dag.build_dag()
     
-    # Load predictions
-    with open(osp.join(results_dir, 'predictions.json')) as f:
-        results_pred = json.load(f)
-        
+    # Stream the predictions into columns and join them with the labels in a single indexed merge
+    records = {"table_id": [], "table_name": [], "column_id": [], "column_name": [], "paths": [], "candidates": []}
+    for r in iter_predictions(results_dir):
+        for key in records:
+            records[key].append(r.get(key))
+    df_pred = pd.DataFrame(records)
+    label_columns = ["class1_level1_name", "class1_level2_name", "class2_level1_name", "class2_level2_name"]
+    df_eval = df_pred.merge(df_labels[["table_id", "column_id"] + label_columns], on=["table_id", "column_id"],
+                            how="inner", validate="many_to_one")
+    if len(df_eval) < len(df_pred):
+        print(f"Warning: {len(df_pred) - len(df_eval)} predictions have no label and are not evaluated")
+    
+    # Map every predicted URL to its class name once
+    names = {url: node.name for url, node in ontology_dag.nodes.items()}
+    
     eval_json = []
-    for r in results_pred:
-        table_id, table_name, column_id, column_name = r["table_id"], r["table_name"], r["column_id"], r["column_name"]
-        label_c1l1 = df_labels[(df_labels["table_id"] == table_id) & (df_labels["column_id"] == column_id)]["class1_level1_name"].values[0]
-        label_c1l2 = df_labels[(df_labels["table_id"] == table_id) & (df_labels["column_id"] == column_id)]["class1_level2_name"].values[0]
-        label_c2l1 = df_labels[(df_labels["table_id"] == table_id) & (df_labels["column_id"] == column_id)]["class2_level1_name"].values[0]
-        label_c2l2 = df_labels[(df_labels["table_id"] == table_id) & (df_labels["column_id"] == column_id)]["class2_level2_name"].values[0]
-        pred_paths = []
-        for path in r["paths"]:
-            pred_path = []
-            for o in path:
-                pred_path.append(ontology_dag.nodes[o].name)
-            pred_paths.append(pred_path)
+    candidate_hits, candidate_total = 0, 0
+    for table_id, table_name, column_id, column_name, paths, candidates, label_c1l1, label_c1l2, label_c2l1, label_c2l2 in zip(
+            df_eval["table_id"], df_eval["table_name"], df_eval["column_id"], df_eval["column_name"], df_eval["paths"],
+            df_eval["candidates"], *(df_eval[c] for c in label_columns)):
+        pred_paths = [[names[o] for o in path] for path in paths]
+        gt_paths = [[l for l in (l1, l2) if l != "-"] for l1, l2 in ((label_c1l1, label_c1l2), (label_c2l1, label_c2l2)) if l1 != "-"]
 
-        gt_paths = []
-        if label_c1l1 != "-":
-            gt_path = []
-            gt_path.append(label_c1l1)
-            if label_c1l2 != "-":
-                gt_path.append(label_c1l2)
-            gt_paths.append(pred_path)
-        if label_c2l1 != "-":
-            gt_path = []
-            gt_path.append(label_c2l1)
-            if label_c2l2 != "-":
-                gt_path.append(label_c2l2)
-            gt_paths.append(pred_path)
+        if candidates is not None:
+            # How many ground truth classes survived the candidate pre-filter of the retriever
+            hits, total = candidate_recall(candidates, gt_paths, ontology_dag)
+            candidate_hits += hits
+            candidate_total += total
 
         eval_json.append({
             "table_id": table_id,
             "table_name": table_name,
-            "column_id": column_id,
+            "column_id": int(column_id),
             "column_name": column_name,
             "pred_paths": pred_paths,
             "gt_paths": gt_paths
@@ -73,7 +71,7 @@ def main(cfg: DictConfig):
     path_macro_precision, path_macro_recall, path_macro_f1, path_micro_precision, path_micro_recall, path_micro_f1 = path_level_f1_precision_recall(eval_json)
     node_macro_precision, node_macro_recall, node_macro_f1, node_micro_precision, node_micro_recall, node_micro_f1 = node_level_f1_precision_recall(eval_json)
     
-    print(f"+++++++++++++++++Node Level+++++++++++++++++")
+    print(f"+++++++++++++++++Path Level+++++++++++++++++")
     print(f"\tMacro Precision: {path_macro_precision}")
     print(f"\tMacro Recall: {path_macro_recall}")
     print(f"\tMacro F1: {path_macro_f1}")
@@ -87,9 +85,12 @@ def main(cfg: DictConfig):
     print(f"\tMicro Precision: {node_micro_precision}")
     print(f"\tMicro Recall: {node_micro_recall}")
     print(f"\tMicro F1: {node_micro_f1}")
+    if candidate_total > 0:
+        print(f"+++++++++++++++++Candidate Pre-filter+++++++++++++++++")
+        print(f"\tCandidate Recall: {candidate_hits / candidate_total} ({candidate_hits}/{candidate_total})")
     
     with open(osp.join(results_dir, 'results.txt'), 'a') as f:
-        f.write(f"+++++++++++++++++Node Level+++++++++++++++++\n")
+        f.write(f"+++++++++++++++++Path Level+++++++++++++++++\n")
         f.write(f"\tMacro Precision: {path_macro_precision}\n")
         f.write(f"\tMacro Recall: {path_macro_recall}\n")
         f.write(f"\tMacro F1: {path_macro_f1}\n")
@@ -105,6 +106,9 @@ def main(cfg: DictConfig):
         f.write(f"\tMicro Precision: {node_micro_precision}\n")
         f.write(f"\tMicro Recall: {node_micro_recall}\n")
         f.write(f"\tMicro F1: {node_micro_f1}\n")
+        if candidate_total > 0:
+            f.write(f"+++++++++++++++++Candidate Pre-filter+++++++++++++++++\n")
+            f.write(f"\tCandidate Recall: {candidate_hits / candidate_total} ({candidate_hits}/{candidate_total})\n")
 
 @hydra.main(version_base=None, config_path=osp.join(root_path, "config"), config_name="config")
 def print_results(cfg: DictConfig):
@@ -118,7 +122,7 @@ def print_results(cfg: DictConfig):
         results_json = json.load(f)
     path_macro_precision, path_macro_recall, path_macro_f1, path_micro_precision, path_micro_recall, path_micro_f1 = path_level_f1_precision_recall(results_json)
     node_macro_precision, node_macro_recall, node_macro_f1, node_micro_precision, node_micro_recall, node_micro_f1 = node_level_f1_precision_recall(results_json)
-    print(f"+++++++++++++++++Node Level+++++++++++++++++")
+    print(f"+++++++++++++++++Path Level+++++++++++++++++")
     print(f"\tMacro Precision: {path_macro_precision}")
     print(f"\tMacro Recall: {path_macro_recall}")
     print(f"\tMacro F1: {path_macro_f1}")
@@ -0,0 +1,45 @@
+import os.path as osp
+import json
+
+import hydra
+from omegaconf import DictConfig
+
+from saed.data import load_labels, shard_dirs, find_shard_dirs, merge_predictions
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.join(here, "..", "..")
+
+@hydra.main(version_base=None, config_path=osp.join(root_path, "config"), config_name="config")
+def main(cfg: DictConfig):
+    """
+    Merges the predictions of a sharded run (`experiments.num_shards` > 1) into the canonical `predictions.json`
+    of the results directory, and reports the missing and duplicate columns in `merge_report.json`.
+    """
+    results_dir = osp.join(root_path, cfg['experiments']['outputs']['results']['dir'], cfg['llms']['name'])
+
+    num_shards = cfg['experiments'].get('num_shards', 1)
+    dirs = shard_dirs(results_dir, num_shards) if num_shards > 1 else find_shard_dirs(results_dir)
+    if not dirs:
+        raise FileNotFoundError(f"No shards in {results_dir}")
+
+    # The canonical order is the order of the labels, as in an unsharded run
+    df_labels = load_labels(cfg)
+    order = [(table_id, int(column_id)) for table_id, column_id in zip(df_labels['table_id'], df_labels['column_id'])]
+
+    report = merge_predictions(dirs, results_dir, order=order)
+    with open(osp.join(results_dir, "merge_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"Merged {report['predictions']} predictions of {len(report['shards'])} shards into {results_dir}")
+    for name in report['empty_shards']:
+        print(f"Warning: shard {name} has no predictions")
+    if report['missing']:
+        print(f"Warning: {len(report['missing'])} columns are missing, e.g. {report['missing'][:5]}")
+    if report['duplicates']:
+        conflicting = sum(duplicate['conflicting'] for duplicate in report['duplicates'])
+        print(f"Warning: {len(report['duplicates'])} columns are in several shards ({conflicting} with different paths), the first one is kept")
+    if report['unexpected']:
+        print(f"Warning: {len(report['unexpected'])} columns have no label")
+
+if __name__ == "__main__":
+    main()
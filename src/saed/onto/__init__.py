@@ -1,4 +1,18 @@
-from saed.onto.ontoclass import OntologyClass
-from saed.onto.ontodag import OntologyDAG
+import importlib
 
-__all__ = ['OntologyClass', 'OntologyDAG']
\ No newline at end of file
+# The submodules are imported on first access, so that e.g. the ontology DAG does not load numpy for the retriever
+_exports = {
+    'OntologyClass': 'saed.onto.ontoclass',
+    'OntologyDAG': 'saed.onto.ontodag',
+    'OntologyIndex': 'saed.onto.ontoindex',
+    'CandidateRetriever': 'saed.onto.retrieval',
+}
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(_exports[name]), name)
+    raise AttributeError(f"module 'saed.onto' has no attribute '{name}'")
+
+
+__all__ = list(_exports)
@@ -1,4 +1,6 @@
 class OntologyClass:
+    __slots__ = ('url', 'name', 'label', 'comment')
+
     def __init__(self, url: str, name: str=None, label: str=None, comment: str=None):
         """
         Represents a class in the ontology.
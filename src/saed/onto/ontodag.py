@@ -1,15 +1,19 @@
 import os
 import os.path as osp
+import hashlib
+import pickle
+import tempfile
 from collections import defaultdict
-import owlready2
-from owlready2 import Thing
 from omegaconf import DictConfig
 from saed.onto.ontoclass import OntologyClass
+from saed.onto.ontoindex import OntologyIndex
 
 here = osp.dirname(osp.abspath(__file__))
 root_path = osp.join(here, "../../../")
 # default_rdf_file_path = osp.join(here, "../../../data/ontology/BEO_clean.rdf")
 
+SNAPSHOT_VERSION = 1
+
 class OntologyDAG:
     def __init__(self, config: DictConfig):
         """
@@ -18,16 +22,23 @@ class OntologyDAG:
         Attributes:
             nodes (dict): A dictionary to store nodes with URL as keys and OntologyClass instances as values.
             edges (defaultdict): A dictionary to store edges, representing subclass relationships (parent to children).
+            index (OntologyIndex): The compact, array-backed view of the DAG used by the search.
         """
         self.rdf_file_path = osp.join(root_path, config["data"]["ontology"]["path"])
+        # Compiled snapshots of the DAG, keyed by the hash of the RDF file; None disables them
+        snapshot_dir = config["data"]["ontology"].get("snapshot_dir", "outputs/cache/ontology")
+        self.snapshot_dir = osp.join(root_path, snapshot_dir) if snapshot_dir else None
         self.nodes = {}  # Maps URL to OntologyClass
         self.edges_subclassof = defaultdict(list)  # Maps URL to list of child URLs
         self.edges = defaultdict(list)
         self.root = None
+        self.index = None
 
     def build_dag(self, rdf_file_path=None):
         """
         Builds the ontology DAG from an RDF file.
+        The DAG is loaded from a compiled snapshot if one exists for the current content of the RDF file,
+        otherwise it is parsed from the RDF file and a snapshot is written for the next runs.
 
         Args:
             rdf_file_path (str): The path to the RDF file containing the ontology.
@@ -35,11 +46,35 @@ class OntologyDAG:
         if rdf_file_path is not None:
             self.rdf_file_path = rdf_file_path
 
-        onto = owlready2.get_ontology(self.rdf_file_path).load()
+        if self.snapshot_dir is None:
+            self.build_dag_from_rdf()
+            return
+        snapshot_path = self.snapshot_path()
+        if osp.exists(snapshot_path):
+            try:
+                self.load_snapshot(snapshot_path)
+                return
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError, ValueError) as e:
+                print(f"Ignoring unreadable ontology snapshot {snapshot_path}: {e}")
+        self.build_dag_from_rdf()
+        self.save_snapshot(snapshot_path)
+
+    def build_dag_from_rdf(self):
+        """
+        Parses the RDF file with owlready2 and builds the DAG from its classes.
+        """
+        import owlready2
+        from owlready2 import Thing
+
+        self.nodes = {}
+        self.edges_subclassof = defaultdict(list)
+        # A world of its own, so that the classes of other loaded ontologies (e.g. a previous version) do not leak in
+        world = owlready2.World()
+        onto = world.get_ontology(self.rdf_file_path).load()
         for cls in onto.classes():
             url = cls.iri
-            self.nodes[url] = OntologyClass(url, name=cls.name, label=cls.label, comment=cls.comment)
-            for parent in cls.subclasses():
+            self.nodes[url] = OntologyClass(url, name=cls.name, label=[str(l) for l in cls.label], comment=[str(c) for c in cls.comment])
+            for parent in cls.subclasses(world=world):
                 if parent.iri == url:
                     continue
                 if self.edges_subclassof.get(parent.iri) is None:
@@ -51,7 +86,73 @@ class OntologyDAG:
             for child in children:
                 self.edges[child].append(parent)
         self.root = Thing.iri
+        self.index = OntologyIndex(self)
+
+    def rdf_hash(self) -> str:
+        sha = hashlib.sha256()
+        with open(self.rdf_file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def snapshot_path(self) -> str:
+        """
+        The snapshot file of the current RDF content; editing the RDF file changes the hash and invalidates the snapshot.
+        """
+        name = osp.splitext(osp.basename(self.rdf_file_path))[0]
+        return osp.join(self.snapshot_dir, f"{name}.{self.rdf_hash()[:16]}.v{SNAPSHOT_VERSION}.pkl")
+
+    def save_snapshot(self, snapshot_path: str):
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "root": self.root,
+            "nodes": [(c.url, c.name, c.label, c.comment) for c in self.nodes.values()],
+            "edges_subclassof": dict(self.edges_subclassof),
+            "edges": self.edges,
+        }
+        os.makedirs(osp.dirname(snapshot_path), exist_ok=True)
+        # Write atomically, concurrent jobs may build the same snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(snapshot_path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+
+    def load_snapshot(self, snapshot_path: str):
+        with open(snapshot_path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {snapshot['version']}")
+        self.nodes = {url: OntologyClass(url, name=name, label=label, comment=comment) for url, name, label, comment in snapshot["nodes"]}
+        self.edges_subclassof = defaultdict(list, snapshot["edges_subclassof"])
+        self.edges = snapshot["edges"]
+        self.root = snapshot["root"]
+        self.index = OntologyIndex(self)
         
+    def diff(self, other) -> dict:
+        """
+        Compares the DAG to `other`, e.g. the previous version of the ontology.
+
+        Args:
+            other (OntologyDAG): The DAG to compare to.
+        Returns:
+            dict: The URLs of the classes that were added and removed, and for every parent whose candidate classes
+                changed, the names of the children that were added and removed below it.
+        """
+        changed_parents = {}
+        for url in set(self.index.ids) | set(other.index.ids):
+            names = self.index.candidates(url)[0] if url in self.index.ids else ()
+            other_names = other.index.candidates(url)[0] if url in other.index.ids else ()
+            if names != other_names:
+                changed_parents[url] = {
+                    "added": [name for name in names if name not in other_names],
+                    "removed": [name for name in other_names if name not in names],
+                }
+        return {
+            "added": sorted(set(self.nodes) - set(other.nodes)),
+            "removed": sorted(set(other.nodes) - set(self.nodes)),
+            "changed_parents": changed_parents,
+        }
+
     def __repr__(self):
         return f"OntologyDAG(nodes={list(self.nodes.keys())}, edges={dict(self.edges)})"
 
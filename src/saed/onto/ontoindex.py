@@ -0,0 +1,61 @@
+from array import array
+from types import MappingProxyType
+
+
+class OntologyIndex:
+    """
+    A compact, read-only view of an OntologyDAG for the search.
+
+    Class URLs are interned to integer IDs and the subclass edges are stored in CSR layout: the children of class `i`
+    are `children[offsets[i]:offsets[i + 1]]`. For every parent, the candidate class names shown to the LLM and the
+    name -> ID map used to resolve its answer are precomputed once as immutable objects, so expanding a search node
+    does not allocate them again.
+    """
+
+    def __init__(self, ontology_dag):
+        """
+        Args:
+            ontology_dag (OntologyDAG): A built ontology DAG.
+        """
+        urls = list(ontology_dag.nodes)
+        if ontology_dag.root is not None and ontology_dag.root not in ontology_dag.nodes:
+            urls.append(ontology_dag.root)
+        self.urls = tuple(urls)
+        self.ids = MappingProxyType({url: i for i, url in enumerate(self.urls)})
+        self.names = tuple(ontology_dag.nodes[url].name if url in ontology_dag.nodes else None for url in self.urls)
+
+        offsets = array('q', [0])
+        children = array('q')
+        for url in self.urls:
+            children.extend(self.ids[child] for child in ontology_dag.edges.get(url, ()))
+            offsets.append(len(children))
+        self.offsets = offsets
+        self.children = children
+
+        candidate_names = []
+        candidate_ids = []
+        for i in range(len(self.urls)):
+            child_ids = self.children[self.offsets[i]:self.offsets[i + 1]]
+            candidate_names.append(tuple(self.names[c] for c in child_ids))
+            candidate_ids.append(MappingProxyType({self.names[c]: c for c in child_ids}))
+        self.candidate_names = tuple(candidate_names)
+        self.candidate_ids = tuple(candidate_ids)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def num_children(self, class_id: int) -> int:
+        return self.offsets[class_id + 1] - self.offsets[class_id]
+
+    def child_ids(self, class_id: int) -> memoryview:
+        return memoryview(self.children)[self.offsets[class_id]:self.offsets[class_id + 1]]
+
+    def candidates(self, url: str):
+        """
+        Returns the candidate class names below the class `url` and the map resolving them to class IDs.
+        """
+        class_id = self.ids[url]
+        return self.candidate_names[class_id], self.candidate_ids[class_id]
+
+    def __repr__(self):
+        return f"OntologyIndex(classes={len(self.urls)}, edges={len(self.children)})"
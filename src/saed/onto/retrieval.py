@@ -0,0 +1,153 @@
+import math
+import re
+import zlib
+import numpy as np
+
+NUM_FEATURES = 1 << 18
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits names such as 'EnergyUnit', 'energy_unit' or 'kWh-Meter' into lowercase words.
+    """
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    return [w for w in re.split(r"[^0-9A-Za-z]+", text.lower()) if w]
+
+
+def text_features(text: str) -> dict:
+    """
+    Counts the hashed word and character 3-gram features of `text`.
+    """
+    counts = {}
+    for word in tokenize(text):
+        features = ["w:" + word]
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8")) % NUM_FEATURES
+            counts[h] = counts.get(h, 0) + 1
+    return counts
+
+
+def column_values_from_markdown(table_in_markdown: str, column_name: str) -> list:
+    """
+    Extracts the example values of `column_name` from a table rendered by `dataframe_to_markdown`.
+    """
+    lines = table_in_markdown.split("\n")
+    if not lines:
+        return []
+    headers = [h.strip() for h in lines[0].strip().strip("|").split("|")]
+    if column_name not in headers:
+        return []
+    i = headers.index(column_name)
+    values = []
+    for line in lines[2:]:
+        cells = line.strip().strip("|").split("|")
+        if i < len(cells):
+            values.append(cells[i].strip())
+    return values
+
+
+class CandidateRetriever:
+    """
+    A local lexical index over the ontology classes that shrinks the candidate classes of a level before prompting.
+
+    Every class is represented by the TF-IDF vector of the word and character 3-gram features of its name,
+    labels and comments. The candidates below a parent are ranked by cosine similarity to the column name,
+    table name and example values, and only the best `top_k` plus a safety margin of `margin` are kept.
+    """
+
+    def __init__(self, ontology_dag, top_k: int = 20, margin: int = 10):
+        """
+        Args:
+            ontology_dag (OntologyDAG): A built ontology DAG.
+            top_k (int): The number of best ranked candidates to keep.
+            margin (int): Additional candidates kept below the top_k to limit the loss of recall.
+        """
+        self.index = ontology_dag.index
+        self.top_k = top_k
+        self.margin = margin
+
+        class_features = []
+        document_frequency = {}
+        for url in self.index.urls:
+            node = ontology_dag.nodes.get(url)
+            parts = []
+            if node is not None:
+                parts.append(node.name or "")
+                parts.extend(str(l) for l in (node.label or []))
+                parts.extend(str(c) for c in (node.comment or []))
+            features = text_features(" ".join(parts))
+            class_features.append(features)
+            for h in features:
+                document_frequency[h] = document_frequency.get(h, 0) + 1
+        num_classes = len(class_features)
+        self.idf = {h: math.log((num_classes + 1) / (df + 1)) + 1.0 for h, df in document_frequency.items()}
+
+        # CSR matrix of the L2-normalized class vectors
+        indptr = [0]
+        indices = []
+        data = []
+        for features in class_features:
+            weights = {h: (1.0 + math.log(tf)) * self.idf[h] for h, tf in features.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for h, w in weights.items():
+                indices.append(h)
+                data.append(w / norm)
+            indptr.append(len(indices))
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float32)
+
+    def query_vector(self, table_name: str, table_in_markdown: str, column_name: str) -> tuple:
+        """
+        The L2-normalized TF-IDF vector of a column as sparse (feature indices, weights) arrays, sorted by index.
+        """
+        # The column name counts twice, it is the most specific evidence
+        values = column_values_from_markdown(table_in_markdown, column_name)
+        features = text_features(" ".join([column_name, column_name, table_name] + values))
+        indices = np.asarray(sorted(features), dtype=np.int64)
+        weights = np.asarray([(1.0 + math.log(features[h])) * self.idf.get(h, 0.0) for h in indices.tolist()], dtype=np.float32)
+        norm = np.linalg.norm(weights)
+        return indices, weights / norm if norm > 0 else weights
+
+    def scores(self, class_ids, q: tuple) -> np.ndarray:
+        """
+        The cosine similarities of the classes `class_ids` to the sparse query vector `q`.
+        """
+        q_indices, q_weights = q
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        starts = self.indptr[class_ids]
+        lengths = self.indptr[class_ids + 1] - starts
+        if lengths.sum() == 0 or len(q_indices) == 0:
+            return np.zeros(len(class_ids), dtype=np.float32)
+        positions = np.repeat(starts - np.cumsum(np.concatenate(([0], lengths[:-1]))), lengths) + np.arange(lengths.sum())
+        # Look the features of the class rows up in the sorted features of the query
+        features = self.indices[positions]
+        matches = np.minimum(np.searchsorted(q_indices, features), len(q_indices) - 1)
+        products = np.where(q_indices[matches] == features, self.data[positions] * q_weights[matches], np.float32(0.0))
+        row = np.repeat(np.arange(len(class_ids)), lengths)
+        return np.bincount(row, weights=products, minlength=len(class_ids))
+
+    def select(self, parent_level_ontology_class: str, table_name: str, table_in_markdown: str, column_names) -> tuple:
+        """
+        Returns the candidate class names below `parent_level_ontology_class` worth asking the LLM about,
+        in their original order.
+
+        Args:
+            column_names (str or list): The column, or the columns of a batched prompt, being annotated.
+        """
+        parent_id = self.index.ids[parent_level_ontology_class]
+        candidate_names = self.index.candidate_names[parent_id]
+        keep = self.top_k + self.margin
+        if len(candidate_names) <= keep:
+            return candidate_names
+        if isinstance(column_names, str):
+            column_names = [column_names]
+        child_ids = np.frombuffer(self.index.child_ids(parent_id), dtype=np.int64)
+        selected = np.zeros(len(child_ids), dtype=bool)
+        for column_name in column_names:
+            scores = self.scores(child_ids, self.query_vector(table_name, table_in_markdown, column_name))
+            # Stable ranking keeps the ontology order among equal scores
+            selected[np.argsort(-scores, kind="stable")[:keep]] = True
+        return tuple(name for name, s in zip(candidate_names, selected) if s)
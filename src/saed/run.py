@@ -2,16 +2,16 @@ import os
 import os.path as osp
 import shutil
 import json
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import hydra
 from omegaconf import DictConfig, OmegaConf
 
 from saed.ensemble import DecisionMaker
-from saed.onto import OntologyDAG
-from saed.data import load_table_list, load_tables, load_labels
-from saed.utils import dataframe_to_markdown, bfs_search
+from saed.onto import OntologyDAG, CandidateRetriever
+from saed.data import load_table_list, load_tables, load_labels, PredictionStore, TableProvider, TableProfiler, shard_of, shard_name
+from saed.utils import TableContextCache, bfs_search, batch_bfs_search, ExpansionScheduler, call_context, deduplicate_columns, dedup_report
+from saed.utils import PreviousDecisions, record_expansions, context_digest
 
 here = osp.dirname(osp.abspath(__file__))
 root_path = osp.join(here, "..", "..")
@@ -24,52 +24,214 @@ def main(cfg: DictConfig):
     logs_dir = osp.join(root_path, cfg['experiments']['outputs']['logs']['dir'], cfg['llms']['name'])
     results_dir = osp.join(root_path, cfg['experiments']['outputs']['results']['dir'], cfg['llms']['name'])
     
-    if osp.exists(logs_dir):
-        shutil.rmtree(results_dir)
+    resume = cfg['experiments'].get('resume', False)
+    
+    # Optionally annotate only the tables of one shard, in a directory of its own, see merge.py
+    num_shards = cfg['experiments'].get('num_shards', 1)
+    shard_index = cfg['experiments'].get('shard_index', 0)
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Invalid shard index {shard_index} for {num_shards} shards")
+    if num_shards > 1:
+        logs_dir = osp.join(logs_dir, shard_name(shard_index, num_shards))
+        results_dir = osp.join(results_dir, shard_name(shard_index, num_shards))
+        print(f"Shard {shard_index + 1} of {num_shards}")
+    
+    # Optionally reuse the decisions of a previous run, before its results directory is overwritten
+    previous_decisions = None
+    incremental_cfg = cfg['experiments'].get('incremental', None)
+    if incremental_cfg is not None and incremental_cfg.get('enabled', False):
+        previous_dir = incremental_cfg.get('previous', None)
+        previous_dir = osp.join(root_path, previous_dir) if previous_dir else results_dir
+        previous_decisions = PreviousDecisions(previous_dir)
+        print(f"Incremental: {len(previous_decisions)} columns with recorded expansions in {previous_dir}")
+    
+    if osp.exists(logs_dir) and not resume:
+        shutil.rmtree(logs_dir)
     os.makedirs(logs_dir, exist_ok=True)
-    if osp.exists(results_dir):
+    if osp.exists(results_dir) and not resume:
         shutil.rmtree(results_dir)
     os.makedirs(results_dir, exist_ok=True)
     
+    # Stream every finished column to disk, skipping the columns of a previous run when resuming
+    prediction_store = PredictionStore(osp.join(results_dir, "predictions.jsonl"), resume=resume)
+    
     # Load the data
     df_table_list = load_table_list(cfg)
-    dict_tables = load_tables(cfg)
     df_labels = load_labels(cfg)
+    if num_shards > 1:
+        df_labels = df_labels[[shard_of(table_id, num_shards) == shard_index for table_id in df_labels['table_id']]]
+    if cfg['data']['tables'].get('lazy', False):
+        # Load only the tables referenced by the labels, and only the rows the prompt needs, on first use
+        dict_tables = TableProvider(cfg, table_ids=df_labels['table_id'].unique(), nrows=cfg['experiments']['k'],
+                                    sample_fraction=cfg['data']['tables'].get('sample_fraction', None),
+                                    cache_size=cfg['data']['tables'].get('cache_size', 16))
+    else:
+        dict_tables = load_tables(cfg, table_ids=df_labels['table_id'].unique() if num_shards > 1 else None)
     
     # Load the ontology
     ontology_dag = OntologyDAG(cfg)
     ontology_dag.build_dag()
     
+    if previous_decisions is not None:
+        previous_ontology = incremental_cfg.get('previous_ontology', None)
+        if previous_ontology:
+            previous_dag = OntologyDAG(cfg)
+            previous_dag.build_dag(osp.join(root_path, previous_ontology))
+            diff = ontology_dag.diff(previous_dag)
+            with open(osp.join(results_dir, "ontology_diff.json"), "w", encoding="utf-8") as f:
+                json.dump(diff, f, indent=4)
+            print(f"Ontology diff: {len(diff['added'])} classes added, {len(diff['removed'])} removed, "
+                  f"{len(diff['changed_parents'])} parents with changed candidates")
+        print(f"Incremental: {previous_decisions.stale_expansions(ontology_dag)} previous expansions have changed candidates")
+    
     # Create the decision maker
     decision_maker = DecisionMaker(cfg)
     
+    # Optionally shrink the candidate classes of every level with a local lexical index
+    retriever = None
+    retrieval_cfg = cfg['experiments'].get('retrieval', None)
+    if retrieval_cfg is not None and retrieval_cfg.get('enabled', False):
+        retriever = CandidateRetriever(ontology_dag, top_k=retrieval_cfg.get('top_k', 20), margin=retrieval_cfg.get('margin', 10))
+    
     # Config parameters
     k = cfg['experiments']['k']
     max_depth = cfg['experiments']['max_depth']
     
-    # Run the semantic annotation for each column in the tables
-    semantic_annotation_predictions = []
+    # Render each table once; optionally window wide tables around the target column
+    context_cfg = cfg['experiments'].get('context', None) or {}
+    # Optionally summarize every column over all rows of its table, in one streaming pass per file
+    profiler = None
+    profile_cfg = context_cfg.get('profile', None) or {}
+    if profile_cfg.get('enabled', False):
+        profiler = TableProfiler(cfg, cache_dir=profile_cfg.get('cache_dir', 'outputs/cache/profiles'),
+                                 chunksize=profile_cfg.get('chunksize', 100000), sample_size=profile_cfg.get('sample_size', 10),
+                                 kmv_size=profile_cfg.get('kmv_size', 1024))
+    table_contexts = TableContextCache(dict_tables, k, window=context_cfg.get('window', False),
+                                       max_neighbours=context_cfg.get('max_neighbours', 8),
+                                       token_budget=context_cfg.get('token_budget', 1000),
+                                       profiler=profiler, profile_mode=profile_cfg.get('mode', 'augment'))
+    
+    num_workers = cfg['experiments'].get('num_workers', 1)
+    batch_columns = cfg['experiments'].get('batch_columns', False)
+    
+    # Collect the columns to annotate
+    columns = []
     for index, row in df_labels.iterrows():
         table_id, column_name, column_id = row['table_id'], row['column_name'], int(row['column_id'])
-        print('Table ID:', table_id, 'Column Name:', column_name)
-        table = dict_tables[table_id]
         table_name = df_table_list[df_table_list["table_id"] == table_id]["table_name"].values[0]
-        table_in_markdown = dataframe_to_markdown(table, k)
-        paths= bfs_search(table_name, table_in_markdown, column_name, ontology_dag, decision_maker, max_depth)
-        semantic_annotation_predictions.append(
-            {
-                "table_id": table_id,
-                "table_name": table_name,
-                "column_name": column_name,
-                "column_id": column_id,
-                "paths": paths
-            }
-        )
-    # Convert the semantic_annotation_results to JSON format
-    semantic_annotation_predictions_json = json.dumps(semantic_annotation_predictions, indent=4)
-    # Save the JSON to a file
-    with open(osp.join(results_dir, "predictions.json"), 'w') as f:
-        f.write(semantic_annotation_predictions_json)
+        columns.append({"table_id": table_id, "table_name": table_name, "column_name": column_name, "column_id": column_id})
+    order = [(column["table_id"], column["column_id"]) for column in columns]
+    if resume:
+        columns = [column for column in columns if (column["table_id"], column["column_id"]) not in prediction_store]
+        print(f"Resuming: {len(prediction_store.completed)} columns done, {len(columns)} columns left")
+    
+    # Optionally search only one column per signature and reuse its paths for the identical columns
+    duplicates = {}
+    dedup_cfg = cfg['experiments'].get('dedup', None)
+    if dedup_cfg is not None and dedup_cfg.get('enabled', False):
+        groups = deduplicate_columns(columns, dict_tables, sample_size=dedup_cfg.get('sample_size', k),
+                                     match_values=dedup_cfg.get('match_values', 'exact'))
+        report = dedup_report(groups)
+        with open(osp.join(results_dir, "dedup_report.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"Deduplication: {report['columns']} columns, {report['signatures']} signatures, ratio {report['dedup_ratio']:.2%}")
+        columns = [group[0] for group in groups.values()]
+        duplicates = {(group[0]["table_id"], group[0]["column_id"]): group[1:] for group in groups.values()}
+    
+    saved_calls = [0]
+    reused_calls = [0]
+    
+    def new_trace(key, table_in_markdown):
+        if previous_decisions is not None:
+            return previous_decisions.seed(key, table_in_markdown)
+        return {"context_digest": context_digest(table_in_markdown)}
+    
+    def save_prediction(column, paths, trace=None):
+        prediction = {
+            "table_id": column["table_id"],
+            "table_name": column["table_name"],
+            "column_name": column["column_name"],
+            "column_id": column["column_id"],
+            "paths": paths
+        }
+        if trace:
+            saved_calls[0] += trace.get("saved_calls", 0)
+            reused_calls[0] += trace.get("reused_calls", 0)
+            # The expansions the paths depend on, to re-annotate incrementally when the ontology changes
+            prediction["context_digest"] = trace.get("context_digest")
+            prediction["expansions"] = record_expansions(trace)
+        if trace and "candidates" in trace:
+            # The candidates kept by the retriever, for measuring its recall in eval.py
+            prediction["candidates"] = trace["candidates"]
+        prediction_store.add(prediction)
+        for duplicate in duplicates.get((column["table_id"], column["column_id"]), []):
+            prediction_store.add({
+                **prediction,
+                "table_id": duplicate["table_id"],
+                "table_name": duplicate["table_name"],
+                "column_name": duplicate["column_name"],
+                "column_id": duplicate["column_id"],
+                "deduplicated_from": [column["table_id"], column["column_id"]]
+            })
+    
+    # Run the semantic annotation for each column in the tables
+    if batch_columns:
+        # Ask once per table and parent class about all columns still expanding under that parent
+        columns_per_table = defaultdict(list)
+        for column in columns:
+            columns_per_table[column["table_id"]].append(column)
+        
+        def annotate_table(table_columns):
+            table_id, table_name = table_columns[0]["table_id"], table_columns[0]["table_name"]
+            print('Table ID:', table_id, 'Columns:', len(table_columns))
+            table_in_markdown = table_contexts.get(table_id)
+            column_names = [column["column_name"] for column in table_columns]
+            traces = [new_trace((table_id, column["column_id"]), table_in_markdown) for column in table_columns]
+            # Batched calls serve all columns of the table, so their metrics are aggregated per table
+            with call_context(column=table_id):
+                table_paths = batch_bfs_search(table_name, table_in_markdown, column_names, ontology_dag, decision_maker, max_depth,
+                                               retriever=retriever, traces=traces)
+            return table_paths, traces
+        
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for table_columns, (table_paths, traces) in zip(columns_per_table.values(), executor.map(annotate_table, columns_per_table.values())):
+                for column, paths, trace in zip(table_columns, table_paths, traces):
+                    save_prediction(column, paths, trace)
+    elif num_workers > 1:
+        # Interleave the expansions of all columns on a shared pool of workers
+        columns_by_key = {(column["table_id"], column["column_id"]): column for column in columns}
+        scheduler = ExpansionScheduler(ontology_dag, decision_maker, max_depth, num_workers=num_workers, retriever=retriever,
+                                       on_column_done=lambda key, paths: save_prediction(columns_by_key[key], paths, scheduler.columns[key].trace))
+        for key, column in columns_by_key.items():
+            table_in_markdown = table_contexts.get(column["table_id"], column["column_name"])
+            scheduler.add_column(key, column["table_name"], table_in_markdown, column["column_name"], trace=new_trace(key, table_in_markdown))
+        scheduler.run()
+    else:
+        for column in columns:
+            print('Table ID:', column["table_id"], 'Column Name:', column["column_name"])
+            table_in_markdown = table_contexts.get(column["table_id"], column["column_name"])
+            trace = new_trace((column["table_id"], column["column_id"]), table_in_markdown)
+            with call_context(column=(column["table_id"], column["column_id"])):
+                paths = bfs_search(column["table_name"], table_in_markdown, column["column_name"], ontology_dag, decision_maker, max_depth,
+                                   retriever=retriever, trace=trace)
+            save_prediction(column, paths, trace)
+    prediction_store.close()
+    decision_maker.close()
+    
+    # Save the predictions in the order of the labels as a single JSON file as well
+    prediction_store.export_json(osp.join(results_dir, "predictions.json"), order=order)
+    
+    # Save the per-call metrics next to the predictions
+    decision_maker.metrics.save(results_dir)
+    decision_maker.metrics.print_summary()
+    print(f"Memoized expansions saved {saved_calls[0]} decisions")
+    if previous_decisions is not None:
+        print(f"Incremental: reused {reused_calls[0]} decisions of the previous run")
+    
+    for tier, llm in enumerate(decision_maker.tiers):
+        print(f'LLM client (tier {tier}):', llm.client.stats())
+    if decision_maker.llm.cache is not None:
+        print('LLM cache:', decision_maker.llm.cache.stats())
         
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
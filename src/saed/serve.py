@@ -0,0 +1,329 @@
+import io
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os.path as osp
+
+import pandas as pd
+import hydra
+from omegaconf import DictConfig, OmegaConf
+
+from saed.ensemble import DecisionMaker
+from saed.onto import OntologyDAG, CandidateRetriever
+from saed.utils import ExpansionScheduler, CallMetrics, dataframe_to_markdown, dataframe_to_markdown_window
+from saed.utils.instrumentation import percentile
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.join(here, "..", "..")
+
+
+class AnnotationRequest:
+    """
+    The columns of one table submitted to the AnnotationService, completed when all of them are annotated.
+    """
+
+    def __init__(self, request_id, table_id, table_name, columns):
+        self.request_id = request_id
+        self.table_id = table_id
+        self.table_name = table_name
+        self.columns = columns  # (column_id, column_name) pairs
+        self.paths = {}
+        self.error = None
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+
+    def predictions(self) -> list:
+        return [{
+            "table_id": self.table_id,
+            "table_name": self.table_name,
+            "column_name": column_name,
+            "column_id": column_id,
+            "paths": self.paths[column_id]
+        } for column_id, column_name in self.columns]
+
+
+class AnnotationService:
+    """
+    Annotates the columns of incoming tables with an ontology DAG and a decision maker that are loaded once.
+
+    The columns of requests arriving within `batch_window_s` of each other are micro-batched: they are searched
+    together on one ExpansionScheduler, so their expansions share the `num_workers` LLM requests in flight.
+    Up to `max_concurrent_batches` batches run at the same time.
+    """
+
+    def __init__(self, ontology_dag, decision_maker, max_depth, k=5, num_workers=4, retriever=None, window=False,
+                 max_neighbours=8, token_budget=1000, batch_window_s=0.05, max_batch_columns=64, max_concurrent_batches=2):
+        """
+        Args:
+            ontology_dag (OntologyDAG): The ontology to search.
+            decision_maker (DecisionMaker): The decision maker queried for every expansion.
+            max_depth (int): The maximum depth of the search.
+            k (int): The number of example rows shown in the prompts.
+            num_workers (int): The number of expansions of a batch running concurrently.
+            retriever (CandidateRetriever, optional): Pre-filters the candidate classes of every expansion.
+            window, max_neighbours, token_budget: The windowed rendering of wide tables, see `dataframe_to_markdown_window`.
+            batch_window_s (float): How long the first column of a batch waits for more columns.
+            max_batch_columns (int): The maximum number of columns of a batch.
+            max_concurrent_batches (int): The number of batches searched at the same time.
+        """
+        self.ontology_dag = ontology_dag
+        self.decision_maker = decision_maker
+        self.max_depth = max_depth
+        self.k = k
+        self.num_workers = num_workers
+        self.retriever = retriever
+        self.window = window
+        self.max_neighbours = max_neighbours
+        self.token_budget = token_budget
+        self.batch_window_s = batch_window_s
+        self.max_batch_columns = max_batch_columns
+
+        self._queue = deque()  # (request, column_id, column_name, table_in_markdown)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._request_ids = itertools.count()
+        self._batch_slots = threading.Semaphore(max_concurrent_batches)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self._in_flight = 0
+        self._stats = {"requests": 0, "columns": 0, "batches": 0, "errors": 0}
+        self._latencies = deque(maxlen=10000)
+        self._batch_sizes = deque(maxlen=10000)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="saed-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, table: pd.DataFrame, table_name: str, column_names=None, table_id=None) -> AnnotationRequest:
+        """
+        Queues the columns `column_names` (by default all columns) of `table` for annotation.
+        """
+        columns = list(table.columns)
+        # Columns are identified by name in the request and by position in the results, so both must be unique
+        duplicate_headers = sorted({str(c) for c in columns if columns.count(c) > 1})
+        if duplicate_headers:
+            raise ValueError(f"Duplicate columns in the table: {duplicate_headers}")
+        if column_names is None:
+            column_names = columns
+        duplicates = sorted({str(c) for c in column_names if list(column_names).count(c) > 1})
+        if duplicates:
+            raise ValueError(f"Columns requested more than once: {duplicates}")
+        positions = {column_name: i for i, column_name in enumerate(columns)}
+        missing = [column_name for column_name in column_names if column_name not in positions]
+        if missing:
+            raise KeyError(f"Columns not in the table: {missing}")
+        request = AnnotationRequest(next(self._request_ids), table_id, table_name,
+                                    [(positions[column_name], column_name) for column_name in column_names])
+        table_in_markdown = None if self.window else dataframe_to_markdown(table, self.k)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The annotation service is closed")
+            for column_id, column_name in request.columns:
+                if self.window:
+                    context = dataframe_to_markdown_window(table, self.k, column_name, self.max_neighbours, self.token_budget)
+                else:
+                    context = table_in_markdown
+                self._queue.append((request, column_id, column_name, context))
+            self._stats["requests"] += 1
+            self._stats["columns"] += len(request.columns)
+            self._condition.notify_all()
+        if not request.columns:
+            request.done.set()
+        return request
+
+    def annotate(self, table: pd.DataFrame, table_name: str, column_names=None, table_id=None, timeout=None) -> list:
+        """
+        Annotates the columns of `table` and returns their predictions, in the format of `predictions.json`.
+        """
+        request = self.submit(table, table_name, column_names, table_id)
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"Request {request.request_id} did not finish within {timeout}s")
+        if request.error is not None:
+            raise request.error
+        return request.predictions()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                # Give the columns arriving shortly after the first one the chance to join its batch
+                deadline = time.monotonic() + self.batch_window_s
+                while len(self._queue) < self.max_batch_columns and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch_columns, len(self._queue)))]
+                self._in_flight += len(batch)
+            self._batch_slots.acquire()
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        # Register every request of the batch first, so that all of them are failed if the batch fails
+        requests = {}
+        remaining = {}
+        for request, _, _, _ in batch:
+            requests[request.request_id] = request
+            remaining[request.request_id] = remaining.get(request.request_id, 0) + 1
+        try:
+            def on_column_done(key, paths):
+                request_id, column_id = key
+                request = requests[request_id]
+                request.paths[column_id] = paths
+                remaining[request_id] -= 1
+                if remaining[request_id] == 0:
+                    self._finish(request)
+
+            scheduler = ExpansionScheduler(self.ontology_dag, self.decision_maker, self.max_depth, num_workers=self.num_workers,
+                                           on_column_done=on_column_done, retriever=self.retriever)
+            for request, column_id, column_name, table_in_markdown in batch:
+                scheduler.add_column((request.request_id, column_id), request.table_name, table_in_markdown, column_name)
+            scheduler.run()
+        except Exception as e:
+            print(f"Annotation batch failed: {e}")
+            with self._condition:
+                self._stats["errors"] += 1
+            for request in requests.values():
+                if not request.done.is_set():
+                    request.error = e
+                    request.done.set()
+        finally:
+            with self._condition:
+                self._in_flight -= len(batch)
+                self._stats["batches"] += 1
+                self._batch_sizes.append(len(batch))
+            self._batch_slots.release()
+
+    def _finish(self, request):
+        # The columns of a request may be split over several batches
+        if len(request.paths) < len(request.columns):
+            return
+        with self._condition:
+            self._latencies.append(time.perf_counter() - request.submitted)
+        request.done.set()
+
+    def stats(self) -> dict:
+        with self._condition:
+            latencies = list(self._latencies)
+            batch_sizes = list(self._batch_sizes)
+            stats = dict(self._stats, queue_depth=len(self._queue), in_flight_columns=self._in_flight)
+        stats["latency_s"] = {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99)}
+        stats["mean_batch_columns"] = sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0
+        summary = self.decision_maker.metrics.summary()
+        stats["llm"] = {"calls": summary["calls"], "cached_calls": summary["cached_calls"], "latency_s": summary["latency_s"]}
+        return stats
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        self.decision_maker.close()
+
+
+def read_table(body: dict) -> pd.DataFrame:
+    """
+    The table of a request body, either as CSV text in "csv" or as {"columns": [...], "data": [[...], ...]} in "table".
+    """
+    if "csv" in body:
+        return pd.read_csv(io.StringIO(body["csv"]))
+    if "table" in body:
+        return pd.DataFrame(body["table"]["data"], columns=body["table"]["columns"])
+    raise ValueError('The request needs a "csv" or a "table"')
+
+
+def make_handler(service: AnnotationService, timeout=None):
+    class AnnotationHandler(BaseHTTPRequestHandler):
+        """
+        POST /annotate  {"table_name": ..., "table_id": ..., "csv": ... or "table": {...}, "columns": [...]}
+                        -> {"predictions": [...]}, the columns default to all columns of the table
+        GET  /stats     -> latency, queue depth, batch and LLM call statistics
+        GET  /health    -> {"status": "ok"}
+        """
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, service.stats())
+            elif self.path == "/health":
+                self.send_json(200, {"status": "ok"})
+            else:
+                self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/annotate":
+                self.send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                table = read_table(body)
+                table_name = body.get("table_name", body.get("table_id", ""))
+                predictions = service.annotate(table, table_name, body.get("columns"), body.get("table_id"), timeout=timeout)
+            except (ValueError, KeyError) as e:
+                self.send_json(400, {"error": str(e)})
+            except TimeoutError as e:
+                self.send_json(504, {"error": str(e)})
+            except Exception as e:
+                self.send_json(500, {"error": str(e)})
+            else:
+                self.send_json(200, {"predictions": predictions})
+
+        def log_message(self, format, *args):
+            pass
+
+    return AnnotationHandler
+
+
+@hydra.main(version_base=None, config_path=osp.join(root_path, "config"), config_name="config")
+def main(cfg: DictConfig):
+
+    print(OmegaConf.to_yaml(cfg))
+
+    serve_cfg = cfg['experiments'].get('serve', None) or {}
+
+    # Load the ontology and create the decision maker once for all requests
+    ontology_dag = OntologyDAG(cfg)
+    ontology_dag.build_dag()
+    decision_maker = DecisionMaker(cfg, metrics=CallMetrics(max_records=serve_cfg.get('max_metric_records', 100000)))
+
+    retriever = None
+    retrieval_cfg = cfg['experiments'].get('retrieval', None)
+    if retrieval_cfg is not None and retrieval_cfg.get('enabled', False):
+        retriever = CandidateRetriever(ontology_dag, top_k=retrieval_cfg.get('top_k', 20), margin=retrieval_cfg.get('margin', 10))
+
+    context_cfg = cfg['experiments'].get('context', None) or {}
+    service = AnnotationService(
+        ontology_dag, decision_maker, cfg['experiments']['max_depth'], k=cfg['experiments']['k'],
+        num_workers=max(1, cfg['experiments'].get('num_workers', 1)), retriever=retriever,
+        window=context_cfg.get('window', False), max_neighbours=context_cfg.get('max_neighbours', 8),
+        token_budget=context_cfg.get('token_budget', 1000),
+        batch_window_s=serve_cfg.get('batch_window_ms', 50) / 1000,
+        max_batch_columns=serve_cfg.get('max_batch_columns', 64),
+        max_concurrent_batches=serve_cfg.get('max_concurrent_batches', 2),
+    )
+    host, port = serve_cfg.get('host', '127.0.0.1'), serve_cfg.get('port', 8080)
+    server = ThreadingHTTPServer((host, port), make_handler(service, timeout=serve_cfg.get('request_timeout_s', None)))
+    print(f"Serving annotations on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from saed.utils.utils import *
+import importlib
 
 
 # __init__.py
@@ -8,4 +8,32 @@ from saed.utils.utils import *
 # You can import utility functions or classes here to make them available
 # when importing the 'utils' package.
 
-__all__ = ['dataframe_to_markdown', 'bfs_search', 'path_level_f1_precision_recall', 'node_level_f1_precision_recall']
+# The submodules are imported on first access, so that e.g. the metrics do not load pandas
+_exports = {
+    'dataframe_to_markdown': 'saed.utils.utils',
+    'dataframe_to_markdown_window': 'saed.utils.context',
+    'TableContextCache': 'saed.utils.context',
+    'bfs_search': 'saed.utils.search',
+    'batch_bfs_search': 'saed.utils.search',
+    'expand_search_node': 'saed.utils.search',
+    'ExpansionScheduler': 'saed.utils.scheduler',
+    'deduplicate_columns': 'saed.utils.dedup',
+    'dedup_report': 'saed.utils.dedup',
+    'PreviousDecisions': 'saed.utils.incremental',
+    'record_expansions': 'saed.utils.incremental',
+    'context_digest': 'saed.utils.incremental',
+    'CallMetrics': 'saed.utils.instrumentation',
+    'call_context': 'saed.utils.instrumentation',
+    'path_level_f1_precision_recall': 'saed.utils.metrics',
+    'node_level_f1_precision_recall': 'saed.utils.metrics',
+    'candidate_recall': 'saed.utils.metrics',
+}
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(_exports[name]), name)
+    raise AttributeError(f"module 'saed.utils' has no attribute '{name}'")
+
+
+__all__ = list(_exports)
@@ -0,0 +1,121 @@
+import re
+import threading
+import pandas as pd
+
+from saed.utils.utils import dataframe_to_markdown
+from saed.utils.instrumentation import estimate_tokens
+from saed.data.profile import profile_to_markdown
+
+
+def column_name_tokens(column_name) -> set:
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(column_name))
+    return {w for w in re.split(r"[^0-9A-Za-z]+", text.lower()) if w}
+
+
+def dataframe_to_markdown_window(df: pd.DataFrame, k: int, column_name: str, max_neighbours: int = 8, token_budget: int = 1000):
+    """
+    Renders the first `k` rows of the target column plus its most relevant neighbour columns as a markdown table.
+
+    Neighbours are ranked by the words their names share with the target column, then by their distance to it
+    in the table. They are added in that order as long as the estimated tokens of the rendered table stay within
+    `token_budget` and at most `max_neighbours` are shown. The columns keep their original order.
+    """
+    if column_name not in list(df.columns):
+        return dataframe_to_markdown(df, k)
+    return dataframe_to_markdown(df.iloc[:, window_columns(df, k, column_name, max_neighbours, token_budget)], k)
+
+
+def window_columns(df: pd.DataFrame, k: int, column_name: str, max_neighbours: int = 8, token_budget: int = 1000) -> list:
+    """
+    The positions of the columns shown by `dataframe_to_markdown_window`, in their original order.
+    """
+    columns = list(df.columns)
+    subset = df.head(k)
+    target = columns.index(column_name)
+    target_tokens = column_name_tokens(column_name)
+
+    def cost(i):
+        # Header cell, separator cell and the k value cells of column i
+        cells = [str(columns[i]), "---"] + [str(v) for v in subset.iloc[:, i].tolist()]
+        return estimate_tokens(" | ".join(cells)) + len(cells)
+
+    neighbours = sorted(
+        (i for i in range(len(columns)) if i != target),
+        key=lambda i: (-len(target_tokens & column_name_tokens(columns[i])), abs(i - target), i),
+    )
+    selected = [target]
+    used = cost(target)
+    for i in neighbours:
+        if len(selected) - 1 >= max_neighbours:
+            break
+        c = cost(i)
+        if used + c > token_budget:
+            continue
+        selected.append(i)
+        used += c
+    return sorted(selected)
+
+
+class TableContextCache:
+    """
+    Renders the prompt context of each table once and reuses it for all of its columns, levels and agents.
+
+    In the windowed mode every column gets its own rendering with only the most relevant neighbour columns,
+    see `dataframe_to_markdown_window`. With a profiler, a summary of every shown column over all rows of the table
+    is added below the example rows ("augment"), or replaces them ("replace").
+    """
+
+    def __init__(self, tables, k: int = 5, window: bool = False, max_neighbours: int = 8, token_budget: int = 1000,
+                 profiler=None, profile_mode: str = "augment"):
+        """
+        Args:
+            tables (dict or TableProvider): The tables, keyed by table ID.
+            k (int): The number of example rows.
+            window (bool): Render only the target column and its most relevant neighbours for wide tables.
+            max_neighbours (int): The maximum number of neighbour columns in the windowed mode.
+            token_budget (int): The estimated token budget of a windowed table.
+            profiler (TableProfiler, optional): Profiles the tables for the column summaries.
+            profile_mode (str): "augment" adds the column summaries to the example rows, "replace" shows only them.
+        """
+        if profile_mode not in ("augment", "replace"):
+            raise ValueError(f"Invalid profile mode {profile_mode}")
+        self.tables = tables
+        self.k = k
+        self.window = window
+        self.max_neighbours = max_neighbours
+        self.token_budget = token_budget
+        self.profiler = profiler
+        self.profile_mode = profile_mode
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def get(self, table_id, column_name=None) -> str:
+        """
+        Returns the table `table_id` in markdown, windowed around `column_name` in the windowed mode.
+        """
+        key = (table_id, column_name if self.window and column_name is not None else None)
+        with self._lock:
+            if key in self._contexts:
+                return self._contexts[key]
+        if self.profiler is not None:
+            context = self.render_with_profile(table_id, key[1])
+        elif key[1] is None:
+            context = dataframe_to_markdown(self.tables[table_id], self.k)
+        else:
+            context = dataframe_to_markdown_window(self.tables[table_id], self.k, column_name, self.max_neighbours, self.token_budget)
+        with self._lock:
+            return self._contexts.setdefault(key, context)
+
+    def render_with_profile(self, table_id, column_name=None) -> str:
+        profile = self.profiler.get(table_id)
+        columns = None
+        table = None
+        if column_name is not None or self.profile_mode == "augment":
+            table = self.tables[table_id]
+            if column_name is not None and column_name in list(table.columns):
+                table = table.iloc[:, window_columns(table, self.k, column_name, self.max_neighbours, self.token_budget)]
+            columns = [str(c) for c in table.columns]
+        summary = f"Column summaries over all {profile['rows']} rows:\n{profile_to_markdown(profile, columns)}"
+        if self.profile_mode == "replace":
+            return summary
+        return f"{dataframe_to_markdown(table, self.k)}\n\n{summary}"
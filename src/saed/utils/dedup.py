@@ -0,0 +1,71 @@
+import re
+import hashlib
+from collections import OrderedDict
+
+
+def table_name_pattern(table_name: str) -> str:
+    """
+    Replaces every run of digits by '#', so that e.g. 'meter_2023_01' and 'meter_2023_02' share the pattern 'meter_#_#'.
+    """
+    return re.sub(r"\d+", "#", str(table_name))
+
+
+def column_signature(table_name: str, column_name: str, dtype, values, match_values: str = "exact") -> str:
+    """
+    Fingerprints a column from its table name pattern, name, dtype and a hash of its sampled values.
+
+    Args:
+        values (list): The sampled values of the column, e.g. the example rows shown in the prompt.
+        match_values (str): "exact" hashes the values themselves, "pattern" only their shapes
+            (digits replaced as in `table_name_pattern`), so e.g. timestamps of different months match.
+    """
+    values = [str(v) for v in values]
+    if match_values == "pattern":
+        values = [table_name_pattern(v) for v in values]
+    elif match_values != "exact":
+        raise ValueError(f"Unknown value matching: {match_values}")
+    values_hash = hashlib.sha256("\x1f".join(values).encode("utf-8")).hexdigest()[:16]
+    return "|".join([table_name_pattern(table_name), str(column_name), str(dtype), values_hash])
+
+
+def deduplicate_columns(columns: list, tables, sample_size: int = 5, match_values: str = "exact"):
+    """
+    Groups the columns to annotate by their signature.
+
+    Args:
+        columns (list): The columns, dicts with table_id, table_name, column_name and column_id.
+        tables (dict or TableProvider): The tables, keyed by table ID.
+        sample_size (int): The number of leading values of a column that are hashed.
+        match_values (str): See `column_signature`.
+    Returns:
+        OrderedDict: The columns of every signature, in the order of their first column. The first column of a
+            group is the one that is searched, its paths are reused for the other columns of the group.
+    """
+    groups = OrderedDict()
+    for column in columns:
+        table = tables[column["table_id"]]
+        if column["column_name"] in table.columns:
+            series = table[column["column_name"]]
+        else:
+            series = table.iloc[:, column["column_id"]]
+        signature = column_signature(column["table_name"], column["column_name"], series.dtype,
+                                     series.head(sample_size).tolist(), match_values)
+        groups.setdefault(signature, []).append(column)
+    return groups
+
+
+def dedup_report(groups) -> dict:
+    """
+    Summarizes the deduplication: the number of columns and signatures, the share of searches saved
+    and the groups with more than one column.
+    """
+    num_columns = sum(len(group) for group in groups.values())
+    return {
+        "columns": num_columns,
+        "signatures": len(groups),
+        "dedup_ratio": 1 - len(groups) / num_columns if num_columns else 0.0,
+        "groups": [
+            {"signature": signature, "columns": [[column["table_id"], column["column_id"]] for column in group]}
+            for signature, group in groups.items() if len(group) > 1
+        ],
+    }
@@ -0,0 +1,70 @@
+import hashlib
+
+from saed.data.store import iter_predictions
+
+
+def context_digest(table_in_markdown: str) -> str:
+    """
+    A short digest of the table context shown to the LLM; decisions are only reused for the same context.
+    """
+    return hashlib.sha256(table_in_markdown.encode("utf-8")).hexdigest()[:16]
+
+
+def record_expansions(trace: dict) -> list:
+    """
+    The expansions a column depended on, as stored in its prediction: the parent class, the candidate classes
+    the decision maker was asked about, and its answer. They are sorted, as the ExpansionScheduler memoizes the
+    decisions in the order they finish.
+    """
+    return [{"parent": parent, "candidates": list(candidates), "result": result}
+            for (parent, candidates), result in sorted(trace.get("decisions", {}).items())]
+
+
+class PreviousDecisions:
+    """
+    The decisions of a previous run, used to re-annotate the columns incrementally after the ontology changed.
+
+    The search memoizes its decisions by (parent class, candidate classes), see `expand_search_node`. Seeding the
+    trace of a column with the expansions recorded in its previous prediction reuses every decision whose candidate
+    classes are unchanged, so only the expansions below edited parts of the ontology are sent to the LLM again.
+    """
+
+    def __init__(self, results_dir: str):
+        """
+        Args:
+            results_dir (str): The results directory of the previous run, with `predictions.jsonl` or `predictions.json`.
+        """
+        self.columns = {}
+        for prediction in iter_predictions(results_dir):
+            if "expansions" not in prediction:
+                continue
+            decisions = {(expansion["parent"], tuple(expansion["candidates"])): expansion["result"]
+                         for expansion in prediction["expansions"]}
+            self.columns[(prediction["table_id"], prediction["column_id"])] = (prediction.get("context_digest"), decisions)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def seed(self, key, table_in_markdown: str) -> dict:
+        """
+        The trace to search the column `key` with, holding the previous decisions of the column if its table
+        context is unchanged.
+        """
+        digest = context_digest(table_in_markdown)
+        trace = {"context_digest": digest}
+        previous = self.columns.get(key)
+        if previous is not None and previous[0] == digest:
+            trace["previous_decisions"] = previous[1]
+        return trace
+
+    def stale_expansions(self, ontology_dag) -> int:
+        """
+        The number of previous expansions whose candidate classes are different in `ontology_dag`, i.e. the
+        decisions that cannot be reused (before the retriever, which may shrink the candidates further).
+        """
+        stale = 0
+        for _, decisions in self.columns.values():
+            for parent, candidates in decisions:
+                if parent not in ontology_dag.index.ids or ontology_dag.index.candidates(parent)[0] != candidates:
+                    stale += 1
+        return stale
@@ -0,0 +1,193 @@
+import os.path as osp
+import json
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+_call_context = contextvars.ContextVar("saed_call_context", default={})
+
+
+@contextmanager
+def call_context(**fields):
+    """
+    Attaches fields such as the column, ontology level or agent index to every call recorded inside the block.
+    The fields follow the current context into threads started with `contextvars.copy_context().run`.
+    """
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_context() -> dict:
+    return dict(_call_context.get())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A rough token count for backends that do not report usage, about four characters per token.
+    """
+    return max(1, len(text) // 4) if text else 0
+
+
+def percentile(values, q: float) -> float:
+    """
+    The q-th percentile (0 <= q <= 100) of `values` with linear interpolation.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def context_key(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return "/".join(str(v) for v in value)
+    return str(value)
+
+
+class CallMetrics:
+    """
+    Collects one record per LLM call and per level decision of a run.
+
+    Every record holds the wall latency, the prompt and completion tokens (reported by the backend when available,
+    estimated otherwise) and the context fields active when it was recorded: experiment mode, column, ontology level
+    and agent index.
+    """
+
+    def __init__(self, max_records: int = None):
+        """
+        Args:
+            max_records (int, optional): Keep only the latest records, e.g. in a long-running server.
+        """
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, **fields):
+        """
+        Args:
+            kind (str): "llm" for a call to the backend, "decision" for a decision on one ontology level,
+                "ensemble" for the agents assigned and queried by one ensemble decision,
+                "escalation" for a decision handed to the next tier of a cascade.
+        """
+        record = {"kind": kind, **current_context(), **fields}
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+        llm_calls = [r for r in records if r["kind"] == "llm"]
+        decisions = [r for r in records if r["kind"] == "decision"]
+        ensembles = [r for r in records if r["kind"] == "ensemble"]
+        escalations = [r for r in records if r["kind"] == "escalation"]
+        # Cache hits take no time at the backend, the latencies are those of the calls that reached it
+        uncached_calls = [r for r in llm_calls if not r.get("cached")]
+        latencies = [r["latency_s"] for r in uncached_calls]
+        times_to_answer = [r.get("time_to_answer_s", r["latency_s"]) for r in uncached_calls]
+
+        columns = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0})
+        calls_per_level = defaultdict(int)
+        for r in llm_calls:
+            column = columns[context_key(r.get("column"))]
+            column["calls"] += 1
+            column["prompt_tokens"] += r.get("prompt_tokens", 0)
+            column["completion_tokens"] += r.get("completion_tokens", 0)
+            column["latency_s"] += r["latency_s"]
+            calls_per_level[str(r.get("level"))] += 1
+        calls_per_tier = defaultdict(int)
+        latencies_per_tier = defaultdict(list)
+        for r in llm_calls:
+            calls_per_tier[str(r.get("tier", 0))] += 1
+            if not r.get("cached"):
+                latencies_per_tier[str(r.get("tier", 0))].append(r["latency_s"])
+        escalations_per_reason = defaultdict(int)
+        for r in escalations:
+            escalations_per_reason[r["reason"]] += 1
+        num_decided_columns = sum(r.get("num_columns", 1) for r in decisions)
+        tokens_per_column = [c["prompt_tokens"] + c["completion_tokens"] for c in columns.values()]
+        decision_latencies = [r["latency_s"] for r in decisions]
+        return {
+            "calls": len(llm_calls),
+            "cached_calls": len(llm_calls) - len(uncached_calls),
+            "uncached_calls": len(uncached_calls),
+            "latency_s": {
+                "total": sum(latencies),
+                "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+            },
+            "time_to_answer_s": {
+                "p50": percentile(times_to_answer, 50),
+                "p95": percentile(times_to_answer, 95),
+            },
+            "stopped_at_answer": sum(1 for r in llm_calls if r.get("stopped_at_answer")),
+            "decision_latency_s": {
+                "p50": percentile(decision_latencies, 50),
+                "p95": percentile(decision_latencies, 95),
+            },
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in llm_calls),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in llm_calls),
+            "estimated_token_calls": sum(1 for r in llm_calls if r.get("tokens_estimated")),
+            "retries": sum(r.get("retries", 0) for r in llm_calls),
+            "throttled_s": sum(r.get("throttled_s", 0.0) for r in llm_calls),
+            "tokens_per_column": {
+                "mean": sum(tokens_per_column) / len(tokens_per_column) if tokens_per_column else 0.0,
+                "p50": percentile(tokens_per_column, 50),
+                "p95": percentile(tokens_per_column, 95),
+            },
+            "calls_per_level": dict(calls_per_level),
+            "agents": {
+                "assigned": sum(r["num_agents"] for r in ensembles),
+                "queried": sum(r["queried_agents"] for r in ensembles),
+            },
+            "tiers": {
+                tier: {"calls": calls, "cached_calls": calls - len(latencies_per_tier[tier]),
+                       "latency_s": {"total": sum(latencies_per_tier[tier]), "p50": percentile(latencies_per_tier[tier], 50),
+                                     "p95": percentile(latencies_per_tier[tier], 95)}}
+                for tier, calls in sorted(calls_per_tier.items())
+            },
+            "escalations": {
+                "count": len(escalations),
+                "rate": sum(1 for r in escalations if r["from_tier"] == 0) / num_decided_columns if num_decided_columns else 0.0,
+                "reasons": dict(escalations_per_reason),
+            },
+            "columns": dict(columns),
+        }
+
+    def save(self, results_dir: str) -> dict:
+        """
+        Writes every record to `metrics.jsonl` and the aggregates to `metrics_summary.json` in `results_dir`.
+        """
+        with self._lock:
+            records = list(self.records)
+        with open(osp.join(results_dir, "metrics.jsonl"), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+        summary = self.summary()
+        with open(osp.join(results_dir, "metrics_summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"+++++++++++++++++LLM Calls+++++++++++++++++")
+        print(f"\tCalls: {summary['calls']} ({summary['cached_calls']} cached)")
+        print(f"\tLatency of the {summary['uncached_calls']} uncached calls p50: {summary['latency_s']['p50']:.3f}s p95: {summary['latency_s']['p95']:.3f}s total: {summary['latency_s']['total']:.1f}s")
+        print(f"\tTime to answer p50: {summary['time_to_answer_s']['p50']:.3f}s p95: {summary['time_to_answer_s']['p95']:.3f}s ({summary['stopped_at_answer']} streams stopped at the answer)")
+        print(f"\tPrompt tokens: {summary['prompt_tokens']} Completion tokens: {summary['completion_tokens']}")
+        print(f"\tTokens per column mean: {summary['tokens_per_column']['mean']:.0f} p95: {summary['tokens_per_column']['p95']:.0f}")
+        print(f"\tCalls per level: {summary['calls_per_level']}")
+        if summary['retries'] or summary['throttled_s']:
+            print(f"\tRetries: {summary['retries']} Throttled: {summary['throttled_s']:.1f}s")
+        if len(summary['tiers']) > 1 or summary['escalations']['count']:
+            for tier, t in summary['tiers'].items():
+                print(f"\tTier {tier}: {t['calls']} calls, latency p50: {t['latency_s']['p50']:.3f}s p95: {t['latency_s']['p95']:.3f}s")
+            print(f"\tEscalation rate: {summary['escalations']['rate']:.2%} {summary['escalations']['reasons']}")
+        if summary['agents']['assigned']:
+            print(f"\tAgents queried: {summary['agents']['queried']} of {summary['agents']['assigned']} assigned")
@@ -0,0 +1,107 @@
+import numpy as np
+
+__all__ = ['path_level_f1_precision_recall', 'node_level_f1_precision_recall', 'candidate_recall']
+
+
+def path_level_f1_precision_recall(data):
+    """
+    Calculate micro and macro precision, recall, and F1
+    """
+    return set_level_f1_precision_recall(data, lambda paths: {tuple(p) for p in paths})
+
+
+def set_level_f1_precision_recall(data, to_set):
+    """
+    Calculate micro and macro precision, recall, and F1 of the sets `to_set(row['pred_paths'])` against
+    `to_set(row['gt_paths'])` of every row.
+    The set elements are interned to integer IDs and the per-row counts are computed with NumPy.
+    """
+    vocabulary = {}
+    pred_rows, pred_items, gt_rows, gt_items = [], [], [], []
+    num_rows = 0
+    for row in data:
+        for item in to_set(row['pred_paths']):
+            pred_rows.append(num_rows)
+            pred_items.append(vocabulary.setdefault(item, len(vocabulary)))
+        for item in to_set(row['gt_paths']):
+            gt_rows.append(num_rows)
+            gt_items.append(vocabulary.setdefault(item, len(vocabulary)))
+        num_rows += 1
+    return interned_f1_precision_recall(np.asarray(pred_rows, dtype=np.int64), np.asarray(pred_items, dtype=np.int64),
+                                        np.asarray(gt_rows, dtype=np.int64), np.asarray(gt_items, dtype=np.int64), num_rows)
+
+
+def interned_f1_precision_recall(pred_rows, pred_items, gt_rows, gt_items, num_rows):
+    """
+    Calculate micro and macro precision, recall, and F1 from (row, item ID) pairs of the predictions and the ground truth.
+
+    Args:
+        pred_rows, pred_items (np.ndarray): The row and interned item ID of every predicted item.
+        gt_rows, gt_items (np.ndarray): The row and interned item ID of every ground truth item.
+        num_rows (int): The number of rows, rows without any item count with precision and recall 0.
+    """
+    if num_rows == 0:
+        return 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+    num_items = int(max(pred_items.max(initial=-1), gt_items.max(initial=-1))) + 1
+    # One code per distinct (row, item) pair
+    pred_codes = np.unique(pred_rows * num_items + pred_items)
+    gt_codes = np.unique(gt_rows * num_items + gt_items)
+    tp_codes = np.intersect1d(pred_codes, gt_codes, assume_unique=True)
+    tp = np.bincount(tp_codes // num_items, minlength=num_rows)
+    fp = np.bincount(pred_codes // num_items, minlength=num_rows) - tp
+    fn = np.bincount(gt_codes // num_items, minlength=num_rows) - tp
+    precisions = np.divide(tp, tp + fp, out=np.zeros(num_rows), where=(tp + fp) > 0)
+    recalls = np.divide(tp, tp + fn, out=np.zeros(num_rows), where=(tp + fn) > 0)
+    f1s = np.divide(2 * precisions * recalls, precisions + recalls, out=np.zeros(num_rows), where=(precisions + recalls) > 0)
+    total_tp, total_fp, total_fn = int(tp.sum()), int(fp.sum()), int(fn.sum())
+    macro_precision = float(precisions.mean())
+    macro_recall = float(recalls.mean())
+    macro_f1 = float(f1s.mean())
+    micro_precision = total_tp / (total_tp + total_fp) if (total_tp + total_fp) > 0 else 0.0
+    micro_recall = total_tp / (total_tp + total_fn) if (total_tp + total_fn) > 0 else 0.0
+    micro_f1 = 2 * (micro_precision * micro_recall) / (micro_precision + micro_recall) if (micro_precision + micro_recall) > 0 else 0.0
+    return macro_precision, macro_recall, macro_f1, micro_precision, micro_recall, micro_f1
+
+
+def candidate_recall(candidates, label_paths, ontology_dag):
+    """
+    Counts the ground truth classes that were kept by the candidate pre-filter, at the levels where it dropped candidates.
+
+    Args:
+        candidates (dict): The candidate class names kept below each filtered parent URL, as stored in the predictions.
+        label_paths (list): The ground truth paths of class names, e.g. [['Measurement', 'EnergyUnit']].
+    Returns:
+        tuple: (kept, total) ground truth classes below filtered parents.
+    """
+    hits, total = 0, 0
+    for path in label_paths:
+        parent_level_ontology_class = ontology_dag.root
+        for name in path:
+            if parent_level_ontology_class in candidates:
+                total += 1
+                hits += name in candidates[parent_level_ontology_class]
+            _, current_level_ontology_class_ids = ontology_dag.index.candidates(parent_level_ontology_class)
+            if name not in current_level_ontology_class_ids:
+                break
+            parent_level_ontology_class = ontology_dag.index.urls[current_level_ontology_class_ids[name]]
+    return hits, total
+
+
+def flatten_list_to_set(paths):
+    """
+    Given a list of paths (each a list of nodes), flatten all nodes 
+    into a single tuple. 
+    Examples:
+    [['TemporalEntity', 'Interval']] -> ('TemporalEntity', 'Interval')
+    [['TemporalEntity', 'Interval'], ['TemporalEntity', 'TemporalPosition']] -> ('TemporalEntity', 'Interval', 'TemporalPosition')
+    """
+    all_nodes = []
+    for p in paths:
+        all_nodes.extend(p)
+    return set(all_nodes)
+
+def node_level_f1_precision_recall(data):
+    """
+    Calculate micro and macro precision, recall, and F1 at the node level
+    """
+    return set_level_f1_precision_recall(data, flatten_list_to_set)
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from saed.utils.search import expand_search_node
+from saed.utils.instrumentation import call_context
+
+
+class ColumnSearch:
+    """
+    The state of the breadth-first search of one column inside the ExpansionScheduler.
+    """
+
+    def __init__(self, key, table_name, table_in_markdown, column_name):
+        self.key = key
+        self.table_name = table_name
+        self.table_in_markdown = table_in_markdown
+        self.column_name = column_name
+        self.pending = 0
+        self.trace = {}
+        self.finished_paths = []  # (order, path) pairs, sorted once the column is complete
+
+    def paths(self) -> list:
+        return [path for _, path in sorted(self.finished_paths, key=lambda p: p[0])]
+
+
+class ExpansionScheduler:
+    """
+    Runs the breadth-first searches of many columns on a shared pool of workers.
+
+    Every (column, parent class) expansion is a task in one work queue. When an expansion finishes, its
+    children are pushed back into the queue, so expansions of different columns, tables and ontology levels
+    are interleaved and up to `num_workers` LLM requests are in flight at any time.
+
+    Each search node carries its order key (level, child indices on the way from the root). Sorting the finished
+    paths of a column by this key yields exactly the order in which the sequential `bfs_search` produces them.
+    """
+
+    def __init__(self, ontology_dag, decision_maker, max_depth, num_workers=4, on_column_done=None, retriever=None):
+        """
+        Args:
+            ontology_dag (OntologyDAG): The ontology to search.
+            decision_maker (DecisionMaker): The decision maker queried for every expansion.
+            max_depth (int): The maximum depth of the search.
+            num_workers (int): The number of expansions running concurrently.
+            on_column_done (callable, optional): Called with (key, paths) as soon as a column is complete.
+            retriever (CandidateRetriever, optional): Pre-filters the candidate classes of every expansion.
+        """
+        self.ontology_dag = ontology_dag
+        self.decision_maker = decision_maker
+        self.max_depth = max_depth
+        self.num_workers = num_workers
+        self.on_column_done = on_column_done
+        self.retriever = retriever
+        self.columns = {}
+
+    def add_column(self, key, table_name, table_in_markdown, column_name, trace=None):
+        """
+        Registers a column to annotate. `key` identifies the column in the results, e.g. (table_id, column_id).
+        `trace` optionally starts the search with known decisions, see `expand_search_node`.
+        """
+        if key in self.columns:
+            raise ValueError(f"Column {key} is already scheduled")
+        self.columns[key] = ColumnSearch(key, table_name, table_in_markdown, column_name)
+        if trace is not None:
+            self.columns[key].trace = trace
+
+    def _expand(self, column, level, parent_level_ontology_class, search_path):
+        with call_context(column=column.key):
+            return expand_search_node(column.table_name, column.table_in_markdown, column.column_name,
+                                      self.ontology_dag, self.decision_maker, self.max_depth,
+                                      level, parent_level_ontology_class, search_path,
+                                      retriever=self.retriever, trace=column.trace)
+
+    def run(self) -> dict:
+        """
+        Searches all registered columns.
+
+        Returns:
+            dict: The predicted paths of every column, keyed by the column key.
+        """
+        results = {}
+        num_columns = len(self.columns)
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+
+            def submit(column, order, level, parent_level_ontology_class, search_path):
+                column.pending += 1
+                future = executor.submit(self._expand, column, level, parent_level_ontology_class, search_path)
+                futures[future] = (column, order, level, search_path)
+
+            for column in self.columns.values():
+                submit(column, (0, ()), 0, self.ontology_dag.root, [])
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    column, order, level, search_path = futures.pop(future)
+                    column.pending -= 1
+                    children = future.result()
+                    if children is None:
+                        column.finished_paths.append((order, search_path))
+                    else:
+                        for i, (child_level, child, child_path) in enumerate(children):
+                            submit(column, (child_level, order[1] + (i,)), child_level, child, child_path)
+                    if column.pending == 0:
+                        results[column.key] = column.paths()
+                        print(f"Completed column {column.key} ({len(results)}/{num_columns})")
+                        if self.on_column_done is not None:
+                            self.on_column_done(column.key, results[column.key])
+        return results
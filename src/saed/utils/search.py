@@ -0,0 +1,225 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from saed.utils.instrumentation import call_context
+
+__all__ = ['bfs_search', 'batch_bfs_search', 'expand_search_node']
+
+# Guards the decisions memoized in the traces, which concurrent expansions of the ExpansionScheduler share
+_decisions_lock = threading.Lock()
+
+
+def bfs_search(table_name, table_in_markdown, column_name, ontology_dag, decision_maker,  max_depth, retriever=None, trace=None):
+    if trace is None:
+        trace = {}
+    queue = deque()
+    queue.append((0, ontology_dag.root, []))
+    possible_path = []
+    while queue:
+        level, parent_level_ontology_class, search_path = queue.popleft()
+        children = expand_search_node(table_name, table_in_markdown, column_name, ontology_dag, decision_maker, max_depth,
+                                      level, parent_level_ontology_class, search_path, retriever=retriever, trace=trace)
+        if children is None:
+            possible_path.append(search_path)
+        else:
+            queue.extend(children)
+    return possible_path
+
+
+def expand_search_node(table_name, table_in_markdown, column_name, ontology_dag, decision_maker, max_depth,
+                       level, parent_level_ontology_class, search_path, retriever=None, trace=None):
+    """
+    Expands a single node of the breadth-first search over the ontology.
+
+    Args:
+        level (int): The depth of the node.
+        parent_level_ontology_class (str): The URL of the class whose children are decided on.
+        search_path (list): The URLs selected on the way from the root to this node.
+        retriever (CandidateRetriever, optional): Pre-filters the candidate classes before the decision is made.
+        trace (dict, optional): Collects details of the search of the column, e.g. the candidates kept by the retriever.
+            It also memoizes the decisions of the column: a parent reached again through another path of the DAG,
+            with the same candidate classes, reuses the earlier decision and counts it in `trace["saved_calls"]`.
+            Decisions of a previous run in `trace["previous_decisions"]` are reused the same way and counted in
+            `trace["reused_calls"]`, see `PreviousDecisions`. Concurrent expansions of the same parent wait for the
+            decision of the first one instead of asking the decision maker again.
+    Returns:
+        list: The (level, ontology class, search path) nodes to visit next, or None if search_path is a finished path.
+    """
+    if is_finished_search_node(ontology_dag, max_depth, level, parent_level_ontology_class):
+        return None
+    current_level_ontology_classes = select_candidates(ontology_dag, retriever, trace, parent_level_ontology_class,
+                                                      table_name, table_in_markdown, column_name)
+    decision_key = (parent_level_ontology_class, tuple(current_level_ontology_classes))
+
+    def decide():
+        with call_context(level=level):
+            return decision_maker.decision_making(table_name, table_in_markdown, column_name, current_level_ontology_classes)
+
+    result = memoized_decision(trace, decision_key, decide)
+    return select_children(ontology_dag, result, level, parent_level_ontology_class, search_path)
+
+
+def lookup_decision(trace, decision_key):
+    """
+    The memoized decision of `decision_key` in the trace of a column, or None if it has to be made.
+    """
+    if trace is None:
+        return None
+    decisions = trace.setdefault("decisions", {})
+    if decision_key in decisions:
+        trace["saved_calls"] = trace.get("saved_calls", 0) + 1
+        return decisions[decision_key]
+    previous_decisions = trace.get("previous_decisions")
+    if previous_decisions and decision_key in previous_decisions:
+        trace["reused_calls"] = trace.get("reused_calls", 0) + 1
+        decisions[decision_key] = previous_decisions[decision_key]
+        return decisions[decision_key]
+    return None
+
+
+def memoized_decision(trace, decision_key, decide):
+    """
+    The decision of `decision_key` from the trace of a column, or the result of `decide()` memoized in the trace.
+    Only one caller runs `decide()` for a key; callers arriving while it runs wait for its result.
+    """
+    if trace is None:
+        return decide()
+    with _decisions_lock:
+        result = lookup_decision(trace, decision_key)
+        if result is not None:
+            return result
+        pending_decisions = trace.setdefault("pending_decisions", {})
+        future = pending_decisions.get(decision_key)
+        owner = future is None
+        if owner:
+            future = pending_decisions[decision_key] = Future()
+    if not owner:
+        result = future.result()
+        with _decisions_lock:
+            trace["saved_calls"] = trace.get("saved_calls", 0) + 1
+        return result
+    try:
+        result = decide()
+    except BaseException as e:
+        with _decisions_lock:
+            pending_decisions.pop(decision_key, None)
+        future.set_exception(e)
+        raise
+    with _decisions_lock:
+        trace.setdefault("decisions", {})[decision_key] = result
+        pending_decisions.pop(decision_key, None)
+    future.set_result(result)
+    return result
+
+
+def select_candidates(ontology_dag, retriever, trace, parent_level_ontology_class, table_name, table_in_markdown, column_names):
+    """
+    The candidate classes below `parent_level_ontology_class` to prompt with, shrunk by the retriever if one is given.
+    Levels where the retriever dropped candidates are recorded in `trace["candidates"]` to measure the loss of recall.
+    """
+    current_level_ontology_classes, _ = ontology_dag.index.candidates(parent_level_ontology_class)
+    if retriever is None:
+        return current_level_ontology_classes
+    selected_ontology_classes = retriever.select(parent_level_ontology_class, table_name, table_in_markdown, column_names)
+    if trace is not None and len(selected_ontology_classes) < len(current_level_ontology_classes):
+        trace.setdefault("candidates", {})[parent_level_ontology_class] = list(selected_ontology_classes)
+    return selected_ontology_classes
+
+
+def is_finished_search_node(ontology_dag, max_depth, level, parent_level_ontology_class) -> bool:
+    return level >= max_depth or ontology_dag.index.num_children(ontology_dag.index.ids[parent_level_ontology_class]) == 0
+
+
+def select_children(ontology_dag, result, level, parent_level_ontology_class, search_path):
+    """
+    Turns the decision made for the children of `parent_level_ontology_class` into the next search nodes.
+    Returns None if nothing was selected and search_path is a finished path.
+    """
+    _, current_level_ontology_class_ids = ontology_dag.index.candidates(parent_level_ontology_class)
+    if  result == "-":
+        print("\tNone")
+        return None
+    children = []
+    selected_ontology_classes = result.split(", ")
+    for selected_ontology_class in selected_ontology_classes:
+        if selected_ontology_class in current_level_ontology_class_ids:
+            print(f"\t{selected_ontology_class}")
+            url = ontology_dag.index.urls[current_level_ontology_class_ids[selected_ontology_class]]
+            children.append((level + 1, url, search_path+[url]))
+        else:
+            print(f"Error: {selected_ontology_class} is not in current level ontology classes.")
+    return children
+
+
+def batch_bfs_search(table_name, table_in_markdown, column_names, ontology_dag, decision_maker, max_depth, retriever=None, traces=None):
+    """
+    Runs the breadth-first search of several columns of the same table in lockstep.
+    At every level, the decision maker is asked once per parent class about all columns still expanding under it,
+    and each answer is split back into the frontier of its column.
+
+    Args:
+        column_names (list): The names of the columns to annotate.
+        traces (list, optional): One trace dict per column, see `expand_search_node`.
+    Returns:
+        list: The paths of every column, in the order of `column_names`, identical in structure to `bfs_search`.
+    """
+    if traces is None:
+        traces = [{} for _ in column_names]
+    queues = [deque([(0, ontology_dag.root, [])]) for _ in column_names]
+    possible_paths = [[] for _ in column_names]
+    while any(queues):
+        # All search nodes of a round share the same level
+        frontier = []
+        for i, queue in enumerate(queues):
+            while queue:
+                frontier.append((i, queue.popleft()))
+        level = frontier[0][1][0]
+        columns_per_parent = {}
+        for i, (node_level, parent_level_ontology_class, search_path) in frontier:
+            if not is_finished_search_node(ontology_dag, max_depth, node_level, parent_level_ontology_class):
+                parent_columns = columns_per_parent.setdefault(parent_level_ontology_class, [])
+                if i not in parent_columns:
+                    parent_columns.append(i)
+        results = {}
+        for parent_level_ontology_class, parent_columns in columns_per_parent.items():
+            batch_trace = {}
+            current_level_ontology_classes = select_candidates(ontology_dag, retriever, batch_trace, parent_level_ontology_class, table_name,
+                                                              table_in_markdown, unique_column_names(column_names, parent_columns))
+            if batch_trace:
+                for i in parent_columns:
+                    traces[i].setdefault("candidates", {}).update(batch_trace["candidates"])
+            # Reuse the decisions of columns that already expanded this parent with the same candidates
+            decision_key = (parent_level_ontology_class, tuple(current_level_ontology_classes))
+            pending_columns = []
+            for i in parent_columns:
+                result = lookup_decision(traces[i], decision_key)
+                if result is not None:
+                    results[(parent_level_ontology_class, i)] = result
+                else:
+                    pending_columns.append(i)
+            if not pending_columns:
+                continue
+            with call_context(level=level):
+                answers = decision_maker.batch_decision_making(
+                    table_name, table_in_markdown, unique_column_names(column_names, pending_columns), current_level_ontology_classes)
+            for i in pending_columns:
+                results[(parent_level_ontology_class, i)] = traces[i]["decisions"][decision_key] = answers[column_names[i]]
+        for i, (node_level, parent_level_ontology_class, search_path) in frontier:
+            if is_finished_search_node(ontology_dag, max_depth, node_level, parent_level_ontology_class):
+                possible_paths[i].append(search_path)
+                continue
+            result = results[(parent_level_ontology_class, i)]
+            children = select_children(ontology_dag, result, node_level, parent_level_ontology_class, search_path)
+            if children is None:
+                possible_paths[i].append(search_path)
+            else:
+                queues[i].extend(children)
+    return possible_paths
+
+
+def unique_column_names(column_names, indices) -> list:
+    names = []
+    for i in indices:
+        if column_names[i] not in names:
+            names.append(column_names[i])
+    return names
@@ -0,0 +1,135 @@
+"""
+The persistent LLM response cache and the cache keys of the LLM calls.
+"""
+import os.path as osp
+import sys
+import shutil
+import tempfile
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from omegaconf import OmegaConf
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.ensemble.cache import LLMCache
+from saed.ensemble.llms import LLM
+
+
+def make_llm(**llms):
+    config = OmegaConf.create({
+        "llms": dict({"name": "fake", "model": "fake", "temperature": 0.0}, **llms),
+        "experiments": {"mode": "llm"},
+    })
+    return LLM(config)
+
+
+class LLMCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = osp.join(self.tmp_dir, "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hits_buffer_their_access_times(self):
+        cache = LLMCache(self.path, flush_every=3)
+        cache.get_or_compute("a", lambda: "A")
+        stored = cache._conn.execute("SELECT last_access FROM responses WHERE key = 'a'").fetchone()[0]
+        cache.get_or_compute("a", lambda: "unused")
+        cache.get_or_compute("a", lambda: "unused")
+        self.assertEqual(cache._conn.execute("SELECT last_access FROM responses WHERE key = 'a'").fetchone()[0], stored)
+        self.assertIn("a", cache._accesses)
+        cache.get_or_compute("b", lambda: "B")
+        self.assertEqual(cache._accesses, {})
+        self.assertGreater(cache._conn.execute("SELECT last_access FROM responses WHERE key = 'a'").fetchone()[0], stored)
+        self.assertEqual(cache.stats()["hits"], 2)
+        cache.close()
+
+    def test_concurrent_requests_are_coalesced(self):
+        cache = LLMCache(self.path)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(10)
+            return "A"
+
+        with ThreadPoolExecutor(4) as executor:
+            owner = executor.submit(cache.get_or_compute, "a", compute)
+            started.wait(10)
+            waiters = [executor.submit(cache.get_or_compute, "a", compute) for _ in range(3)]
+            while cache.stats()["coalesced"] < 3:
+                time.sleep(0.001)
+            release.set()
+            self.assertEqual([f.result() for f in [owner] + waiters], ["A"] * 4)
+        self.assertEqual(len(calls), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["misses"], stats["coalesced"], stats["hits"]), (1, 3, 0))
+        self.assertEqual(cache.get_or_compute("a", compute), "A")
+        self.assertEqual(len(calls), 1)
+        cache.close()
+
+    def test_failures_reach_the_waiters_and_are_not_cached(self):
+        cache = LLMCache(self.path)
+
+        def fail():
+            raise RuntimeError("down")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_compute("a", fail)
+        self.assertEqual(cache.get_or_compute("a", lambda: "A"), "A")
+        self.assertEqual(cache.stats()["misses"], 2)
+        cache.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        # Room for three responses of 100 bytes
+        cache = LLMCache(self.path, max_size_mb=350 / 1024 / 1024, flush_every=1)
+        for key in "abc":
+            cache.get_or_compute(key, lambda: key * 100)
+            # Distinct access times, whatever the resolution of the clock
+            time.sleep(0.01)
+        cache.get_or_compute("a", lambda: "unused")
+        cache.get_or_compute("d", lambda: "d" * 100)
+        stats = cache.stats()
+        self.assertEqual((stats["evictions"], stats["entries"], stats["size_bytes"]), (1, 3, 300))
+        keys = {row[0] for row in cache._conn.execute("SELECT key FROM responses")}
+        self.assertEqual(keys, {"a", "c", "d"})
+        cache.close()
+
+        # The size is restored from the file
+        cache = LLMCache(self.path, max_size_mb=150 / 1024 / 1024)
+        self.assertEqual(cache.stats()["size_bytes"], 300)
+        cache.get_or_compute("e", lambda: "e" * 100)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.get_or_compute("e", lambda: "unused"), "e" * 100)
+        cache.close()
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_agents_get_their_own_keys(self):
+        llm = make_llm()
+        variables = {"table_name": "t", "table_in_markdown": "m", "column_name": "c", "current_level_ontology_classes": "A, B"}
+        self.assertEqual(llm.cache_key(variables), llm.cache_key(variables))
+        self.assertNotEqual(llm.cache_key(variables, agent=0), llm.cache_key(variables, agent=1))
+        self.assertNotEqual(llm.cache_key(variables), llm.cache_key(variables, agent=0))
+
+    def test_truncated_streams_get_their_own_keys(self):
+        variables = {"table_name": "t", "table_in_markdown": "m", "column_name": "c", "current_level_ontology_classes": "A, B"}
+        streaming = make_llm(streaming=True)
+        self.assertNotEqual(streaming.cache_key(variables, stop_at_answer=True), streaming.cache_key(variables))
+        # Without streaming the completion is never cut, so both callers can share it
+        llm = make_llm()
+        self.assertEqual(llm.cache_key(variables, stop_at_answer=True), llm.cache_key(variables))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+The client-side rate limiting and retries of the LLM calls.
+"""
+import io
+import os.path as osp
+import sys
+import unittest
+import contextlib
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.ensemble.client import TokenBucket, ResilientClient, is_transient, retry_after
+
+
+class Response:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIError(Exception):
+    """
+    Fails like the HTTP errors of the openai and httpx clients.
+    """
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = Response(status_code, headers)
+
+
+def failing(errors, result="ok"):
+    """
+    A call that raises `errors` one after the other, then returns `result`.
+    """
+    errors = list(errors)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return fn, attempts
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_reservations_wait_in_order(self):
+        # One token per second, two at most
+        bucket = TokenBucket(60, burst_s=2)
+        self.assertEqual(bucket.reserve(1), 0.0)
+        self.assertEqual(bucket.reserve(1), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0, places=1)
+        self.assertAlmostEqual(bucket.reserve(1), 2.0, places=1)
+
+    def test_large_reservations_wait_for_a_full_bucket(self):
+        bucket = TokenBucket(60, burst_s=2)
+        self.assertEqual(bucket.reserve(10), 0.0)
+        self.assertAlmostEqual(bucket.reserve(10), 10.0, places=1)
+
+    def test_adjust(self):
+        bucket = TokenBucket(60, burst_s=2)
+        bucket.reserve(2)
+        bucket.adjust(-1)
+        self.assertEqual(bucket.reserve(1), 0.0)
+        # Returned tokens never fill the bucket beyond its capacity
+        bucket.adjust(-10)
+        self.assertAlmostEqual(bucket.level, 2.0, places=1)
+
+
+class ResilientClientTest(unittest.TestCase):
+
+    def call(self, client, fn, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return client.call(fn, **kwargs)
+
+    def test_transient_failures_are_retried(self):
+        client = ResilientClient(backoff_base_s=0.001)
+        fn, attempts = failing([APIError(429), APIError(503), TimeoutError()])
+        usage = {}
+        self.assertEqual(self.call(client, fn, usage=usage), "ok")
+        self.assertEqual(len(attempts), 4)
+        self.assertEqual(usage["retries"], 3)
+        stats = client.stats()
+        self.assertEqual((stats["calls"], stats["retries"], stats["failures"]), (1, 3, 0))
+        self.assertEqual(stats["retries_per_status"], {"429": 1, "503": 1, "TimeoutError": 1})
+
+    def test_permanent_failures_are_raised(self):
+        client = ResilientClient(backoff_base_s=0.001)
+        fn, attempts = failing([APIError(400)])
+        with self.assertRaises(APIError):
+            self.call(client, fn)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(client.stats()["failures"], 1)
+
+    def test_retries_are_bounded(self):
+        client = ResilientClient(max_retries=2, backoff_base_s=0.001)
+        fn, attempts = failing([APIError(500)] * 5)
+        with self.assertRaises(APIError):
+            self.call(client, fn)
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual((client.stats()["retries"], client.stats()["failures"]), (2, 1))
+
+    def test_backoff(self):
+        client = ResilientClient(backoff_base_s=1.0, backoff_max_s=10.0)
+        for attempt, delay in ((0, 1.0), (2, 4.0), (10, 10.0)):
+            backoff = client.backoff(attempt, APIError(429))
+            self.assertGreaterEqual(backoff, delay / 2)
+            self.assertLessEqual(backoff, delay)
+        # The delay requested by the server wins
+        self.assertEqual(client.backoff(5, APIError(429, {"retry-after": "3"})), 3.0)
+        self.assertEqual(client.backoff(5, APIError(429, {"retry-after-ms": "250"})), 0.25)
+        self.assertIsNone(retry_after(APIError(429, {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})))
+
+    def test_transient_errors(self):
+        for error, transient in ((APIError(429), True), (APIError(408), True), (APIError(502), True),
+                                 (APIError(401), False), (ConnectionError(), True), (ValueError(), False)):
+            with self.subTest(error=repr(error)):
+                self.assertEqual(is_transient(error), transient)
+
+    def test_calls_are_throttled(self):
+        # A bucket of one request, refilled every 20ms
+        client = ResilientClient(requests_per_minute=3000, burst_s=0.02)
+        for _ in range(3):
+            self.call(client, lambda: "ok")
+        stats = client.stats()
+        self.assertEqual(stats["throttled_calls"], 2)
+        self.assertGreater(stats["throttled_s"], 0.02)
+
+    def test_settle_corrects_the_token_quota(self):
+        client = ResilientClient(tokens_per_minute=600, burst_s=1)
+        self.call(client, lambda: "ok", tokens=10)
+        client.settle(10, 4)
+        self.assertAlmostEqual(client.tokens.level, 6.0, places=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
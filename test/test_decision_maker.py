@@ -0,0 +1,177 @@
+"""
+The decisions of `DecisionMaker` with offline backends.
+"""
+import io
+import os.path as osp
+import sys
+import unittest
+import contextlib
+from typing import Any, List, Optional
+
+from omegaconf import OmegaConf
+from langchain_core.language_models.llms import LLM as BaseLLM
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.ensemble import DecisionMaker
+
+
+class ScriptedLLM(BaseLLM):
+    """
+    Returns the given answers one after the other, e.g. the votes of the agents of one decision.
+    """
+
+    answers: list = []
+    prompts: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.prompts.append(prompt)
+        return self.answers.pop(0)
+
+
+def make_config(mode="edm", **experiments):
+    return OmegaConf.create({
+        "llms": {
+            "name": "cascade",
+            "tiers": [{"name": "fake", "model": "small", "temperature": 0.0},
+                      {"name": "fake", "model": "large", "temperature": 0.0}],
+            "cache": {"enabled": False},
+        },
+        "experiments": dict({
+            "mode": mode, "avg_classes_per_agent": 3, "avg_agents_per_class": 3, "consensus_threshold_ratio": 0.6,
+            "assignment": "balanced", "max_concurrency": 1, "early_stopping": False,
+        }, **experiments),
+    })
+
+
+def make_fake_config(**experiments):
+    config = make_config(**experiments)
+    config.llms = {"name": "fake", "model": "fake", "temperature": 0.0, "max_classes": 3, "cache": {"enabled": False}}
+    return config
+
+
+def script(decision_maker, tier, answers):
+    llm = ScriptedLLM(answers=list(answers), prompts=[])
+    decision_maker.tiers[tier].llm = llm
+    decision_maker.tiers[tier].chains = {}
+    return llm
+
+
+def decide(decision_maker, classes):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return decision_maker.decision_making("table", "| a |", "column", classes)
+
+
+class CascadeEscalationTest(unittest.TestCase):
+
+    def assert_stays_on_first_tier(self, votes, expected):
+        decision_maker = DecisionMaker(make_config())
+        script(decision_maker, 0, votes)
+        large = script(decision_maker, 1, [])
+        self.assertEqual(decide(decision_maker, ["A"]), expected)
+        self.assertEqual(large.prompts, [])
+        self.assertEqual(decision_maker.metrics.summary()["escalations"]["count"], 0)
+
+    def test_unanimous_decisions_stay_on_the_first_tier(self):
+        self.assert_stays_on_first_tier(["<answer>A</answer>"] * 3, "A")
+
+    def test_majority_decisions_stay_on_the_first_tier(self):
+        self.assert_stays_on_first_tier(["<answer>A</answer>", "<answer>A</answer>", "<answer>-</answer>"], "A")
+        self.assert_stays_on_first_tier(["<answer>A</answer>", "<answer>-</answer>", "<answer>-</answer>"], "-")
+
+    def test_ties_escalate(self):
+        decision_maker = DecisionMaker(make_config(avg_agents_per_class=4, avg_classes_per_agent=4))
+        script(decision_maker, 0, ["<answer>A</answer>", "<answer>-</answer>"] * 2)
+        large = script(decision_maker, 1, ["<answer>A</answer>"] * 4)
+        self.assertEqual(decide(decision_maker, ["A"]), "A")
+        self.assertEqual(len(large.prompts), 4)
+
+    def test_unparseable_answers_escalate(self):
+        decision_maker = DecisionMaker(make_config(mode="llm"))
+        script(decision_maker, 0, ["A"])
+        large = script(decision_maker, 1, ["<answer>B</answer>"])
+        self.assertEqual(decide(decision_maker, ["A", "B"]), "B")
+        self.assertEqual(len(large.prompts), 1)
+
+
+class EnsembleVotingTest(unittest.TestCase):
+
+    CLASSES = [f"Class{i}" for i in range(10)]
+
+    def decisions(self, **experiments):
+        decision_maker = DecisionMaker(make_fake_config(**experiments))
+        decisions = [decision_maker.ensemble_decision_making("table", "| a |", f"column{i}", self.CLASSES)
+                     for i in range(20)]
+        decision_maker.close()
+        queried_agents = sum(r["queried_agents"] for r in decision_maker.metrics.records if r["kind"] == "ensemble")
+        return decisions, queried_agents
+
+    def test_early_stopping_and_concurrency_match_full_voting(self):
+        for threshold in (0.3, 0.6, 1.0):
+            with self.subTest(threshold=threshold):
+                full, full_agents = self.decisions(consensus_threshold_ratio=threshold)
+                self.assertTrue(any(decision != "-" for decision in full))
+                early, early_agents = self.decisions(consensus_threshold_ratio=threshold, early_stopping=True)
+                self.assertEqual(early, full)
+                self.assertLessEqual(early_agents, full_agents)
+                for early_stopping in (False, True):
+                    concurrent, _ = self.decisions(consensus_threshold_ratio=threshold, early_stopping=early_stopping,
+                                                   max_concurrency=4)
+                    self.assertEqual(concurrent, full)
+
+    def test_balanced_assignment(self):
+        for num_classes, classes_per_agent, agents_per_class in ((10, 3, 3), (7, 4, 2), (1, 3, 3), (12, 12, 1), (5, 2, 4)):
+            with self.subTest(num_classes=num_classes, classes_per_agent=classes_per_agent, agents_per_class=agents_per_class):
+                classes = [f"Class{i}" for i in range(num_classes)]
+                assignment = DecisionMaker.balanced_assignment(classes, classes_per_agent, agents_per_class, seed=1)
+                for class_ in classes:
+                    agents = [agent for agent, agent_classes in enumerate(assignment) if class_ in agent_classes]
+                    self.assertEqual(len(agents), agents_per_class)
+                for agent_classes in assignment:
+                    self.assertEqual(len(agent_classes), len(set(agent_classes)))
+                    self.assertLessEqual(len(agent_classes), classes_per_agent)
+                    # The agents keep the order of the classes
+                    self.assertEqual(agent_classes, sorted(agent_classes, key=classes.index))
+                loads = [len(agent_classes) for agent_classes in assignment]
+                self.assertLessEqual(max(loads) - min(loads), 1)
+                self.assertEqual(DecisionMaker.balanced_assignment(classes, classes_per_agent, agents_per_class, seed=1),
+                                 assignment)
+
+
+class ParseBatchAnswersTest(unittest.TestCase):
+
+    def test_answers_per_column(self):
+        outcomes = {}
+        result = ('<answer column="a">A, B</answer>\n<answer column=\'b\'>-</answer>'
+                  '<answer column="c">A, Z</answer><answer column="a">C</answer>')
+        decisions = DecisionMaker.parse_batch_answers(result, ["a", "b", "c", "d"], ["A", "B", "C"], outcomes)
+        # The first answer of a column counts, unknown classes are dropped and missing columns get "-"
+        self.assertEqual(decisions, {"a": "A, B", "b": "-", "c": "A", "d": "-"})
+        self.assertEqual(outcomes, {"a": {}, "b": {}, "c": {"unknown_classes": 1}, "d": {"unparseable": 1}})
+
+    def test_unquoted_and_spaced_columns(self):
+        decisions = DecisionMaker.parse_batch_answers('<answer column=a>A</answer><answer column="x y" >B</answer>',
+                                                      ["a", "x y"], ["A", "B"])
+        self.assertEqual(decisions, {"a": "A", "x y": "B"})
+
+
+class AgentPoolTest(unittest.TestCase):
+
+    def test_decisions_reuse_one_pool(self):
+        decision_maker = DecisionMaker(make_fake_config(max_concurrency=3))
+        decide(decision_maker, ["A", "B", "C", "D"])
+        pool = decision_maker.agent_pool()
+        decide(decision_maker, ["E", "F", "G", "H"])
+        self.assertIs(decision_maker.agent_pool(), pool)
+        decision_maker.close()
+        self.assertIsNone(decision_maker._agent_pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+The aggregates of the call metrics.
+"""
+import os.path as osp
+import sys
+import unittest
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.utils import CallMetrics, call_context
+
+
+class CallMetricsTest(unittest.TestCase):
+
+    def test_latency_excludes_cached_calls(self):
+        metrics = CallMetrics()
+        for latency in (1.0, 2.0, 3.0):
+            metrics.record("llm", latency_s=latency, cached=False)
+        for _ in range(10):
+            metrics.record("llm", latency_s=0.001, cached=True)
+        summary = metrics.summary()
+        self.assertEqual(summary["calls"], 13)
+        self.assertEqual(summary["cached_calls"], 10)
+        self.assertEqual(summary["uncached_calls"], 3)
+        self.assertEqual(summary["latency_s"]["p50"], 2.0)
+        self.assertEqual(summary["latency_s"]["total"], 6.0)
+        self.assertEqual(summary["tiers"]["0"]["calls"], 13)
+        self.assertEqual(summary["tiers"]["0"]["cached_calls"], 10)
+        self.assertEqual(summary["tiers"]["0"]["latency_s"]["p50"], 2.0)
+
+    def test_records_carry_the_context(self):
+        metrics = CallMetrics()
+        with call_context(column=("1.csv", 3)):
+            with call_context(level=1):
+                metrics.record("llm", latency_s=0.5, prompt_tokens=10, completion_tokens=2)
+        summary = metrics.summary()
+        self.assertEqual(summary["calls_per_level"], {"1": 1})
+        self.assertEqual(summary["columns"]["1.csv/3"]["prompt_tokens"], 10)
+
+    def test_max_records(self):
+        metrics = CallMetrics(max_records=5)
+        for _ in range(20):
+            metrics.record("llm", latency_s=0.1)
+        self.assertEqual(metrics.summary()["calls"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+The vectorized metrics of `eval.py` against the per-row implementation they replaced.
+"""
+import os.path as osp
+import sys
+import random
+import unittest
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.utils import path_level_f1_precision_recall, node_level_f1_precision_recall
+
+
+def reference_f1_precision_recall(data, to_set):
+    precisions, recalls, f1s = [], [], []
+    total_tp, total_fp, total_fn = 0, 0, 0
+    for row in data:
+        gt_set = to_set(row['gt_paths'])
+        pred_set = to_set(row['pred_paths'])
+        tp = len(pred_set.intersection(gt_set))
+        fp = len(pred_set - gt_set)
+        fn = len(gt_set - pred_set)
+        precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
+        recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
+        f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0.0
+        precisions.append(precision)
+        recalls.append(recall)
+        f1s.append(f1)
+        total_tp += tp
+        total_fp += fp
+        total_fn += fn
+    macro_precision = sum(precisions) / len(precisions) if precisions else 0.0
+    macro_recall = sum(recalls) / len(recalls) if recalls else 0.0
+    macro_f1 = sum(f1s) / len(f1s) if f1s else 0.0
+    micro_precision = total_tp / (total_tp + total_fp) if (total_tp + total_fp) > 0 else 0.0
+    micro_recall = total_tp / (total_tp + total_fn) if (total_tp + total_fn) > 0 else 0.0
+    micro_f1 = 2 * (micro_precision * micro_recall) / (micro_precision + micro_recall) if (micro_precision + micro_recall) > 0 else 0.0
+    return macro_precision, macro_recall, macro_f1, micro_precision, micro_recall, micro_f1
+
+
+def reference_path_level(data):
+    return reference_f1_precision_recall(data, lambda paths: {tuple(p) for p in paths})
+
+
+def reference_node_level(data):
+    return reference_f1_precision_recall(data, lambda paths: {node for p in paths for node in p})
+
+
+def random_rows(num_rows, seed=0):
+    rng = random.Random(seed)
+    classes = [f"Class{i}" for i in range(12)]
+
+    def paths():
+        return [rng.sample(classes, rng.randint(1, 3)) for _ in range(rng.randint(0, 3))]
+
+    rows = []
+    for _ in range(num_rows):
+        gt_paths = paths()
+        # Some predictions repeat a ground truth path, so that there are true positives
+        pred_paths = paths() + (gt_paths[:1] if rng.random() < 0.5 else [])
+        rows.append({"gt_paths": gt_paths, "pred_paths": pred_paths})
+    return rows
+
+
+class MetricsTest(unittest.TestCase):
+
+    def assert_metrics_equal(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a, e, places=12)
+
+    def test_path_level_matches_reference(self):
+        for seed, num_rows in enumerate((1, 10, 1000)):
+            data = random_rows(num_rows, seed)
+            self.assert_metrics_equal(path_level_f1_precision_recall(data), reference_path_level(data))
+
+    def test_node_level_matches_reference(self):
+        for seed, num_rows in enumerate((1, 10, 1000)):
+            data = random_rows(num_rows, seed)
+            self.assert_metrics_equal(node_level_f1_precision_recall(data), reference_node_level(data))
+
+    def test_empty_and_missing_paths(self):
+        data = [{"gt_paths": [], "pred_paths": []},
+                {"gt_paths": [["A", "B"]], "pred_paths": []},
+                {"gt_paths": [], "pred_paths": [["A"]]}]
+        self.assert_metrics_equal(path_level_f1_precision_recall(data), reference_path_level(data))
+        self.assert_metrics_equal(node_level_f1_precision_recall(data), reference_node_level(data))
+        self.assert_metrics_equal(path_level_f1_precision_recall([]), reference_path_level([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
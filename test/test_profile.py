@@ -0,0 +1,110 @@
+"""
+The one-pass column profiles: reservoir samples, distinct estimates and inferred types.
+"""
+import os.path as osp
+import sys
+import unittest
+from collections import Counter
+
+import pandas as pd
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.data.profile import ColumnProfiler, profile_chunks
+
+
+def profile_column(values, chunk_size=None, **kwargs):
+    profiler = ColumnProfiler("column", **kwargs)
+    series = pd.Series(values)
+    chunk_size = chunk_size or len(series)
+    for start in range(0, len(series), chunk_size):
+        profiler.update(series.iloc[start:start + chunk_size])
+    return profiler
+
+
+class ReservoirSampleTest(unittest.TestCase):
+
+    VALUES = [str(i) for i in range(1000)]
+
+    def test_sample_size_and_values(self):
+        self.assertEqual(profile_column(self.VALUES[:4], sample_size=10).sample, self.VALUES[:4])
+        sample = profile_column(self.VALUES + [None] * 100, sample_size=10).sample
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(len(set(sample)), 10)
+        self.assertTrue(set(sample) <= set(self.VALUES))
+        self.assertEqual(profile_column(self.VALUES, sample_size=0).sample, [])
+
+    def test_sample_is_seeded_and_independent_of_the_chunks(self):
+        sample = profile_column(self.VALUES, sample_size=10, seed=1).sample
+        for chunk_size in (3, 7, 500):
+            self.assertEqual(profile_column(self.VALUES, chunk_size, sample_size=10, seed=1).sample, sample)
+        self.assertNotEqual(profile_column(self.VALUES, sample_size=10, seed=2).sample, sample)
+
+    def test_sample_is_uniform(self):
+        # 400 seeds draw 4000 of 1000 values: every tenth of the values expects 400 of them
+        tenths = Counter()
+        values = pd.Series(self.VALUES)
+        for seed in range(400):
+            profiler = ColumnProfiler("column", sample_size=10, seed=seed)
+            for start in range(0, len(values), 64):
+                profiler.update_sample(values.iloc[start:start + 64])
+            for value in profiler.sample:
+                tenths[int(value) // 100] += 1
+        self.assertEqual(sum(tenths.values()), 4000)
+        for tenth in range(10):
+            self.assertGreater(tenths[tenth], 320)
+            self.assertLess(tenths[tenth], 480)
+
+
+class DistinctEstimateTest(unittest.TestCase):
+
+    def test_small_columns_are_counted_exactly(self):
+        values = [str(i % 300) for i in range(5000)] + [None]
+        self.assertEqual(profile_column(values, 1000, kmv_size=1024).distinct(), 300)
+
+    def test_large_columns_are_estimated(self):
+        # The relative error of the sketch is about 1 / sqrt(kmv_size)
+        for num_distinct in (5000, 50000):
+            with self.subTest(num_distinct=num_distinct):
+                values = [f"value-{i % num_distinct}" for i in range(2 * num_distinct)]
+                estimate = profile_column(values, 4096, kmv_size=1024).distinct()
+                self.assertLess(abs(estimate - num_distinct) / num_distinct, 0.1)
+
+
+class ProfileTypesTest(unittest.TestCase):
+
+    def test_inferred_types(self):
+        table = pd.DataFrame({
+            "value": ["1", "2.5", None, "x"],
+            "time": ["2024-01-01 00:00", "2024-01-01 00:15", "2024-01-01 00:30", "2024-01-01 00:45"],
+            "flag": ["true", "False", "true", "false"],
+            "name": ["a", "bb", "ccc", "a"],
+            "temperature": ["21.5 °C", "22 °C", "23,5 °C", "20 °C"],
+        })
+        columns = {column["name"]: column for column in profile_chunks([table.iloc[:2], table.iloc[2:]])["columns"]}
+        self.assertEqual({name: column["dtype"] for name, column in columns.items()},
+                         {"value": "numeric", "time": "datetime", "flag": "bool", "name": "text", "temperature": "numeric"})
+        self.assertEqual((columns["value"]["min"], columns["value"]["max"], columns["value"]["invalid"]), (1.0, 2.5, 1))
+        self.assertEqual(columns["value"]["null_ratio"], 0.25)
+        self.assertEqual(columns["time"]["cadence"], {"interval_s": 900.0, "regularity": 1.0})
+        self.assertEqual((columns["name"]["min"], columns["name"]["max"], columns["name"]["distinct"]), (1, 3, 3))
+        self.assertEqual((columns["temperature"]["min"], columns["temperature"]["max"]), (20.0, 23.5))
+        self.assertEqual(columns["temperature"]["unit"], "°C")
+
+    def test_typed_columns(self):
+        table = pd.DataFrame({
+            "time": pd.date_range("2024-01-01", periods=6, freq="h"),
+            "flag": [True, False] * 3,
+            "value": [1, 2, 3, 4, 5, 6],
+        })
+        columns = {column["name"]: column for column in profile_chunks([table])["columns"]}
+        self.assertEqual(columns["time"]["dtype"], "datetime")
+        self.assertEqual(columns["time"]["cadence"]["interval_s"], 3600.0)
+        self.assertEqual(columns["flag"]["dtype"], "bool")
+        self.assertEqual((columns["value"]["dtype"], columns["value"]["min"], columns["value"]["max"]), ("numeric", 1, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
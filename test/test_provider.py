@@ -0,0 +1,64 @@
+"""
+Lazy loading of CSV, Parquet and Arrow tables with `TableProvider`.
+"""
+import os.path as osp
+import sys
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from omegaconf import OmegaConf
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.data import TableProvider
+
+
+class TableProviderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config = OmegaConf.create({"data": {"tables": {"path": self.tmp_dir}}})
+        self.table = pd.DataFrame({"a": range(1000), "b": [f"x{i}" for i in range(1000)], "c": [i / 2 for i in range(1000)]})
+        self.table.to_csv(osp.join(self.tmp_dir, "1.csv"), index=False)
+        for table_id in ("1.parquet", "2.parquet"):
+            self.table.to_parquet(osp.join(self.tmp_dir, table_id), index=False)
+        self.table.to_feather(osp.join(self.tmp_dir, "1.arrow"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_first_rows(self):
+        provider = TableProvider(self.config, nrows=5)
+        for table_id in ("1.csv", "1.parquet", "1.arrow"):
+            with self.subTest(table_id=table_id):
+                pd.testing.assert_frame_equal(provider[table_id], self.table.head(5))
+
+    def test_column_projection(self):
+        provider = TableProvider(self.config, nrows=5)
+        for table_id in ("1.csv", "1.parquet", "1.arrow"):
+            with self.subTest(table_id=table_id):
+                table = provider.get(table_id, columns=["a", "c"])
+                pd.testing.assert_frame_equal(table, self.table[["a", "c"]].head(5))
+
+    def test_sampling_is_seeded_per_table(self):
+        provider = TableProvider(self.config, sample_fraction=0.1, seed=0)
+        first, second = provider["1.parquet"], provider["2.parquet"]
+        self.assertGreater(len(first), 0)
+        self.assertLess(len(first), len(self.table))
+        self.assertNotEqual(first["a"].tolist(), second["a"].tolist())
+        pd.testing.assert_frame_equal(TableProvider(self.config, sample_fraction=0.1, seed=0)["1.parquet"], first)
+
+    def test_unreferenced_table(self):
+        provider = TableProvider(self.config, table_ids=["1.csv"])
+        self.assertIn("1.csv", provider)
+        self.assertNotIn("1.parquet", provider)
+        with self.assertRaises(KeyError):
+            provider["1.parquet"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+The lexical candidate pre-filter of the ontology classes.
+"""
+import os.path as osp
+import sys
+import unittest
+
+import numpy as np
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.onto import OntologyIndex, CandidateRetriever
+from saed.onto.retrieval import NUM_FEATURES
+
+NAMES = ["EnergyUnit", "PowerUnit", "TemperatureSensor", "ChargingStation", "Timestamp", "Duration", "Building", "Room"]
+
+
+class Node:
+
+    def __init__(self, url):
+        self.url = url
+        self.name = url.split("#")[1]
+        self.label = []
+        self.comment = []
+
+
+class FlatDAG:
+
+    def __init__(self):
+        self.root = "x#Thing"
+        self.edges = {"x#Thing": [f"x#{name}" for name in NAMES]}
+        self.nodes = {url: Node(url) for url in [self.root] + self.edges[self.root]}
+        self.index = OntologyIndex(self)
+
+
+class CandidateRetrieverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dag = FlatDAG()
+        self.retriever = CandidateRetriever(self.dag, top_k=2, margin=1)
+
+    def test_sparse_scores_match_dense_dot_products(self):
+        indices, weights = self.retriever.query_vector("Charging", "| energy_kwh |\n| --- |\n| 12 |", "energy_kwh")
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertAlmostEqual(float(np.linalg.norm(weights)), 1.0, places=5)
+        dense = np.zeros(NUM_FEATURES, dtype=np.float32)
+        dense[indices] = weights
+        class_ids = list(range(len(self.retriever.indptr) - 1))
+        scores = self.retriever.scores(class_ids, (indices, weights))
+        for class_id, score in zip(class_ids, scores):
+            start, end = self.retriever.indptr[class_id], self.retriever.indptr[class_id + 1]
+            expected = float(np.dot(self.retriever.data[start:end], dense[self.retriever.indices[start:end]]))
+            self.assertAlmostEqual(float(score), expected, places=5)
+
+    def test_select_keeps_the_best_candidates_in_ontology_order(self):
+        selected = self.retriever.select(self.dag.root, "Charging", "| energy unit |\n| --- |\n| 12 kWh |", "energy unit")
+        self.assertEqual(len(selected), 3)
+        self.assertIn("EnergyUnit", selected)
+        self.assertEqual(list(selected), [name for name in NAMES if name in selected])
+
+    def test_query_without_known_features(self):
+        indices, weights = self.retriever.query_vector("", "", "")
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(self.retriever.scores([1, 2], (indices, weights)).tolist(), [0.0, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
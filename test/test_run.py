@@ -0,0 +1,99 @@
+"""
+End-to-end runs of `run.py` on the synthetic dataset with the offline `fake` LLM backend.
+"""
+import os
+import os.path as osp
+import io
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+from omegaconf import OmegaConf
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed import run
+
+
+def make_config(tmp_dir, mode="llm", **overrides):
+    config_dir = osp.join(root_path, "config")
+    cfg = OmegaConf.create({
+        "data": OmegaConf.load(osp.join(config_dir, "data", "data.yaml.example")),
+        "llms": OmegaConf.load(osp.join(config_dir, "llms", "fake.yaml.example")),
+        "experiments": OmegaConf.load(osp.join(config_dir, "experiments", f"{mode}.yaml.example")),
+    })
+    cfg.data.ontology.snapshot_dir = osp.join(tmp_dir, "ontology")
+    cfg.experiments.outputs.logs.dir = osp.join(tmp_dir, "logs")
+    cfg.experiments.outputs.results.dir = osp.join(tmp_dir, "results")
+    for key, value in overrides.items():
+        OmegaConf.update(cfg, key, value)
+    return cfg
+
+
+def run_experiment(cfg):
+    """
+    Runs `run.py` with `cfg` and returns the predictions and the number of LLM calls.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        run.main.__wrapped__(cfg)
+    results_dir = osp.join(cfg.experiments.outputs.results.dir, cfg.llms.name)
+    with open(osp.join(results_dir, "predictions.json"), "r", encoding="utf-8") as f:
+        predictions = json.load(f)
+    with open(osp.join(results_dir, "metrics_summary.json"), "r", encoding="utf-8") as f:
+        calls = json.load(f)["calls"]
+    return predictions, calls
+
+
+class RunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_scheduler_matches_sequential_search(self):
+        # The balanced assignment gives the agents the same classes in every run, and a low threshold selects
+        # classes with the votes of the fake backend, so that the edm paths are not all empty
+        edm = {"experiments.assignment": "balanced", "experiments.consensus_threshold_ratio": 0.3, "experiments.max_concurrency": 3}
+        for mode, overrides in (("llm", {}), ("edm", edm)):
+            with self.subTest(mode=mode):
+                sequential, sequential_calls = run_experiment(make_config(self.tmp_dir, mode, **overrides))
+                self.assertTrue(any(path for prediction in sequential for path in prediction["paths"]))
+                # The jitter makes the expansions of the scheduler finish out of order
+                scheduled, scheduled_calls = run_experiment(make_config(
+                    self.tmp_dir, mode, **overrides,
+                    **{"experiments.num_workers": 4, "llms.latency_s": 0.001, "llms.latency_jitter_s": 0.005}))
+                self.assertEqual(scheduled, sequential)
+                self.assertEqual(scheduled_calls, sequential_calls)
+
+    def test_resume_from_truncated_predictions(self):
+        full, full_calls = run_experiment(make_config(self.tmp_dir))
+        jsonl_path = osp.join(self.tmp_dir, "results", "fake", "predictions.jsonl")
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), len(full))
+        # Two complete predictions and half of a third one, as left behind by a crash
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            f.writelines(lines[:2])
+            f.write(lines[2][:len(lines[2]) // 2])
+
+        resumed, resumed_calls = run_experiment(make_config(self.tmp_dir, **{"experiments.resume": True}))
+        self.assertEqual(resumed, full)
+        self.assertLess(resumed_calls, full_calls)
+
+    def test_incremental_rerun_without_changes_makes_no_calls(self):
+        full, full_calls = run_experiment(make_config(self.tmp_dir))
+        self.assertGreater(full_calls, 0)
+        rerun, rerun_calls = run_experiment(make_config(self.tmp_dir, **{"experiments.incremental.enabled": True}))
+        self.assertEqual(rerun, full)
+        self.assertEqual(rerun_calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
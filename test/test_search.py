@@ -0,0 +1,86 @@
+"""
+The breadth-first searches over a small ontology DAG with a deterministic decision maker.
+"""
+import io
+import os.path as osp
+import sys
+import unittest
+import contextlib
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.onto import OntologyIndex
+from saed.utils import bfs_search, batch_bfs_search
+from saed.utils.instrumentation import current_context
+
+
+class Node:
+
+    def __init__(self, url):
+        self.url = url
+        self.name = url.split("#")[1]
+
+
+class DiamondDAG:
+    """
+    Thing -> A, B; A -> C; B -> C; C -> D, E: the class C is reached through two paths.
+    """
+
+    def __init__(self):
+        self.root = "x#Thing"
+        self.edges = {"x#Thing": ["x#A", "x#B"], "x#A": ["x#C"], "x#B": ["x#C"], "x#C": ["x#D", "x#E"]}
+        self.nodes = {url: Node(url) for url in ["x#Thing", "x#A", "x#B", "x#C", "x#D", "x#E"]}
+        self.index = OntologyIndex(self)
+
+
+class SelectAll:
+    """
+    Selects every candidate class and records the levels of its calls.
+    """
+
+    def __init__(self):
+        self.levels = []
+
+    def decision_making(self, table_name, table_in_markdown, column_name, classes):
+        self.levels.append(current_context().get("level"))
+        return ", ".join(classes)
+
+    def batch_decision_making(self, table_name, table_in_markdown, column_names, classes):
+        self.levels.append(current_context().get("level"))
+        return {column_name: ", ".join(classes) for column_name in column_names}
+
+
+PATHS = [["x#A", "x#C", "x#D"], ["x#A", "x#C", "x#E"], ["x#B", "x#C", "x#D"], ["x#B", "x#C", "x#E"]]
+
+
+class SearchTest(unittest.TestCase):
+
+    def test_bfs_search_memoizes_shared_parents(self):
+        decision_maker = SelectAll()
+        trace = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = bfs_search("t", "m", "c", DiamondDAG(), decision_maker, 5, trace=trace)
+        self.assertEqual(paths, PATHS)
+        # Thing, A, B and C once: the second visit of C reuses its decision
+        self.assertEqual(len(decision_maker.levels), 4)
+        self.assertEqual(trace["saved_calls"], 1)
+
+    def test_batch_bfs_search_matches_bfs_search(self):
+        decision_maker = SelectAll()
+        traces = [{}, {}]
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = batch_bfs_search("t", "m", ["c", "e"], DiamondDAG(), decision_maker, 5, traces=traces)
+        self.assertEqual(paths, [PATHS, PATHS])
+        # One call per parent for both columns, recorded with the level of the parent
+        self.assertEqual(decision_maker.levels, [0, 1, 1, 2])
+
+    def test_max_depth(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(bfs_search("t", "m", "c", DiamondDAG(), SelectAll(), 1), [["x#A"], ["x#B"]])
+            self.assertEqual(batch_bfs_search("t", "m", ["c"], DiamondDAG(), SelectAll(), 1), [[["x#A"], ["x#B"]]])
+
+
+if __name__ == "__main__":
+    unittest.main()
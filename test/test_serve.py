@@ -0,0 +1,117 @@
+"""
+The micro-batching of the annotation service and its validation of the requests.
+"""
+import io
+import os.path as osp
+import sys
+import time
+import unittest
+import contextlib
+
+import pandas as pd
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.onto import OntologyIndex
+from saed.serve import AnnotationService
+from saed.utils import CallMetrics
+
+
+class Node:
+
+    def __init__(self, url):
+        self.url = url
+        self.name = url.split("#")[1]
+
+
+class SmallDAG:
+    """
+    Thing -> A, B; A -> C.
+    """
+
+    def __init__(self):
+        self.root = "x#Thing"
+        self.edges = {"x#Thing": ["x#A", "x#B"], "x#A": ["x#C"]}
+        self.nodes = {url: Node(url) for url in ["x#Thing", "x#A", "x#B", "x#C"]}
+        self.index = OntologyIndex(self)
+
+
+class SelectByName:
+    """
+    Selects the classes named like the upper-cased column, after a short latency.
+    """
+
+    def __init__(self):
+        self.metrics = CallMetrics()
+        self.closed = False
+
+    def decision_making(self, table_name, table_in_markdown, column_name, classes):
+        time.sleep(0.005)
+        return ", ".join(c for c in classes if c == column_name.upper()) or "-"
+
+    def close(self):
+        self.closed = True
+
+
+TABLE = pd.DataFrame({"a": [1, 2], "b": [3, 4], "c": [5, 6], "z": [7, 8]})
+
+
+class AnnotationServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.decision_maker = SelectByName()
+
+    def make_service(self, **kwargs):
+        return AnnotationService(SmallDAG(), self.decision_maker, 5, **kwargs)
+
+    def annotate(self, service, requests):
+        with contextlib.redirect_stdout(io.StringIO()):
+            submitted = [service.submit(TABLE, "table", column_names, table_id) for table_id, column_names in requests]
+            for request in submitted:
+                self.assertTrue(request.done.wait(10))
+        return submitted
+
+    def test_concurrent_requests_share_a_batch(self):
+        service = self.make_service(batch_window_s=0.2)
+        first, second = self.annotate(service, [("1.csv", ["a", "z"]), ("2.csv", ["b"])])
+        self.assertEqual(first.predictions(), [
+            {"table_id": "1.csv", "table_name": "table", "column_name": "a", "column_id": 0, "paths": [["x#A"]]},
+            {"table_id": "1.csv", "table_name": "table", "column_name": "z", "column_id": 3, "paths": [[]]},
+        ])
+        self.assertEqual(second.predictions()[0]["paths"], [["x#B"]])
+        # The batches are counted once they are done, closing waits for them
+        service.close()
+        self.assertTrue(self.decision_maker.closed)
+        stats = service.stats()
+        self.assertEqual((stats["requests"], stats["columns"], stats["batches"], stats["errors"]), (2, 3, 1, 0))
+        self.assertEqual(stats["mean_batch_columns"], 3.0)
+        self.assertEqual((stats["queue_depth"], stats["in_flight_columns"]), (0, 0))
+
+    def test_requests_split_over_batches(self):
+        service = self.make_service(batch_window_s=0.2, max_batch_columns=2)
+        request, = self.annotate(service, [("1.csv", None)])
+        self.assertEqual([prediction["paths"] for prediction in request.predictions()], [[["x#A"]], [["x#B"]], [[]], [[]]])
+        service.close()
+        self.assertEqual(service.stats()["batches"], 2)
+
+    def test_bad_requests_are_rejected(self):
+        service = self.make_service(batch_window_s=0.0)
+        with self.assertRaises(ValueError):
+            service.submit(TABLE, "table", ["a", "a"])
+        with self.assertRaises(KeyError):
+            service.submit(TABLE, "table", ["a", "missing"])
+        with self.assertRaises(ValueError):
+            service.submit(pd.DataFrame([[1, 2]], columns=["a", "a"]), "table")
+        self.assertEqual(service.stats()["requests"], 0)
+        # The service keeps serving the valid requests
+        request, = self.annotate(service, [("1.csv", ["b"])])
+        self.assertEqual(request.predictions()[0]["paths"], [["x#B"]])
+        service.close()
+        with self.assertRaises(RuntimeError):
+            service.submit(TABLE, "table", ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
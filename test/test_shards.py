@@ -0,0 +1,85 @@
+"""
+The partition of the tables into shards and the merge of their predictions.
+"""
+import os
+import os.path as osp
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+here = osp.dirname(osp.abspath(__file__))
+root_path = osp.abspath(osp.join(here, ".."))
+sys.path.insert(0, osp.join(root_path, "src"))
+
+from saed.data.shards import shard_of, shard_dirs, find_shard_dirs, merge_predictions
+
+
+def prediction(table_id, column_id, *paths):
+    return {"table_id": table_id, "column_id": column_id, "paths": [list(path) for path in paths]}
+
+
+class MergePredictionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dirs = shard_dirs(self.tmp_dir, 3)
+        self.output_dir = osp.join(self.tmp_dir, "merged")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_shard(self, shard_index, predictions, jsonl=True):
+        os.makedirs(self.dirs[shard_index], exist_ok=True)
+        if jsonl:
+            with open(osp.join(self.dirs[shard_index], "predictions.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(p) + "\n" for p in predictions)
+        else:
+            with open(osp.join(self.dirs[shard_index], "predictions.json"), "w", encoding="utf-8") as f:
+                json.dump(predictions, f)
+
+    def merged(self):
+        with open(osp.join(self.output_dir, "predictions.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_merge_in_the_given_order(self):
+        self.write_shard(0, [prediction("b.csv", 0, ["A"]), prediction("a.csv", 1)])
+        self.write_shard(1, [prediction("a.csv", 0, ["B", "C"])], jsonl=False)
+        order = [("a.csv", 0), ("a.csv", 1), ("b.csv", 0)]
+        report = merge_predictions(self.dirs, self.output_dir, order=order)
+        self.assertEqual([(p["table_id"], p["column_id"]) for p in self.merged()], order)
+        self.assertEqual(report, {"predictions": 3, "shards": {"shard-000-of-003": 2, "shard-001-of-003": 1},
+                                  "empty_shards": ["shard-002-of-003"], "missing": [], "duplicates": [], "unexpected": []})
+        self.assertEqual(find_shard_dirs(self.tmp_dir), self.dirs[:2])
+
+    def test_missing_and_unexpected_columns(self):
+        self.write_shard(0, [prediction("a.csv", 0, ["A"]), prediction("c.csv", 0)])
+        report = merge_predictions(self.dirs, self.output_dir, order=[("a.csv", 0), ("b.csv", 0)])
+        self.assertEqual(report["missing"], [["b.csv", 0]])
+        self.assertEqual(report["unexpected"], [["c.csv", 0]])
+        self.assertEqual(self.merged(), [prediction("a.csv", 0, ["A"])])
+
+    def test_duplicates_keep_the_first_prediction(self):
+        self.write_shard(0, [prediction("a.csv", 0, ["A"]), prediction("a.csv", 1, ["B"])])
+        self.write_shard(2, [prediction("a.csv", 0, ["A"]), prediction("a.csv", 1, ["C"])])
+        report = merge_predictions(self.dirs, self.output_dir)
+        self.assertEqual(report["duplicates"], [
+            {"table_id": "a.csv", "column_id": 0, "shards": ["shard-000-of-003", "shard-002-of-003"], "conflicting": False},
+            {"table_id": "a.csv", "column_id": 1, "shards": ["shard-000-of-003", "shard-002-of-003"], "conflicting": True},
+        ])
+        self.assertEqual(self.merged(), [prediction("a.csv", 0, ["A"]), prediction("a.csv", 1, ["B"])])
+
+
+class ShardOfTest(unittest.TestCase):
+
+    def test_tables_are_spread_over_the_shards(self):
+        table_ids = [f"table{i}.csv" for i in range(300)]
+        shards = [shard_of(table_id, 3) for table_id in table_ids]
+        self.assertEqual(shards, [shard_of(table_id, 3) for table_id in table_ids])
+        for shard_index in range(3):
+            self.assertGreater(shards.count(shard_index), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()